@@ -0,0 +1,134 @@
+""" Compares the default HTTP/1.1 transport with the HTTP/2 transport against a local HTTPS test server that
+speaks HTTP/2: number of TCP connections opened and requests per second for many concurrent get_record calls.
+
+Requires: `httpx[http2]`, `hypercorn`, `trustme`
+
+Usage:
+    python -m benchmarks.http2_transport [--requests 2000] [--threads 64] [--latency-ms 5]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import ssl
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from osdu.client import SimpleOsduClient
+from osdu.transport import Http2Session
+
+
+class TestServer:
+    """HTTPS server on localhost, run by hypercorn in a background thread, that answers every request with a small
+    record after a fixed latency and records the client address of each connection.
+    """
+
+    def __init__(self, latency: float):
+        import trustme
+
+        self.latency = latency
+        self.connections = set()
+        self._tempdir = tempfile.TemporaryDirectory()
+        ca = trustme.CA()
+        self._certfile = os.path.join(self._tempdir.name, 'server.pem')
+        ca.issue_cert('127.0.0.1', 'localhost').private_key_and_cert_chain_pem.write_to_path(self._certfile)
+        self.ssl_context = ssl.create_default_context()
+        ca.configure_trust(self.ssl_context)
+        self.ca_file = os.path.join(self._tempdir.name, 'ca.pem')
+        ca.cert_pem.write_to_path(self.ca_file)
+
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            self.port = s.getsockname()[1]
+        self._loop = None
+        self._stopped = None
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f'https://127.0.0.1:{self.port}'
+
+    def __enter__(self):
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def __exit__(self, *args):
+        self._loop.call_soon_threadsafe(self._stopped.set)
+        self._thread.join()
+        self._tempdir.cleanup()
+
+    async def _app(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                else:
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        self.connections.add(tuple(scope['client']))
+        await asyncio.sleep(self.latency)
+        body = json.dumps({'id': scope['path'].rsplit('/', 1)[-1], 'data': {}}).encode()
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    def _run(self):
+        from hypercorn.asyncio import serve
+        from hypercorn.config import Config
+
+        config = Config()
+        config.bind = [f'127.0.0.1:{self.port}']
+        config.certfile = config.keyfile = self._certfile
+        config.accesslog = None
+        config.errorlog = None
+        # Keep connections open for the whole run, rather than sending GOAWAY after 1000 requests.
+        config.keep_alive_max_requests = 10 ** 9
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._stopped = asyncio.Event()
+        self._loop.call_later(0.5, self._started.set)
+        self._loop.run_until_complete(serve(self._app, config, shutdown_trigger=self._stopped.wait))
+
+
+def run(client, requests: int, threads: int) -> float:
+    """Fetches `requests` records from `threads` threads. Returns the elapsed seconds."""
+    record_ids = [f'opendes:doc:{n}' for n in range(requests)]
+    started = perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(client.storage.get_record, record_ids))
+    return perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='Server latency of each request.')
+    args = parser.parse_args(argv)
+
+    with TestServer(args.latency_ms / 1000) as server:
+        http1 = SimpleOsduClient('opendes', 'token', api_url=server.url)
+        http1.session.verify = server.ca_file
+        http1.session.trust_env = False  # Don't let REQUESTS_CA_BUNDLE override the test CA.
+        http2 = SimpleOsduClient('opendes', 'token', api_url=server.url)
+        http2.session = Http2Session(verify=server.ssl_context)
+
+        print(f'{args.requests} get_record calls from {args.threads} threads, '
+              f'{args.latency_ms:g} ms server latency\n')
+        print(f'{"transport":<10}{"connections":>12}{"seconds":>10}{"requests/s":>12}')
+        for name, client in (('http1', http1), ('http2', http2)):
+            run(client, args.threads, args.threads)  # Warm up the connection pool.
+            server.connections.clear()
+            elapsed = run(client, args.requests, args.threads)
+            print(f'{name:<10}{len(server.connections):>12}{elapsed:>10.2f}{args.requests / elapsed:>12.0f}')
+            client.session.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+""" Measures the cost of `import osdu.client` using `python -X importtime`.
+
+Exits with a non-zero status if the import pulls in any of the modules that must be deferred to first use (the
+AWS SDK, multiprocessing, sqlite3 and the optional services) or if the median cumulative import time exceeds the
+given budget, so it can be used as a startup regression check in CI.
+
+Usage:
+    python benchmarks/import_time.py [--module osdu.client] [--runs 5] [--max-ms 250]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+# Modules, and their submodules, that must only be imported on first use of the features that need them.
+DEFERRED_MODULES = (
+    'boto3', 'botocore',        # AWS clients
+    'multiprocessing',          # SearchService.map_pages
+    'sqlite3',                  # Checkpoints and content hash indexes
+    'osdu.checkpoint', 'osdu.hash_index', 'osdu.services.legal', 'osdu.services.schema',
+)
+
+
+def is_deferred(name: str) -> bool:
+    return any(name == module or name.startswith(module + '.') for module in DEFERRED_MODULES)
+
+
+def measure_import(module: str) -> dict:
+    """Imports `module` in a fresh interpreter and returns {module_name: cumulative_microseconds}."""
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    timings = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        timings[name.strip()] = int(cumulative)
+    return timings
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='osdu.client')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-ms', type=float, default=250.0,
+                        help='Fail if the median cumulative import time exceeds this many milliseconds.')
+    args = parser.parse_args(argv)
+
+    samples = []
+    for _ in range(args.runs):
+        timings = measure_import(args.module)
+        deferred = sorted(name for name in timings if is_deferred(name))
+        if deferred:
+            print(f'FAIL: importing {args.module} also imported: {", ".join(deferred)}')
+            return 1
+        samples.append(timings[args.module] / 1000)
+
+    median_ms = statistics.median(samples)
+    print(f'{args.module}: median {median_ms:.1f} ms over {args.runs} runs (budget {args.max_ms:.1f} ms)')
+    if median_ms > args.max_ms:
+        print('FAIL: import time budget exceeded')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
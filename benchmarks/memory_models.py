@@ -0,0 +1,67 @@
+""" Compares the memory held by a page of records as plain dicts versus `osdu.models.Record` objects.
+
+Usage:
+    python -m benchmarks.memory_models [--records 1000]
+"""
+import argparse
+import json
+import sys
+import tracemalloc
+
+from osdu.models import Record
+
+
+def make_record(i: int) -> dict:
+    return {
+        'id': f'opendes:master-data--Wellbore:{i}',
+        'kind': 'osdu:wks:master-data--Wellbore:1.0.0',
+        'version': 1600000000000000 + i,
+        'acl': {'viewers': ['data.default.viewers@opendes.example.com'],
+                'owners': ['data.default.owners@opendes.example.com']},
+        'legal': {'legaltags': ['opendes-public-usa-dataset-1'], 'otherRelevantDataCountries': ['US'],
+                  'status': 'compliant'},
+        'createTime': '2021-01-01T00:00:00.000Z',
+        'createUser': 'user@example.com',
+        'data': {
+            'FacilityName': f'Wellbore {i}',
+            'WellID': f'opendes:master-data--Well:{i}:',
+            'NameAliases': [{'AliasName': f'WB-{i}-{n}', 'AliasNameTypeID': 'opendes:reference-data--AliasNameType:UWBI:'}
+                            for n in range(5)],
+            'VerticalMeasurements': [{'VerticalMeasurementID': str(n), 'VerticalMeasurement': n * 10.5,
+                                      'VerticalMeasurementPathID': 'opendes:reference-data--VerticalMeasurementPath:MD:'}
+                                     for n in range(5)],
+            'SpatialLocation': {'Wgs84Coordinates': {'type': 'FeatureCollection', 'features': [
+                {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [-95.0 + i / 1000, 29.0]}}]}},
+        },
+    }
+
+
+def measure(build) -> int:
+    """Returns the number of bytes still allocated by the object returned from `build`."""
+    tracemalloc.start()
+    obj = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del obj
+    return current
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    # Simulate a response body, as the services parse records from response.json().
+    payload = json.dumps({'records': [make_record(i) for i in range(args.records)]})
+
+    dict_bytes = measure(lambda: json.loads(payload)['records'])
+    typed_bytes = measure(lambda: [Record.from_dict(r) for r in json.loads(payload)['records']])
+
+    print(f'{args.records} records as dicts:          {dict_bytes / 1024:10.1f} KiB')
+    print(f'{args.records} records as models.Record:  {typed_bytes / 1024:10.1f} KiB '
+          f'({typed_bytes / dict_bytes:.0%} of dicts)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
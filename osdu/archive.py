@@ -0,0 +1,305 @@
+""" Compact, append-only archive of records with an index for random access by id and sequential scans by kind.
+
+An archive is a directory holding:
+    - segment-000000.zrec, ...: append-only segment files. Each record is one frame: a 4-byte big-endian length
+      followed by the zlib-compressed compact JSON of the record, so any record can be read on its own.
+    - index.db: SQLite index of record id -> (segment, offset, length), and kind -> ranges of consecutive frames.
+
+Usage:
+    from osdu.archive import RecordArchive
+
+    with RecordArchive('wells.archive') as archive:
+        archive.export(osdu_client, {'kind': 'osdu:wks:master-data--Well:1.0.0'}, hydrate=True)
+        well = archive.get('opendes:master-data--Well:1234')
+        for record in archive.scan(kind='osdu:wks:master-data--Well:1.0.0'):
+            # Do stuff with each record...
+        archive.reload(other_client)
+"""
+import json
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import zlib
+from typing import List
+
+from .migration import WRITABLE_FIELDS
+from .models import Record
+from .pipeline import search_and_hydrate
+from .services.search import MAX_QUERY_LIMIT
+from .services.storage import MAX_STORE_RECORDS
+from .utils import chunked, ordered_map
+
+SEGMENT_MAGIC = b'OSDUARC1'
+# Segments are closed for appending once they reach this size.
+DEFAULT_SEGMENT_SIZE = 256 * 1024 * 1024
+_FRAME_HEADER = struct.Struct('>I')
+# Number of records written per index transaction.
+_APPEND_BATCH_SIZE = 1000
+
+
+class RecordArchive:
+    """Directory of compressed, append-only record segments with a SQLite sidecar index. Appending a record whose
+    id is already in the archive supersedes the previous copy. Reads use memory-mapped segments. Safe to use from
+    multiple threads.
+    """
+
+    def __init__(self, path: str, segment_size: int = DEFAULT_SEGMENT_SIZE, compression_level: int = 6):
+        """
+        :param path:                Directory of the archive. Created if it does not exist.
+        :param segment_size:        Size in bytes after which a new segment is started.
+        :param compression_level:   zlib compression level of each record, from 1 (fastest) to 9 (smallest).
+        """
+        os.makedirs(path, exist_ok=True)
+        self._path = path
+        self._segment_size = segment_size
+        self._compression_level = compression_level
+        self._lock = threading.RLock()
+        self._maps = {}
+        self._writer = None
+        self._db = sqlite3.connect(os.path.join(path, 'index.db'), check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS records '
+                         '(id TEXT PRIMARY KEY, kind TEXT, segment INTEGER, offset INTEGER, length INTEGER)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS kind_ranges '
+                         '(kind TEXT, segment INTEGER, start INTEGER, end INTEGER, PRIMARY KEY (segment, start))')
+        self._db.execute('CREATE INDEX IF NOT EXISTS kind_ranges_kind ON kind_ranges (kind)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)')
+        self._db.commit()
+        self._recover()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def append(self, records) -> int:
+        """Appends records from any iterable of dicts and/or `osdu.models.Record` objects. Each batch of records is
+        written to the segment before it is added to the index, so the index never points at missing data.
+
+        :returns:   number of records appended.
+        """
+        count = 0
+        for batch in chunked(records, _APPEND_BATCH_SIZE):
+            with self._lock:
+                count += self._append_batch(batch)
+        return count
+
+    def get(self, record_id: str) -> dict:
+        """Returns the latest archived copy of a record, or None. Reads a single frame."""
+        with self._lock:
+            row = self._db.execute('SELECT segment, offset, length FROM records WHERE id = ?', (record_id,)).fetchone()
+            if row is None:
+                return None
+            return self._read_frame(*row)
+
+    def get_many(self, record_ids: List[str]) -> List[dict]:
+        """Returns the archived records with the given ids, skipping ids that are not in the archive."""
+        return [record for record in map(self.get, record_ids) if record is not None]
+
+    def scan(self, kind: str = None):
+        """Yields the latest copy of each archived record, in the order they were appended, reading the segments
+        sequentially.
+
+        :param kind:    Only yield records of this kind, by reading only the ranges of frames holding that kind.
+        """
+        with self._lock:
+            if kind is None:
+                # Only the indexed part of each segment, so frames being appended by another thread are not read.
+                ranges = self._db.execute('SELECT segment, NULL, MAX(end) FROM kind_ranges GROUP BY segment '
+                                          'ORDER BY segment').fetchall()
+            else:
+                ranges = self._db.execute('SELECT segment, start, end FROM kind_ranges WHERE kind = ? '
+                                          'ORDER BY segment, start', (kind,)).fetchall()
+            check_latest = self._meta('superseded') > 0
+
+        for segment, start, end in ranges:
+            for offset, record in self._read_frames(segment, start, end):
+                if kind is not None and record.get('kind') != kind:
+                    continue
+                if check_latest and not self._is_latest(record.get('id'), segment, offset):
+                    continue
+                yield record
+
+    def ids(self, kind: str = None) -> List[str]:
+        with self._lock:
+            if kind is None:
+                rows = self._db.execute('SELECT id FROM records ORDER BY segment, offset')
+            else:
+                rows = self._db.execute('SELECT id FROM records WHERE kind = ? ORDER BY segment, offset', (kind,))
+            return [row[0] for row in rows]
+
+    def kinds(self) -> dict:
+        """Returns {kind: number of records}."""
+        with self._lock:
+            return dict(self._db.execute('SELECT kind, COUNT(*) FROM records GROUP BY kind ORDER BY kind'))
+
+    def export(self, client, query: dict, hydrate: bool = False, max_workers: int = 4) -> int:
+        """Appends the results of a search to the archive. Returns the number of records appended.
+
+        :param hydrate: If True, archive full records fetched from the storage service with search_and_hydrate.
+                        Otherwise archive the search results.
+        """
+        if hydrate:
+            records = search_and_hydrate(client, query, max_workers=max_workers)
+        else:
+            page_query = {k: v for k, v in query.items() if k != 'cursor'}
+            page_query['limit'] = MAX_QUERY_LIMIT
+            records = (record for page, _ in client.search.query_with_paging(page_query) for record in page)
+        return self.append(records)
+
+    def reload(self, client, kind: str = None, batch_size: int = MAX_STORE_RECORDS, max_workers: int = 1) -> int:
+        """Streams archived records into `client.storage.store_records`, without loading the archive into memory.
+        Members set by the platform (version, createTime, ...) are dropped.
+
+        :param kind:        Only reload records of this kind.
+        :param max_workers: Number of concurrent store_records calls.
+        :returns:           total recordCount reported by the storage service.
+        """
+        records = ({k: v for k, v in record.items() if k in WRITABLE_FIELDS} for record in self.scan(kind))
+        responses = ordered_map(client.storage.store_records, chunked(records, batch_size), max_workers=max_workers)
+        return sum(response.get('recordCount', 0) for response in responses)
+
+    def close(self):
+        with self._lock:
+            if self._writer is not None:
+                self._writer[1].close()
+                self._writer = None
+            for mapped in self._maps.values():
+                mapped.close()
+            self._maps.clear()
+            self._db.close()
+
+    def __contains__(self, record_id: str) -> bool:
+        with self._lock:
+            return self._db.execute('SELECT 1 FROM records WHERE id = ?', (record_id,)).fetchone() is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+
+    def __iter__(self):
+        return self.scan()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _append_batch(self, records: list) -> int:
+        rows = []
+        for record in records:
+            if isinstance(record, Record):
+                record = record.to_dict()
+            data = zlib.compress(json.dumps(record, separators=(',', ':')).encode('utf-8'), self._compression_level)
+            segment, f = self._open_writer()
+            offset = f.tell()
+            f.write(_FRAME_HEADER.pack(len(data)))
+            f.write(data)
+            rows.append((record['id'], record.get('kind'), segment, offset, len(data)))
+            if f.tell() >= self._segment_size:
+                f.close()
+                self._writer = None
+        if self._writer is not None:
+            self._writer[1].flush()
+
+        ids = [row[0] for row in rows]
+        superseded = sum(1 for row in self._db.execute(
+            f'SELECT id FROM records WHERE id IN ({",".join("?" * len(ids))})', ids)) if ids else 0
+        # Duplicates within the batch also supersede each other.
+        superseded += len(ids) - len(set(ids))
+        self._db.executemany('INSERT OR REPLACE INTO records (id, kind, segment, offset, length) VALUES (?, ?, ?, ?, ?)',
+                             rows)
+        self._add_kind_ranges(rows)
+        if superseded:
+            self._db.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                             ('superseded', self._meta('superseded') + superseded))
+        self._db.commit()
+        return len(rows)
+
+    def _add_kind_ranges(self, rows: list):
+        last = self._db.execute('SELECT kind, segment, start, end FROM kind_ranges '
+                                'ORDER BY segment DESC, start DESC LIMIT 1').fetchone()
+        for _, kind, segment, offset, length in rows:
+            end = offset + _FRAME_HEADER.size + length
+            if last is not None and last[0] == kind and last[1] == segment and last[3] == offset:
+                last = (kind, segment, last[2], end)
+            else:
+                last = (kind, segment, offset, end)
+            self._db.execute('INSERT OR REPLACE INTO kind_ranges (kind, segment, start, end) VALUES (?, ?, ?, ?)', last)
+
+    def _recover(self):
+        """Truncates each segment after its last indexed frame. This drops frames left by an append that was
+        interrupted before its batch was indexed, e.g. a torn write after a crash, so later appends are not written
+        behind them.
+        """
+        ends = dict(self._db.execute('SELECT segment, MAX(end) FROM kind_ranges GROUP BY segment'))
+        for segment in self._segments():
+            end = ends.get(segment, len(SEGMENT_MAGIC))
+            path = self._segment_path(segment)
+            if os.path.getsize(path) != end:
+                with open(path, 'r+b') as f:
+                    if segment not in ends:
+                        f.write(SEGMENT_MAGIC)
+                    f.truncate(end)
+
+    def _open_writer(self):
+        if self._writer is None:
+            segments = self._segments()
+            segment = segments[-1] if segments else 0
+            path = self._segment_path(segment)
+            if os.path.exists(path) and os.path.getsize(path) >= self._segment_size:
+                segment += 1
+                path = self._segment_path(segment)
+            f = open(path, 'ab')
+            if f.tell() == 0:
+                f.write(SEGMENT_MAGIC)
+            self._writer = (segment, f)
+        return self._writer
+
+    def _segments(self) -> List[int]:
+        return sorted(int(name[len('segment-'):-len('.zrec')]) for name in os.listdir(self._path)
+                      if name.startswith('segment-') and name.endswith('.zrec'))
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self._path, f'segment-{segment:06d}.zrec')
+
+    def _map(self, segment: int, end: int):
+        """Returns a memory map of the segment covering at least `end` bytes, remapping it if it has grown."""
+        with self._lock:
+            mapped = self._maps.get(segment)
+            if mapped is not None and len(mapped) >= end:
+                return mapped
+            # A previous, shorter map may still be used by a scan, so it is left to be closed when released.
+            with open(self._segment_path(segment), 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = mapped
+            return mapped
+
+    def _read_frame(self, segment: int, offset: int, length: int) -> dict:
+        start = offset + _FRAME_HEADER.size
+        mapped = self._map(segment, start + length)
+        return json.loads(zlib.decompress(mapped[start:start + length]).decode('utf-8'))
+
+    def _read_frames(self, segment: int, start: int, end: int):
+        """Yields (offset, record) for the frames of a segment between two indexed offsets. A `start` of None is the
+        first frame.
+        """
+        offset = len(SEGMENT_MAGIC) if start is None else start
+        if end <= offset:
+            return
+        mapped = self._map(segment, end)
+        while offset < end:
+            length, = _FRAME_HEADER.unpack_from(mapped, offset)
+            data_start = offset + _FRAME_HEADER.size
+            yield offset, json.loads(zlib.decompress(mapped[data_start:data_start + length]).decode('utf-8'))
+            offset = data_start + length
+
+    def _is_latest(self, record_id: str, segment: int, offset: int) -> bool:
+        with self._lock:
+            row = self._db.execute('SELECT segment, offset FROM records WHERE id = ?', (record_id,)).fetchone()
+        return row is not None and row[0] == segment and row[1] == offset
+
+    def _meta(self, key: str) -> int:
+        row = self._db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else 0
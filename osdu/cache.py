@@ -0,0 +1,239 @@
+""" Opt-in cache for search responses, keyed by a normalized fingerprint of the query body.
+
+Usage:
+    from osdu.cache import SearchCache
+
+    osdu_client.search.cache = SearchCache(ttl=60, max_bytes=64 * 1024 * 1024)
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from time import time
+
+
+def fingerprint(query: dict, data_partition_id: str, endpoint: str = 'query') -> str:
+    """Returns a stable fingerprint for a search request. Queries that differ only in key order or in
+    surrounding whitespace of the Lucene query string produce the same fingerprint.
+    """
+    normalized = {k: v for k, v in query.items() if k != 'cursor'}
+    if isinstance(normalized.get('query'), str):
+        normalized['query'] = normalized['query'].strip()
+    body = json.dumps([endpoint, data_partition_id, normalized], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
+class _Entry:
+    __slots__ = ('expires', 'size', 'disk_size', 'value', 'path')
+
+    def __init__(self, expires, size, value=None, path=None, disk_size=0):
+        self.expires = expires
+        self.size = size
+        self.disk_size = disk_size
+        self.value = value
+        self.path = path
+
+
+class SearchCache:
+    """Thread-safe LRU cache of search responses with a TTL, a memory limit and a disk limit.
+
+    Single query responses are held in memory as the raw response body. Completed query_with_paging result
+    sets are held as one serialized line per page, and are written to a file in `spill_dir` instead of being
+    held in memory when they are larger than `spill_threshold` bytes.
+    """
+
+    def __init__(self, ttl: float = 60.0, max_bytes: int = 64 * 1024 * 1024, spill_threshold: int = 8 * 1024 * 1024,
+                 spill_dir: str = None, max_disk_bytes: int = 1024 * 1024 * 1024):
+        """
+        :param ttl:             Seconds after which a cached response expires.
+        :param max_bytes:       Maximum total size of the responses held in memory. Least recently used entries
+                                are evicted to stay under this limit.
+        :param spill_threshold: Paged result sets larger than this many bytes are spilled to disk.
+        :param spill_dir:       Directory for spilled result sets. Defaults to a new temporary directory, which is
+                                removed by close() or when the cache is garbage collected.
+        :param max_disk_bytes:  Maximum total size of the spilled result sets. Least recently used spilled entries
+                                are evicted to stay under this limit.
+        """
+        self._ttl = ttl
+        self._max_bytes = max_bytes
+        self._max_disk_bytes = max_disk_bytes
+        self._spill_threshold = spill_threshold
+        self._spill_dir = spill_dir
+        self._remove_spill_dir = None
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'spills': 0}
+
+    @property
+    def stats(self) -> dict:
+        """Cache metrics: hits, misses, evictions, spills (spilled result sets cached), entries, bytes held in
+        memory and disk_bytes of spilled result sets.
+        """
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), bytes=self._bytes, disk_bytes=self._disk_bytes)
+
+    fingerprint = staticmethod(fingerprint)
+
+    def get(self, key: str):
+        """Returns the cached response body for the given fingerprint, or None."""
+        entry = self._lookup(key)
+        return entry.value if entry else None
+
+    def put(self, key: str, content: bytes):
+        """Caches a response body under the given fingerprint."""
+        self._store(key, _Entry(time() + self._ttl, len(content), value=content))
+
+    def get_pages(self, key: str):
+        """Returns an iterator over the cached pages (dicts with 'results' and 'totalCount') of a completed
+        query_with_paging result set, or None.
+        """
+        entry = self._lookup(key)
+        if entry is None:
+            return None
+        if entry.path is None:
+            return (json.loads(line) for line in entry.value)
+        try:
+            # Open before returning, so that a later eviction cannot remove the file from under the reader.
+            _file = open(entry.path, 'r', encoding='utf-8')
+        except FileNotFoundError:
+            return None
+        return self._read_spilled(_file)
+
+    def page_writer(self, key: str) -> '_PageWriter':
+        """Returns a writer that collects the pages of a query_with_paging result set as they are fetched.
+        Pages are serialized as they are appended and switch to a file in `spill_dir` once their total size
+        exceeds `spill_threshold`. The result set is only cached when the writer is committed.
+        """
+        return _PageWriter(self, key)
+
+    def put_pages(self, key: str, pages: list):
+        """Caches the pages of a completed query_with_paging result set."""
+        writer = self.page_writer(key)
+        for page in pages:
+            writer.append(page)
+        writer.commit()
+
+    def clear(self):
+        with self._lock:
+            for entry in self._entries.values():
+                self._discard(entry)
+            self._entries.clear()
+            self._bytes = 0
+            self._disk_bytes = 0
+
+    def close(self):
+        """Clears the cache, and removes the spill directory if the cache created it."""
+        self.clear()
+        with self._lock:
+            if self._remove_spill_dir is not None:
+                self._remove_spill_dir()
+                self._remove_spill_dir = None
+                self._spill_dir = None
+
+    def _spill_file(self, key):
+        with self._lock:
+            if self._spill_dir is None:
+                self._spill_dir = tempfile.mkdtemp(prefix='osdu-search-cache-')
+                self._remove_spill_dir = weakref.finalize(self, shutil.rmtree, self._spill_dir, ignore_errors=True)
+            spill_dir = self._spill_dir
+        fd, path = tempfile.mkstemp(suffix='.jsonl', prefix=f'{key[:16]}-', dir=spill_dir)
+        return open(fd, 'w', encoding='utf-8'), path
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires < time():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry
+
+    def _store(self, key, entry):
+        if entry.size > self._max_bytes or entry.disk_size > self._max_disk_bytes:
+            self._discard(entry)
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            self._disk_bytes += entry.disk_size
+            if entry.path is not None:
+                self._stats['spills'] += 1
+            while self._bytes > self._max_bytes:
+                self._evict_oldest(spilled=False)
+            while self._disk_bytes > self._max_disk_bytes:
+                self._evict_oldest(spilled=True)
+
+    def _evict_oldest(self, spilled: bool):
+        oldest = next(key for key, entry in self._entries.items() if (entry.path is not None) == spilled)
+        self._remove(oldest)
+        self._stats['evictions'] += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        self._disk_bytes -= entry.disk_size
+        self._discard(entry)
+
+    @staticmethod
+    def _discard(entry):
+        if entry.path is not None:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _read_spilled(_file):
+        with _file:
+            for line in _file:
+                yield json.loads(line)
+
+
+class _PageWriter:
+
+    def __init__(self, cache: SearchCache, key: str):
+        self._cache = cache
+        self._key = key
+        self._lines = []
+        self._size = 0
+        self._file = None
+        self._path = None
+
+    def append(self, page: dict):
+        line = json.dumps(page, separators=(',', ':'))
+        if self._file is not None:
+            self._file.write(line + '\n')
+            return
+        self._lines.append(line)
+        self._size += len(line)
+        if self._size > self._cache._spill_threshold:
+            self._file, self._path = self._cache._spill_file(self._key)
+            for line in self._lines:
+                self._file.write(line + '\n')
+            self._lines = None
+
+    def commit(self):
+        if self._file is None:
+            entry = _Entry(time() + self._cache._ttl, self._size, value=self._lines)
+        else:
+            self._file.close()
+            # Spilled entries count towards the disk limit instead of the memory limit.
+            entry = _Entry(time() + self._cache._ttl, 0, path=self._path, disk_size=os.path.getsize(self._path))
+        self._cache._store(self._key, entry)
+
+    def discard(self):
+        if self._file is not None:
+            self._file.close()
+            SearchCache._discard(_Entry(0, 0, path=self._path))
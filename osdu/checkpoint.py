@@ -0,0 +1,70 @@
+""" Persistent progress tracking for resumable bulk operations.
+"""
+import sqlite3
+import threading
+
+
+class Checkpoint:
+    """SQLite file recording the outcome of each item processed by a bulk operation, so that an interrupted run
+    can be resumed by skipping the items that already succeeded. Safe to use from multiple threads.
+    """
+
+    def __init__(self, path: str, commit_every: int = 100):
+        """
+        :param path:            Path of the SQLite file. Created if it does not exist.
+        :param commit_every:    Number of outcomes to buffer before committing them to disk.
+        """
+        self._path = path
+        self._commit_every = commit_every
+        self._uncommitted = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS outcomes (id TEXT PRIMARY KEY, ok INTEGER NOT NULL, error TEXT)')
+        self._db.commit()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def succeeded(self, item_id: str) -> bool:
+        """Returns True if the item was already processed successfully."""
+        with self._lock:
+            row = self._db.execute('SELECT ok FROM outcomes WHERE id = ?', (item_id,)).fetchone()
+        return bool(row and row[0])
+
+    def record(self, item_id: str, ok: bool, error: str = None):
+        """Records the outcome for an item, replacing any previous outcome."""
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO outcomes (id, ok, error) VALUES (?, ?, ?)',
+                             (item_id, int(ok), error))
+            self._uncommitted += 1
+            if self._uncommitted >= self._commit_every:
+                self._db.commit()
+                self._uncommitted = 0
+
+    def failures(self) -> dict:
+        """Returns {item id: error} for all items whose last outcome was a failure."""
+        with self._lock:
+            return dict(self._db.execute('SELECT id, error FROM outcomes WHERE ok = 0'))
+
+    def counts(self) -> dict:
+        """Returns the number of items that succeeded and failed."""
+        with self._lock:
+            rows = dict(self._db.execute('SELECT ok, COUNT(*) FROM outcomes GROUP BY ok'))
+        return {'succeeded': rows.get(1, 0), 'failed': rows.get(0, 0)}
+
+    def flush(self):
+        with self._lock:
+            self._db.commit()
+            self._uncommitted = 0
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,214 @@
+""" Circuit breakers that make calls to a failing OSDU endpoint fail fast instead of waiting for slow timeouts.
+
+Usage:
+    from osdu.circuit_breaker import CircuitBreakerPolicy, CircuitOpenError
+
+    osdu_client.circuit_breaker = CircuitBreakerPolicy(failure_rate=0.5, slow_call_duration=5, open_duration=10)
+    osdu_client.circuit_breaker.add_listener(lambda key, old, new: print(f'{key}: {old} -> {new}'))
+    try:
+        record = osdu_client.storage.get_record('opendes:master-data--Well:1234')
+    except CircuitOpenError as e:
+        # Back off for e.retry_after seconds...
+"""
+import threading
+from collections import deque
+from time import monotonic
+from typing import Callable
+
+import requests
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request while the circuit of its service endpoint is open, or half-open with all
+    probes in flight. `state` tells the two apart: 'open' if the circuit tripped and rejects calls for `retry_after`
+    more seconds, or 'half_open' if it is being probed, in which case `retry_after` is 0 and the call may be retried
+    as soon as a probe completes.
+    """
+
+    def __init__(self, key: str, retry_after: float, state: str = OPEN):
+        if state == HALF_OPEN:
+            message = f"Circuit '{key}' is half-open with all probes in flight. Retry when a probe completes."
+        else:
+            message = f"Circuit '{key}' is open. Retry after {retry_after:.1f}s."
+        super().__init__(message)
+        self.key = key
+        self.retry_after = retry_after
+        self.state = state
+
+
+def is_failure(error: Exception) -> bool:
+    """Returns True if an error shows that the service is unhealthy: connection errors, timeouts, 5xx responses and
+    429 Too Many Requests. Other client errors (e.g. 404) mean the service is responding normally.
+    """
+    if isinstance(error, requests.HTTPError):
+        status_code = getattr(error.response, 'status_code', None)
+        return status_code is None or status_code >= 500 or status_code == 429
+    return isinstance(error, requests.RequestException)
+
+
+class _Circuit:
+    """State of one circuit. Only used under the lock of its CircuitBreakerPolicy."""
+
+    def __init__(self):
+        self.state = CLOSED
+        # (time, failed, slow) of the calls completed within the window, while closed.
+        self.outcomes = deque()
+        self.opened_at = None
+        self.probes_in_flight = 0
+        self.probes_succeeded = 0
+
+
+class CircuitBreakerPolicy:
+    """Keeps one circuit per service endpoint (service, HTTP method and first path segment, e.g.
+    'storage:GET /records'), each moving between three states:
+
+    - closed:       calls are sent. The circuit opens when, over the last `window` seconds and at least
+                    `min_calls` calls, the ratio of failed calls reaches `failure_rate` or the ratio of calls slower
+                    than `slow_call_duration` reaches `slow_call_rate`.
+    - open:         calls are rejected immediately with CircuitOpenError, for `open_duration` seconds.
+    - half_open:    up to `probe_calls` calls are sent as probes, and other calls are rejected. The circuit closes
+                    when all probes succeed, and opens again as soon as one fails or is slow.
+
+    Listeners added with add_listener() are called with (key, old state, new state) on every state change. They are
+    per process: a pickled copy of the policy, e.g. one sent to map_pages workers with a client, has none.
+    """
+
+    def __init__(self, failure_rate: float = 0.5, slow_call_duration: float = 10.0, slow_call_rate: float = 0.8,
+                 window: float = 10.0, min_calls: int = 20, open_duration: float = 5.0, probe_calls: int = 3):
+        """
+        :param failure_rate:        Ratio of failed calls at which the circuit opens.
+        :param slow_call_duration:  Calls taking at least this many seconds are counted as slow.
+        :param slow_call_rate:      Ratio of slow calls at which the circuit opens.
+        :param window:              Number of seconds of recent calls that the ratios are computed over.
+        :param min_calls:           Minimum number of calls in the window before the circuit can open.
+        :param open_duration:       Seconds to reject calls before sending probes.
+        :param probe_calls:         Number of successful probes needed to close the circuit.
+        """
+        self._failure_rate = failure_rate
+        self._slow_call_duration = slow_call_duration
+        self._slow_call_rate = slow_call_rate
+        self._window = window
+        self._min_calls = min_calls
+        self._open_duration = open_duration
+        self._probe_calls = probe_calls
+        self._lock = threading.Lock()
+        self._circuits = {}
+        self._listeners = []
+
+    def add_listener(self, listener: Callable):
+        """Calls `listener(key, old_state, new_state)` on every state change of any circuit."""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable):
+        self._listeners.remove(listener)
+
+    def state(self, key: str) -> str:
+        """Returns the state of the circuit for the given key: 'closed', 'open' or 'half_open'."""
+        with self._lock:
+            circuit = self._circuits.get(key)
+            return circuit.state if circuit is not None else CLOSED
+
+    def states(self) -> dict:
+        """Returns {key: state} for all circuits that have seen calls."""
+        with self._lock:
+            return {key: circuit.state for key, circuit in self._circuits.items()}
+
+    def reset(self, key: str = None):
+        """Closes the circuit for the given key, or all circuits, and forgets their recent calls."""
+        with self._lock:
+            keys = [key] if key is not None else list(self._circuits)
+            changes = [(k, self._circuits.pop(k).state, CLOSED) for k in keys if k in self._circuits]
+        self._notify(change for change in changes if change[1] != CLOSED)
+
+    def call(self, key: str, send: Callable):
+        """Calls `send()` if the circuit for `key` allows it, and records the outcome.
+
+        :raises CircuitOpenError:   If the circuit is open, or half-open with all probes in flight.
+        """
+        changes = []
+        with self._lock:
+            circuit = self._circuits.get(key)
+            if circuit is None:
+                circuit = self._circuits[key] = _Circuit()
+            now = monotonic()
+            if circuit.state == OPEN:
+                retry_after = circuit.opened_at + self._open_duration - now
+                if retry_after > 0:
+                    raise CircuitOpenError(key, retry_after)
+                self._transition(key, circuit, HALF_OPEN, changes)
+            probe = circuit.state == HALF_OPEN
+            if probe:
+                if circuit.probes_in_flight + circuit.probes_succeeded >= self._probe_calls:
+                    raise CircuitOpenError(key, 0, HALF_OPEN)
+                circuit.probes_in_flight += 1
+        self._notify(changes)
+
+        started = monotonic()
+        try:
+            response = send()
+        except Exception as e:
+            self._record(key, probe, started, failed=is_failure(e))
+            raise
+        self._record(key, probe, started, failed=False)
+        return response
+
+    def _record(self, key: str, probe: bool, started: float, failed: bool):
+        changes = []
+        with self._lock:
+            now = monotonic()
+            slow = now - started >= self._slow_call_duration
+            circuit = self._circuits.get(key)
+            if circuit is None:
+                # Reset while the call was in flight.
+                return
+            if probe:
+                circuit.probes_in_flight -= 1
+                # Another probe may already have opened or closed the circuit.
+                if circuit.state == HALF_OPEN:
+                    if failed or slow:
+                        self._transition(key, circuit, OPEN, changes)
+                    else:
+                        circuit.probes_succeeded += 1
+                        if circuit.probes_succeeded >= self._probe_calls:
+                            self._transition(key, circuit, CLOSED, changes)
+            elif circuit.state == CLOSED:
+                outcomes = circuit.outcomes
+                outcomes.append((now, failed, slow))
+                while outcomes and outcomes[0][0] < now - self._window:
+                    outcomes.popleft()
+                if len(outcomes) >= self._min_calls:
+                    failures = sum(1 for _, f, _ in outcomes if f)
+                    slow_calls = sum(1 for _, _, s in outcomes if s)
+                    if (failures / len(outcomes) >= self._failure_rate
+                            or slow_calls / len(outcomes) >= self._slow_call_rate):
+                        self._transition(key, circuit, OPEN, changes)
+        self._notify(changes)
+
+    def _transition(self, key: str, circuit: _Circuit, state: str, changes: list):
+        changes.append((key, circuit.state, state))
+        circuit.state = state
+        circuit.outcomes.clear()
+        circuit.probes_succeeded = 0
+        circuit.opened_at = monotonic() if state == OPEN else None
+
+    def _notify(self, changes):
+        for key, old, new in changes:
+            for listener in list(self._listeners):
+                listener(key, old, new)
+
+    def __getstate__(self):
+        # Pickles the configuration only. Each process tracks its own circuits and has its own listeners, which are
+        # often lambdas or bound methods that cannot be pickled.
+        state = self.__dict__.copy()
+        state['_lock'] = None
+        state['_circuits'] = {}
+        state['_listeners'] = []
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
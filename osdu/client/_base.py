@@ -3,10 +3,18 @@
 
 import os
 from time import time
+import requests
+from requests.adapters import HTTPAdapter
 from ..services.search import SearchService
 from ..services.storage import StorageService
 from ..services.dataset import DatasetService
 from ..services.entitlements import EntitlementsService
+from ..transport import TRANSPORTS, Http2Session
+
+# Maximum number of pooled connections kept per host. Sized for concurrent use of the client from many threads.
+DEFAULT_POOL_SIZE = 32
+# Attributes holding the lazily instantiated services.
+_SERVICE_ATTRIBUTES = ('_search', '_storage', '_dataset', '_entitlements', '_legal', '_schema')
 
 
 class BaseOsduClient:
@@ -20,24 +28,103 @@ class BaseOsduClient:
     def api_url(self):
         return self._api_url
 
+    @property
+    def session(self):
+        """requests.Session shared by all services of this client, so that connections are pooled and reused.
+        A forked child process gets its own session, rather than sharing the parent's sockets.
+        """
+        if self._session is None or self._session_pid != os.getpid():
+            if self._transport == 'http2':
+                session = Http2Session(max_connections=DEFAULT_POOL_SIZE)
+            else:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=DEFAULT_POOL_SIZE, pool_maxsize=DEFAULT_POOL_SIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+            self._session = session
+            self._session_pid = os.getpid()
+        return self._session
+
+    @session.setter
+    def session(self, val):
+        self._session = val
+        self._session_pid = os.getpid()
+
+    @property
+    def transport(self):
+        """'http1' (default) to send requests with requests over HTTP/1.1, or 'http2' to multiplex them over a few
+        HTTP/2 connections with httpx. See `osdu.transport`.
+        """
+        return self._transport
+
+    @transport.setter
+    def transport(self, val):
+        if val not in TRANSPORTS:
+            raise ValueError(f'transport must be one of {TRANSPORTS}')
+        if val != self._transport:
+            self._transport = val
+            # The next request creates a session for the new transport.
+            self._session = None
+
+    @property
+    def hedging(self):
+        """Optional `osdu.hedging.HedgingPolicy` applied to idempotent reads. None disables hedging."""
+        return self._hedging
+
+    @hedging.setter
+    def hedging(self, val):
+        self._hedging = val
+
+    @property
+    def circuit_breaker(self):
+        """Optional `osdu.circuit_breaker.CircuitBreakerPolicy` applied to all requests. None disables it."""
+        return self._circuit_breaker
+
+    @circuit_breaker.setter
+    def circuit_breaker(self, val):
+        self._circuit_breaker = val
+
     @property
     def search(self):
+        if self._search is None:
+            self._search = SearchService(self)
         return self._search
 
     @property
     def storage(self):
+        if self._storage is None:
+            self._storage = StorageService(self)
         return self._storage
 
     @property
     def entitlements(self):
+        if self._entitlements is None:
+            self._entitlements = EntitlementsService(self)
         return self._entitlements
 
+    @property
+    def legal(self):
+        if self._legal is None:
+            # The legal and schema services are imported on first use, to keep `import osdu.client` fast.
+            from ..services.legal import LegalService
+            self._legal = LegalService(self)
+        return self._legal
+
+    @property
+    def schema(self):
+        if self._schema is None:
+            from ..services.schema import SchemaService
+            self._schema = SchemaService(self)
+        return self._schema
+
     @property
     def delivery(self):
         return self._delivery
 
     @property
     def dataset(self):
+        if self._dataset is None:
+            self._dataset = DatasetService(self)
         return self._dataset
 
     @property
@@ -60,13 +147,33 @@ class BaseOsduClient:
             raise Exception('No API URL found.')
         self._api_url = api_url.rstrip('/')
 
-        # Instantiate services.
-        self._search = SearchService(self)
-        self._storage = StorageService(self)
-        self._dataset = DatasetService(self)
-        self._entitlements = EntitlementsService(self)
-        # TODO: Implement these services.
-        # self.__legal = LegaService(self)
+        self._session = None
+        self._session_pid = None
+        self._transport = 'http1'
+        self._hedging = None
+        self._circuit_breaker = None
+
+        # Services are instantiated on first access via their properties.
+        self._search = None
+        self._storage = None
+        self._dataset = None
+        self._entitlements = None
+        self._legal = None
+        self._schema = None
+
+    def __getstate__(self):
+        """Clients pickle to their configuration and current access token and its expiration, so that they can be
+        sent to other processes without re-authenticating. The token is not shared after that: a copy whose token
+        expires refreshes it on its own, so each process then authenticates once per expiry. The connection pool
+        and the services, including their settings (e.g. a search cache or get_record batching), are rebuilt on
+        first use.
+        """
+        state = self.__dict__.copy()
+        state['_session'] = None
+        state['_session_pid'] = None
+        for attribute in _SERVICE_ATTRIBUTES:
+            state[attribute] = None
+        return state
 
     def _need_update_token(self):
         return hasattr(self, "_token_expiration") and self._token_expiration < time() or self._access_token is None
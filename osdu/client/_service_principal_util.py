@@ -31,10 +31,8 @@
 #               - Added a more descriptive exception check after the POST request
 import base64
 from time import time
-import boto3
 import requests
 import json
-import botocore.exceptions
 
 
 class ServicePrincipalUtil:
@@ -46,7 +44,7 @@ class ServicePrincipalUtil:
     def __init__(
             self,
             resource_prefix: str,
-            aws_session: boto3.Session = None,
+            aws_session: 'boto3.Session' = None,
             region: str = None,
             profile: str = None
     ):
@@ -64,6 +62,7 @@ class ServicePrincipalUtil:
         if aws_session:
             self._session = aws_session
         else:
+            import boto3
             self._session = boto3.Session(
                 region_name=region, profile_name=profile)
         self._api_url = self._get_ssm_parameter(
@@ -75,6 +74,8 @@ class ServicePrincipalUtil:
         return ssm_response['Parameter']['Value']
 
     def _get_secret(self, secret_name, secret_dict_key):
+        import botocore.exceptions
+
         client = self._session.client(service_name='secretsmanager')
         # In this sample we only handle the specific exceptions for the 'GetSecretValue' API.
         # See https://docs.aws.amazon.com/secretsmanager/latest/apireference/API_GetSecretValue.html
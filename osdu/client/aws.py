@@ -1,10 +1,7 @@
 import os
 from time import time
-import boto3
 
 from ._base import BaseOsduClient
-import boto3.session
-
 
 
 class AwsOsduClient(BaseOsduClient):
@@ -52,6 +49,10 @@ class AwsOsduClient(BaseOsduClient):
             self.get_tokens(os.environ.get('OSDU_PASSWORD'), secret_hash)
 
     def get_tokens(self, password, secret_hash) -> None:
+        # Imported here rather than at module level so that importing `osdu.client` does not pay the
+        # boto3 import cost for users who never instantiate this client.
+        import boto3
+
         if self._profile:
             session = boto3.Session(profile_name=self._profile)
             print('Created boto3 session with profile: ', self._profile)
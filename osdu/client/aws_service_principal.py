@@ -9,6 +9,8 @@ class AwsServicePrincipalOsduClient(BaseOsduClient):
         return self._resource_prefix
 
     def __init__(self, data_partition_id: str, resource_prefix: str, profile: str = None, region: str = None):
+        self._profile = profile
+        self._region = region
         self._sp_util = ServicePrincipalUtil(
             resource_prefix, profile=profile, region=region)
         self._resource_prefix = resource_prefix
@@ -16,9 +18,20 @@ class AwsServicePrincipalOsduClient(BaseOsduClient):
 
         super().__init__(data_partition_id, self._sp_util.api_url)
 
+    def __getstate__(self):
+        # The boto3 session cannot be pickled. It is rebuilt from the profile and region on the next token refresh.
+        state = super().__getstate__()
+        state['_sp_util'] = None
+        return state
+
+    def _get_sp_util(self) -> ServicePrincipalUtil:
+        if self._sp_util is None:
+            self._sp_util = ServicePrincipalUtil(self._resource_prefix, profile=self._profile, region=self._region)
+        return self._sp_util
+
     def _get_tokens(self):
-        return self._sp_util.get_service_principal_token(self._resource_prefix)
+        return self._get_sp_util().get_service_principal_token(self._resource_prefix)
    
     def _update_token(self):
-        self._access_token, self._token_expiration = self._sp_util.get_service_principal_token(self._resource_prefix)
+        self._access_token, self._token_expiration = self._get_tokens()
         return self._access_token, self._token_expiration
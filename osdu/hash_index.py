@@ -0,0 +1,70 @@
+""" Local index of record content hashes, used to skip storing records that have not changed.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+
+# Record members that make up its content. Other members (id, version, createTime, ...) are set by the platform.
+HASHED_FIELDS = ('kind', 'acl', 'legal', 'data', 'ancestry', 'meta', 'tags')
+
+
+def content_hash(record: dict) -> str:
+    """Returns a hash of the canonicalized content of a record. Key order does not affect the hash."""
+    content = {field: record[field] for field in HASHED_FIELDS if record.get(field) is not None}
+    if isinstance(content.get('legal'), dict):
+        # 'status' is computed by the legal service, and is not part of the content written by clients.
+        content['legal'] = {k: v for k, v in content['legal'].items() if k != 'status'}
+    canonical = json.dumps(content, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class ContentHashIndex:
+    """SQLite file mapping record ids to the content hash of the last version stored by this client."""
+
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS hashes (id TEXT PRIMARY KEY, hash TEXT NOT NULL)')
+        self._db.commit()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def get_many(self, record_ids: list) -> dict:
+        """Returns {record id: hash} for the given ids that are in the index."""
+        hashes = {}
+        with self._lock:
+            # Stay well below SQLite's limit on the number of query parameters.
+            for i in range(0, len(record_ids), 500):
+                batch = record_ids[i:i + 500]
+                placeholders = ','.join('?' * len(batch))
+                hashes.update(self._db.execute(f'SELECT id, hash FROM hashes WHERE id IN ({placeholders})', batch))
+        return hashes
+
+    def set_many(self, hashes: dict):
+        """Adds or replaces the hashes for the given {record id: hash}."""
+        with self._lock:
+            self._db.executemany('INSERT OR REPLACE INTO hashes (id, hash) VALUES (?, ?)', hashes.items())
+            self._db.commit()
+
+    def remove_many(self, record_ids: list):
+        with self._lock:
+            self._db.executemany('DELETE FROM hashes WHERE id = ?', ((record_id,) for record_id in record_ids))
+            self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM hashes').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,156 @@
+""" Hedged requests: reduce tail latency of idempotent reads by racing a duplicate request against a slow one.
+
+Usage:
+    from osdu.hedging import HedgingPolicy
+
+    osdu_client.hedging = HedgingPolicy(percentile=95, budget=0.05)
+    record = osdu_client.storage.get_record('opendes:master-data--Well:1234')
+    print(osdu_client.hedging.stats())
+"""
+import os
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from time import monotonic
+
+
+class HedgingPolicy:
+    """Sends a second copy of a request when the first one has not completed within a delay taken from a
+    percentile of recently observed latencies, and returns whichever response arrives first.
+
+    Only used for idempotent reads (`StorageService.get_record`, `get_records` and `SearchService.query`). Latencies
+    are tracked separately per service and HTTP method. The budget caps hedges to a fraction of all requests, so a
+    slow backend does not get twice the load. Requests that lose the race cannot be aborted once they are on the
+    wire: the loser is cancelled if it has not started yet, and otherwise its response is discarded and closed.
+    """
+
+    def __init__(self, percentile: float = 95, initial_delay: float = 0.1, min_delay: float = 0.005,
+                 max_delay: float = 2.0, budget: float = 0.05, window: int = 1000, min_samples: int = 20,
+                 max_workers: int = 32):
+        """
+        :param percentile:      Percentile of recent latencies after which a hedge is sent.
+        :param initial_delay:   Delay in seconds used until `min_samples` latencies have been observed.
+        :param min_delay:       Lower bound of the hedge delay in seconds.
+        :param max_delay:       Upper bound of the hedge delay in seconds.
+        :param budget:          Maximum ratio of hedges to requests, e.g. 0.05 for at most 5% extra requests.
+        :param window:          Number of recent latencies kept per service and method.
+        :param min_samples:     Number of latencies to observe before using the percentile.
+        :param max_workers:     Maximum number of requests in flight through this policy.
+        """
+        if not 0 < percentile < 100:
+            raise ValueError('percentile must be between 0 and 100')
+        self._percentile = percentile
+        self._initial_delay = initial_delay
+        self._min_delay = min_delay
+        self._max_delay = max_delay
+        self._budget = budget
+        self._window = window
+        self._min_samples = min_samples
+        self._max_workers = max_workers
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._executor = None
+        self._executor_pid = None
+        self._requests = 0
+        self._hedges = 0
+        self._hedge_wins = 0
+        self._over_budget = 0
+
+    def delay(self, key: str) -> float:
+        """Returns the current hedge delay in seconds for requests with the given key."""
+        with self._lock:
+            latencies = sorted(self._latencies.get(key, ()))
+        if len(latencies) < self._min_samples:
+            delay = self._initial_delay
+        else:
+            delay = latencies[min(len(latencies) - 1, int(len(latencies) * self._percentile / 100))]
+        return min(self._max_delay, max(self._min_delay, delay))
+
+    def stats(self) -> dict:
+        """Returns the number of requests, hedges sent, hedges that returned first, and hedges skipped because the
+        budget was exhausted.
+        """
+        with self._lock:
+            return {'requests': self._requests, 'hedges': self._hedges, 'hedge_wins': self._hedge_wins,
+                    'over_budget': self._over_budget}
+
+    def run(self, key: str, send):
+        """Calls `send()`, and calls it again if the first call has not returned within the hedge delay.
+
+        :param key:     Latency bucket of the request, e.g. 'storage:get'.
+        :param send:    Function sending the request and returning a `requests.Response`.
+        :returns:       The first successful response. If all calls fail, raises the error of the first call.
+        """
+        delay = self.delay(key)
+        executor = self._get_executor()
+        with self._lock:
+            self._requests += 1
+
+        started = monotonic()
+        primary = executor.submit(send)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return self._finish(key, started, primary)
+
+        with self._lock:
+            allowed = self._hedges < self._budget * self._requests
+            if allowed:
+                self._hedges += 1
+            else:
+                self._over_budget += 1
+        if not allowed:
+            return self._finish(key, started, primary)
+
+        hedge = executor.submit(send)
+        pending = {primary, hedge}
+        first_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    if future is primary or first_error is None:
+                        first_error = future.exception()
+                    continue
+                for loser in pending:
+                    loser.cancel()
+                    loser.add_done_callback(_close_response)
+                if future is hedge:
+                    with self._lock:
+                        self._hedge_wins += 1
+                return self._finish(key, started, future)
+        raise first_error
+
+    def _finish(self, key: str, started: float, future):
+        response = future.result()
+        latency = monotonic() - started
+        with self._lock:
+            latencies = self._latencies.get(key)
+            if latencies is None:
+                latencies = self._latencies[key] = deque(maxlen=self._window)
+            latencies.append(latency)
+        return response
+
+    def __getstate__(self):
+        # Pickles the configuration and observed latencies. Threads and locks are recreated on first use.
+        state = self.__dict__.copy()
+        state['_lock'] = None
+        state['_executor'] = None
+        state['_executor_pid'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            # The worker threads of an executor created before a fork do not exist in the child process.
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self._max_workers)
+                self._executor_pid = os.getpid()
+            return self._executor
+
+
+def _close_response(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
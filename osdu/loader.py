@@ -0,0 +1,87 @@
+""" Collects individual lookups made concurrently from many threads into batched requests.
+"""
+import copy
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class BatchLoader:
+    """DataLoader-style micro-batcher.
+
+    Keys passed to load() within `window` seconds of the first pending key (or until `max_batch_size` distinct
+    keys are pending) are resolved with a single call to `batch_fn`. Identical keys are only requested once.
+
+    `batch_fn` receives a list of distinct keys and must return a dict mapping each key to its result, or to an
+    Exception instance to raise for that key. Keys missing from the dict raise KeyError.
+    """
+
+    def __init__(self, batch_fn, window: float = 0.005, max_batch_size: int = 100):
+        self._batch_fn = batch_fn
+        self._window = window
+        self._max_batch_size = max_batch_size
+        self._lock = threading.Lock()
+        self._pending = OrderedDict()
+        self._timer = None
+        self._stats = {'loads': 0, 'batches': 0}
+
+    @property
+    def stats(self) -> dict:
+        """Number of keys loaded and number of batches sent."""
+        with self._lock:
+            return dict(self._stats)
+
+    def load(self, key):
+        """Blocks until the batch containing `key` has been fetched and returns the result for `key`."""
+        return self.load_async(key).result()
+
+    def load_async(self, key) -> Future:
+        """Schedules `key` to be fetched with the next batch and returns a Future for its result."""
+        future = Future()
+        batch = None
+        with self._lock:
+            self._stats['loads'] += 1
+            self._pending.setdefault(key, []).append(future)
+            if len(self._pending) >= self._max_batch_size:
+                batch = self._take_batch()
+            elif self._timer is None:
+                self._timer = threading.Timer(self._window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if batch:
+            self._dispatch(batch)
+        return future
+
+    def flush(self):
+        """Sends the pending keys immediately."""
+        with self._lock:
+            batch = self._take_batch()
+        if batch:
+            self._dispatch(batch)
+
+    def _take_batch(self):
+        batch, self._pending = self._pending, OrderedDict()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if batch:
+            self._stats['batches'] += 1
+        return batch
+
+    def _dispatch(self, batch: OrderedDict):
+        try:
+            results = self._batch_fn(list(batch))
+        except Exception as e:
+            for futures in batch.values():
+                for future in futures:
+                    future.set_exception(e)
+            return
+
+        for key, futures in batch.items():
+            result = results.get(key, KeyError(key))
+            for i, future in enumerate(futures):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    # Callers that asked for the same key each get their own copy.
+                    future.set_result(result if i == 0 else copy.deepcopy(result))
@@ -0,0 +1,200 @@
+""" Local SQLite store of exported records for fast, repeated offline queries.
+
+Usage:
+    from osdu.local_index import LocalRecordIndex
+
+    with LocalRecordIndex('wells.db', indexed_fields=['data.FacilityName', 'data.OperatingEnvironmentID']) as index:
+        index.materialize(osdu_client, {'kind': 'osdu:wks:master-data--Well:1.0.0'})
+        wells = list(index.find(where={'data.OperatingEnvironmentID': 'opendes:reference-data--OperatingEnvironment:ONS:'}))
+"""
+import json
+import sqlite3
+import threading
+from typing import List
+
+from .models import Record
+from .pipeline import search_and_hydrate
+from .services.search import MAX_QUERY_LIMIT
+from .utils import chunked
+
+
+def _field_value(record: dict, field: str):
+    value = record
+    for part in field.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, sort_keys=True)
+    return value
+
+
+class LocalRecordIndex:
+    """SQLite file holding full records as JSON, with indexed columns for id, kind, version and any chosen fields.
+
+    Filters on indexed fields use their column indexes. Filters on other fields fall back to SQLite's JSON
+    functions, which still run locally but scan the records.
+    """
+
+    def __init__(self, path: str, indexed_fields: List[str] = ()):
+        """
+        :param path:            Path of the SQLite file. Created if it does not exist.
+        :param indexed_fields:  Dotted paths of fields to index, e.g. ['data.FacilityName']. Must be the same each
+                                time an existing file is opened.
+        """
+        self._path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS fields (position INTEGER PRIMARY KEY, field TEXT NOT NULL)')
+        existing = [row[0] for row in self._db.execute('SELECT field FROM fields ORDER BY position')]
+        if existing and existing != list(indexed_fields):
+            raise ValueError(f"'{path}' was created with indexed_fields={existing}")
+        self._fields = list(indexed_fields)
+        self._columns = {field: f'f{position}' for position, field in enumerate(self._fields)}
+
+        columns = ''.join(f', {column}' for column in self._columns.values())
+        self._db.execute(f'CREATE TABLE IF NOT EXISTS records '
+                         f'(id TEXT PRIMARY KEY, kind TEXT, version INTEGER, body TEXT NOT NULL{columns})')
+        self._db.execute('CREATE INDEX IF NOT EXISTS records_kind ON records (kind)')
+        for field, column in self._columns.items():
+            self._db.execute(f'CREATE INDEX IF NOT EXISTS records_{column} ON records ({column})')
+        if not existing:
+            self._db.executemany('INSERT INTO fields (position, field) VALUES (?, ?)', enumerate(self._fields))
+        self._db.commit()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def indexed_fields(self) -> List[str]:
+        return list(self._fields)
+
+    def upsert(self, records) -> int:
+        """Adds or replaces records. Returns the number of records written."""
+        rows = []
+        for record in records:
+            if isinstance(record, Record):
+                record = record.to_dict()
+            rows.append([record['id'], record.get('kind'), record.get('version'), json.dumps(record)]
+                        + [_field_value(record, field) for field in self._fields])
+        placeholders = ', '.join('?' * (4 + len(self._fields)))
+        columns = ''.join(f', {column}' for column in self._columns.values())
+        with self._lock:
+            self._db.executemany(
+                f'INSERT OR REPLACE INTO records (id, kind, version, body{columns}) VALUES ({placeholders})', rows)
+            self._db.commit()
+        return len(rows)
+
+    def delete(self, record_ids: List[str]):
+        with self._lock:
+            self._db.executemany('DELETE FROM records WHERE id = ?', ((record_id,) for record_id in record_ids))
+            self._db.commit()
+
+    def get(self, record_id: str) -> dict:
+        """Returns the record with the given id, or None."""
+        with self._lock:
+            row = self._db.execute('SELECT body FROM records WHERE id = ?', (record_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find(self, kind: str = None, where: dict = None, limit: int = None, offset: int = 0):
+        """Returns the records matching all of the given filters.
+
+        :param kind:    Only return records of this kind. '*' wildcards are supported, e.g. 'osdu:wks:*:*'
+        :param where:   dict of {field: value} equality filters on dotted field paths, e.g. {'data.Status': 'Active'}.
+                        A list or tuple value matches any of its values.
+        :param limit:   Maximum number of records to return.
+        :param offset:  Number of matching records to skip.
+        :returns:       list of record dicts, ordered by id.
+        """
+        condition, params = self._where(kind, where)
+        sql = f'SELECT body FROM records{condition} ORDER BY id'
+        if limit is not None or offset:
+            sql += ' LIMIT ? OFFSET ?'
+            params += [-1 if limit is None else limit, offset]
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def count(self, kind: str = None, where: dict = None) -> int:
+        """Returns the number of records matching the given filters. See find()."""
+        condition, params = self._where(kind, where)
+        with self._lock:
+            return self._db.execute(f'SELECT COUNT(*) FROM records{condition}', params).fetchone()[0]
+
+    def aggregate(self, field: str, kind: str = None, where: dict = None) -> list:
+        """Counts the matching records by the value of `field`, like the search service's 'aggregateBy'.
+
+        :returns:   list of dicts containing 'key' and 'count', ordered by descending count.
+        """
+        condition, params = self._where(kind, where)
+        expression, expression_params = self._expression(field)
+        sql = (f'SELECT {expression} AS key, COUNT(*) AS count FROM records{condition} '
+               f'GROUP BY key ORDER BY count DESC, key')
+        with self._lock:
+            rows = self._db.execute(sql, expression_params + params).fetchall()
+        return [{'key': key, 'count': count} for key, count in rows]
+
+    def materialize(self, client, query: dict, hydrate: bool = False, batch_size: int = 500) -> int:
+        """Exports the results of a search into the index. Returns the number of records written.
+
+        :param hydrate: If True, fetch full records from the storage service. Otherwise store the search results,
+                        which hold the indexed attributes of each record.
+        """
+        if hydrate:
+            records = search_and_hydrate(client, query)
+        else:
+            page_query = {k: v for k, v in query.items() if k != 'cursor'}
+            page_query['limit'] = MAX_QUERY_LIMIT
+            records = (record for page, _ in client.search.query_with_paging(page_query) for record in page)
+        return self.load(records, batch_size)
+
+    def sync(self, incremental_sync, query: dict, key: str = None, hydrate: bool = True) -> int:
+        """Brings the index up to date with the records that changed since the last sync, using an
+        `osdu.sync.IncrementalSync`. Returns the number of records written. Deleted records are not detected.
+        """
+        return self.load(incremental_sync.changes(query, key=key, hydrate=hydrate))
+
+    def load(self, records, batch_size: int = 500) -> int:
+        """Writes records from any iterable into the index in batches. Returns the number of records written."""
+        return sum(self.upsert(batch) for batch in chunked(records, batch_size))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __len__(self):
+        return self.count()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _expression(self, field: str):
+        if field in ('id', 'kind', 'version'):
+            return field, []
+        if field in self._columns:
+            return self._columns[field], []
+        return 'json_extract(body, ?)', [f'$.{field}']
+
+    def _where(self, kind: str, where: dict):
+        conditions, params = [], []
+        if kind is not None:
+            if '*' in kind:
+                conditions.append('kind GLOB ?')
+            else:
+                conditions.append('kind = ?')
+            params.append(kind)
+        for field, value in (where or {}).items():
+            expression, expression_params = self._expression(field)
+            params += expression_params
+            if isinstance(value, (list, tuple)):
+                conditions.append(f'{expression} IN ({", ".join("?" * len(value))})')
+                params += list(value)
+            else:
+                conditions.append(f'{expression} = ?')
+                params.append(value)
+        condition = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+        return condition, params
@@ -0,0 +1,200 @@
+""" Streaming copy of records from one OSDU client (environment or data partition) to another.
+
+Usage:
+    from osdu.migration import Migration, rewrite_acl, rewrite_legal, rewrite_partition
+
+    migration = Migration(
+        staging_client, prod_client, {'kind': 'osdu:wks:master-data--Well:1.0.0'},
+        transforms=[
+            rewrite_partition('staging', 'prod'),
+            rewrite_acl(['data.default.viewers@prod.example.com'], ['data.default.owners@prod.example.com']),
+            rewrite_legal(['prod-public-usa-dataset-1']),
+        ],
+        checkpoint='migration.db')
+    report = migration.run()
+"""
+from time import monotonic
+from typing import Callable, List
+
+from .checkpoint import Checkpoint
+from .pipeline import search_and_hydrate
+from .services.storage import MAX_STORE_RECORDS, REFERENCE_PATTERN
+from .utils import chunked, ordered_map
+
+# Record members copied to the target. Everything else (version, createTime, ...) is set by the target platform.
+WRITABLE_FIELDS = ('id', 'kind', 'acl', 'legal', 'data', 'ancestry', 'meta', 'tags')
+
+
+def rewrite_acl(viewers: List[str], owners: List[str]) -> Callable:
+    """Returns a transform that replaces the ACL of each record."""
+    def transform(record):
+        record['acl'] = {'viewers': list(viewers), 'owners': list(owners)}
+        return record
+    return transform
+
+
+def rewrite_legal(legaltags: List[str], other_relevant_data_countries: List[str] = None) -> Callable:
+    """Returns a transform that replaces the legal tags (and optionally the countries) of each record."""
+    def transform(record):
+        legal = dict(record.get('legal') or {})
+        legal['legaltags'] = list(legaltags)
+        if other_relevant_data_countries is not None:
+            legal['otherRelevantDataCountries'] = list(other_relevant_data_countries)
+        record['legal'] = legal
+        return record
+    return transform
+
+
+def rewrite_partition(source_partition: str, target_partition: str) -> Callable:
+    """Returns a transform that moves each record id, and all references to other records, from the source data
+    partition to the target data partition. References are rewritten wherever they appear outside 'acl' and 'legal',
+    e.g. in 'data', in the 'ancestry.parents' of derived records and in the unit references of 'meta'.
+    """
+    prefix = f'{source_partition}:'
+
+    def rewrite(value):
+        if isinstance(value, dict):
+            return {k: rewrite(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [rewrite(v) for v in value]
+        if isinstance(value, str) and value.startswith(prefix) and REFERENCE_PATTERN.match(value):
+            return target_partition + value[len(source_partition):]
+        return value
+
+    def transform(record):
+        if record.get('id', '').startswith(prefix):
+            record['id'] = target_partition + record['id'][len(source_partition):]
+        for key, value in record.items():
+            if key not in ('id', 'kind', 'acl', 'legal'):
+                record[key] = rewrite(value)
+        return record
+    return transform
+
+
+def _rejection_reason(problem: dict) -> str:
+    """Returns the error message of a record rejected by the legal check or schema validation of store_records."""
+    if 'reason' in problem:
+        return f"Rejected by the legal check: {problem['reason']}"
+    return 'Rejected by schema validation: ' + '; '.join(f"{e['path']}: {e['message']}" for e in problem['errors'])
+
+
+class MigrationReport:
+    """Progress of a migration run.
+
+    - read:     number of source records read.
+    - written:  number of records stored in the target.
+    - skipped:  number of records skipped, because the checkpoint shows they were already copied or because a
+                transform dropped them.
+    - failed:   dict of {source record id: error message} for records that could not be stored, including records
+                rejected by the target's legal check or schema validation.
+    - elapsed:  seconds since the run started.
+    """
+
+    def __init__(self):
+        self.read = 0
+        self.written = 0
+        self.skipped = 0
+        self.failed = {}
+        self.elapsed = 0.0
+
+    @property
+    def records_per_second(self) -> float:
+        return self.written / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        return (f'MigrationReport(read={self.read}, written={self.written}, skipped={self.skipped}, '
+                f'failed={len(self.failed)}, elapsed={self.elapsed:.1f}s, '
+                f'records_per_second={self.records_per_second:.1f})')
+
+
+class Migration:
+    """Copies the records matching a query from a source client to a target client.
+
+    Records stream from a search_and_hydrate pipeline on the source, through the transforms, into concurrent
+    store_records calls on the target. Only a bounded number of batches is in flight at any time, so memory use does
+    not grow with the number of records. With a checkpoint, each copied source id is recorded and skipped when an
+    interrupted migration is run again.
+    """
+
+    def __init__(self, source, target, query: dict, transforms: List[Callable] = (),
+                 batch_size: int = MAX_STORE_RECORDS, max_workers: int = 4, read_workers: int = 4, checkpoint=None,
+                 progress: Callable = None):
+        """
+        :param source:          OSDU client to read from.
+        :param target:          OSDU client to write to.
+        :param query:           Search query selecting the source records.
+        :param transforms:      Functions applied in order to each record before it is written. Each takes and
+                                returns a record dict, or returns None to drop the record.
+        :param batch_size:      Number of records per store_records call.
+        :param max_workers:     Maximum number of concurrent store_records calls.
+        :param read_workers:    Maximum number of concurrent get_records calls on the source.
+        :param checkpoint:      `osdu.checkpoint.Checkpoint` or path of a checkpoint file.
+        :param progress:        Optional function called with the MigrationReport after each written batch.
+        """
+        self._source = source
+        self._target = target
+        self._query = query
+        self._transforms = list(transforms)
+        self._batch_size = batch_size
+        self._max_workers = max_workers
+        self._read_workers = read_workers
+        self._checkpoint = checkpoint
+        self._progress = progress
+
+    def run(self) -> MigrationReport:
+        report = MigrationReport()
+        started = monotonic()
+        checkpoint = self._checkpoint
+        owns_checkpoint = isinstance(checkpoint, str)
+        if owns_checkpoint:
+            checkpoint = Checkpoint(checkpoint)
+
+        def prepared_records():
+            records = search_and_hydrate(self._source, self._query, max_workers=self._read_workers, ordered=False)
+            for record in records:
+                report.read += 1
+                source_id = record['id']
+                if checkpoint is not None and checkpoint.succeeded(source_id):
+                    report.skipped += 1
+                    continue
+                record = {k: v for k, v in record.items() if k in WRITABLE_FIELDS}
+                for transform in self._transforms:
+                    record = transform(record)
+                    if record is None:
+                        break
+                if record is None:
+                    report.skipped += 1
+                    continue
+                yield source_id, record
+
+        def write(batch):
+            source_ids = [source_id for source_id, _ in batch]
+            try:
+                response = self._target.storage.store_records([record for _, record in batch])
+            except Exception as e:
+                errors = dict.fromkeys(source_ids, str(e))
+            else:
+                # Records rejected by the target's legal check or schema validation in 'split' mode.
+                errors = {source_ids[problem['index']]: _rejection_reason(problem)
+                          for problem in (response or {}).get('rejectedRecords') or []}
+            if checkpoint is not None:
+                for source_id in source_ids:
+                    checkpoint.record(source_id, source_id not in errors, errors.get(source_id))
+            return source_ids, errors
+
+        try:
+            batches = chunked(prepared_records(), self._batch_size)
+            for source_ids, errors in ordered_map(write, batches, max_workers=self._max_workers):
+                report.written += len(source_ids) - len(errors)
+                report.failed.update(errors)
+                report.elapsed = monotonic() - started
+                if self._progress is not None:
+                    self._progress(report)
+        finally:
+            if owns_checkpoint:
+                checkpoint.close()
+            elif checkpoint is not None:
+                checkpoint.flush()
+
+        report.elapsed = monotonic() - started
+        return report
@@ -0,0 +1,155 @@
+""" Optional lightweight result types for OSDU records and API responses.
+
+The services return plain dicts by default. Passing `typed=True` to the supported service methods
+returns these slotted types instead. Top-level record metadata is kept as attributes, while the
+`data` payload is held in compact serialized form and only parsed the first time it is accessed.
+"""
+import json
+
+# Top-level record members that are kept as attributes. Everything else is preserved in `extra`.
+RECORD_FIELDS = ('id', 'kind', 'version', 'acl', 'legal')
+_DATA_PRESENT = 1 << len(RECORD_FIELDS)
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False)
+
+
+class Record:
+    """A single OSDU record, as returned by the storage service or as a search hit."""
+
+    __slots__ = RECORD_FIELDS + ('extra', '_data', '_raw_data', '_present')
+
+    def __init__(self, id=None, kind=None, version=None, acl=None, legal=None, data=None, **extra):
+        self.id = id
+        self.kind = kind
+        self.version = version
+        self.acl = acl
+        self.legal = legal
+        self.extra = extra
+        self._data = data
+        self._raw_data = None
+        # Bitmask of which members are present, so that missing and explicitly null members both
+        # survive a round trip through to_dict().
+        self._present = 0
+        for i, field in enumerate(RECORD_FIELDS):
+            if getattr(self, field) is not None:
+                self._present |= 1 << i
+        if data is not None:
+            self._present |= _DATA_PRESENT
+
+    @classmethod
+    def from_dict(cls, record: dict) -> 'Record':
+        """Builds a Record from a record dict. The `data` payload is re-serialized into a compact
+        string and the nested dicts are released, to be parsed again on first access of `data`.
+        """
+        obj = cls.__new__(cls)
+        present = 0
+        for i, field in enumerate(RECORD_FIELDS):
+            if field in record:
+                present |= 1 << i
+            setattr(obj, field, record.get(field))
+        obj._data = None
+        obj._raw_data = None
+        if 'data' in record:
+            present |= _DATA_PRESENT
+            if record['data'] is not None:
+                obj._raw_data = _dumps(record['data'])
+        obj._present = present
+        obj.extra = {k: v for k, v in record.items() if k != 'data' and k not in RECORD_FIELDS}
+        return obj
+
+    @property
+    def data(self):
+        if self._raw_data is not None:
+            self._data = json.loads(self._raw_data)
+            self._raw_data = None
+        return self._data
+
+    @data.setter
+    def data(self, val):
+        self._data = val
+        self._raw_data = None
+        self._present |= _DATA_PRESENT
+
+    def to_dict(self) -> dict:
+        """Returns the record as a plain dict, e.g. for passing to `StorageService.store_records`."""
+        record = {}
+        for i, field in enumerate(RECORD_FIELDS):
+            value = getattr(self, field)
+            if self._present & (1 << i) or value is not None:
+                record[field] = value
+        if self._present & _DATA_PRESENT:
+            record['data'] = self.data
+        record.update(self.extra)
+        return record
+
+    def __eq__(self, other):
+        if not isinstance(other, Record):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    # Records are mutable and compare by content, so they are not hashable. Key dicts and sets by record id instead.
+    __hash__ = None
+
+    def __repr__(self):
+        return f'Record(id={self.id!r}, kind={self.kind!r}, version={self.version!r})'
+
+
+class SearchResult:
+    """Response of `SearchService.query`, with each hit as a Record."""
+
+    __slots__ = ('results', 'total_count', 'aggregations', 'extra', '_present')
+
+    def __init__(self, results: list = None, total_count: int = None, aggregations=None, **extra):
+        self.results = results if results is not None else []
+        self.total_count = total_count
+        self.aggregations = aggregations
+        self.extra = extra
+        self._present = ()
+
+    @classmethod
+    def from_dict(cls, response: dict) -> 'SearchResult':
+        extra = {k: v for k, v in response.items() if k not in ('results', 'totalCount', 'aggregations')}
+        results = [Record.from_dict(hit) for hit in response.get('results') or []]
+        result = cls(results, response.get('totalCount'), response.get('aggregations'), **extra)
+        result._present = tuple(k for k in ('results', 'totalCount', 'aggregations') if k in response)
+        return result
+
+    def to_dict(self) -> dict:
+        response = {}
+        if self.results or 'results' in self._present:
+            response['results'] = [record.to_dict() for record in self.results or []]
+        if self.aggregations is not None or 'aggregations' in self._present:
+            response['aggregations'] = self.aggregations
+        if self.total_count is not None or 'totalCount' in self._present:
+            response['totalCount'] = self.total_count
+        response.update(self.extra)
+        return response
+
+
+class RecordsResult:
+    """Response of `StorageService.get_records`, with each fetched record as a Record."""
+
+    __slots__ = ('records', 'invalid_records', 'retry_records', 'extra')
+
+    def __init__(self, records: list = None, invalid_records: list = None, retry_records: list = None, **extra):
+        self.records = records if records is not None else []
+        self.invalid_records = invalid_records
+        self.retry_records = retry_records
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, response: dict) -> 'RecordsResult':
+        extra = {k: v for k, v in response.items() if k not in ('records', 'invalidRecords', 'retryRecords')}
+        records = [Record.from_dict(record) for record in response.get('records') or []]
+        return cls(records, response.get('invalidRecords'), response.get('retryRecords'), **extra)
+
+    def to_dict(self) -> dict:
+        response = {'records': [record.to_dict() for record in self.records]}
+        if self.invalid_records is not None:
+            response['invalidRecords'] = self.invalid_records
+        if self.retry_records is not None:
+            response['retryRecords'] = self.retry_records
+        response.update(self.extra)
+        return response
@@ -0,0 +1,132 @@
+""" Runs search and storage requests across several data partitions concurrently.
+
+Usage:
+    from osdu.partitions import PartitionFanout
+
+    fanout = PartitionFanout(osdu_client, ['opendes', 'osdu', 'tenant1'])
+    for partition, results, total_count in fanout.query_with_paging({'kind': 'osdu:wks:master-data--Well:*'}):
+        # Do stuff with each page, tagged with the partition it came from...
+"""
+import queue
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List
+
+_DONE = object()
+
+# Outcome of a request in one partition, yielded by PartitionFanout.query() and get_records().
+#   response:   the response, or None if the request failed.
+#   error:      the exception raised by the request, or None if it succeeded.
+PartitionResult = namedtuple('PartitionResult', ['response', 'error'])
+
+
+class PartitionFanout:
+    """Sends the same request to several data partitions at once, passing the partition with each request rather
+    than changing the client's data_partition_id. All requests share the client's connection pool.
+    """
+
+    def __init__(self, client, data_partition_ids: List[str], max_workers: int = None):
+        """
+        :param client:              OSDU client to use.
+        :param data_partition_ids:  Data partitions to fan out to.
+        :param max_workers:         Maximum number of concurrent requests. Defaults to one per partition.
+        """
+        self._client = client
+        self._partitions = list(data_partition_ids)
+        self._max_workers = max_workers or len(self._partitions)
+
+    @property
+    def data_partition_ids(self) -> List[str]:
+        return list(self._partitions)
+
+    def query(self, query: dict, typed: bool = False):
+        """Runs SearchService.query in every partition. A partition that fails does not stop the others.
+
+        :returns:   iterator of tuple (data_partition_id, PartitionResult), in the order the responses arrive.
+        """
+        def run(partition):
+            return self._client.search.query(dict(query), typed=typed, data_partition_id=partition)
+
+        yield from self._map(run, self._partitions)
+
+    def query_with_paging(self, query: dict, typed: bool = False, max_pending_pages: int = None):
+        """Runs SearchService.query_with_paging in every partition and merges the pages into one stream.
+
+        :param max_pending_pages:   Maximum number of fetched pages waiting to be consumed. Defaults to two per
+                                    partition. Partitions stop fetching while the limit is reached.
+        :returns:   iterator of tuple (data_partition_id, results, totalCount), in the order the pages arrive.
+        """
+        pages = queue.Queue(maxsize=max_pending_pages or 2 * len(self._partitions))
+        stopped = threading.Event()
+
+        def put(item):
+            # Give up waiting for space once the consumer has stopped iterating.
+            while not stopped.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce(partition):
+            try:
+                search = self._client.search.query_with_paging(dict(query), typed=typed, data_partition_id=partition)
+                for results, total_count in search:
+                    if not put((partition, results, total_count)):
+                        return
+            except Exception as e:
+                put((partition, e, None))
+            finally:
+                put((partition, _DONE, None))
+
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            for partition in self._partitions:
+                executor.submit(produce, partition)
+            try:
+                remaining = len(self._partitions)
+                while remaining:
+                    partition, results, total_count = pages.get()
+                    if results is _DONE:
+                        remaining -= 1
+                    elif isinstance(results, Exception):
+                        raise results
+                    else:
+                        yield partition, results, total_count
+            finally:
+                stopped.set()
+
+    def get_records(self, record_ids, attributes: List[str] = [], typed: bool = False):
+        """Runs StorageService.get_records in each partition. A partition that fails does not stop the others.
+
+        :param record_ids:  Either a dict of {data_partition_id: [record ids]}, or a list of record ids. A list is
+                            split by the partition prefix of each id ({data-partition-id}:{type}:{id}).
+        :returns:           iterator of tuple (data_partition_id, PartitionResult), in the order the responses
+                            arrive.
+        """
+        if not isinstance(record_ids, dict):
+            record_ids = self.group_by_partition(record_ids)
+
+        def run(partition):
+            return self._client.storage.get_records(
+                record_ids[partition], attributes, typed=typed, data_partition_id=partition)
+
+        yield from self._map(run, [p for p in self._partitions if record_ids.get(p)])
+
+    def group_by_partition(self, record_ids) -> dict:
+        """Splits record ids by their data partition prefix. Raises ValueError for ids of other partitions."""
+        grouped = {}
+        for record_id in record_ids:
+            partition = record_id.split(':', 1)[0]
+            if partition not in self._partitions:
+                raise ValueError(f"Record '{record_id}' does not belong to any of the partitions {self._partitions}")
+            grouped.setdefault(partition, []).append(record_id)
+        return grouped
+
+    def _map(self, func, partitions):
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            futures = {executor.submit(func, partition): partition for partition in partitions}
+            for future in as_completed(futures):
+                error = future.exception()
+                yield futures[future], PartitionResult(future.result() if error is None else None, error)
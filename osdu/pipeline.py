@@ -0,0 +1,132 @@
+""" Pipelined search-then-hydrate: streams record ids from a search cursor into concurrent get_records calls.
+
+Usage:
+    from osdu.pipeline import search_and_hydrate
+
+    for record in search_and_hydrate(osdu_client, {'kind': 'osdu:wks:master-data--Well:1.0.0'}):
+        # Do stuff with each full record...
+"""
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from .services.search import MAX_QUERY_LIMIT
+from .services.storage import MAX_RECORDS_PER_REQUEST
+from .utils import chunked
+
+_DONE = object()
+# Seconds between checks of whether the consumer has stopped, while waiting on a full or empty queue.
+_POLL_INTERVAL = 0.1
+
+
+def search_and_hydrate(client, query: dict, batch_size: int = MAX_RECORDS_PER_REQUEST, max_workers: int = 4,
+                       ordered: bool = True, max_pending: int = None, attributes: List[str] = [],
+                       data_partition_id: str = None):
+    """Pages through a search in one thread while `max_workers` threads fetch the full records of the ids found
+    so far, so that search and storage latency overlap. Bounded queues between the stages limit memory use: the
+    search pauses when hydration falls behind, and hydration pauses when the consumer falls behind.
+
+    :param client:              OSDU client to use.
+    :param query:               Search query selecting the records. 'returnedFields' and 'limit' are overridden.
+    :param batch_size:          Number of record ids per get_records call.
+    :param max_workers:         Number of concurrent get_records calls.
+    :param ordered:             If True, yield records in search order. Otherwise yield them as soon as they are
+                                fetched.
+    :param max_pending:         Maximum number of batches waiting between stages. Defaults to 2 * max_workers. If
+                                `ordered`, also the maximum number of batches fetched ahead of the next one to yield.
+    :param attributes:          Filter attributes to restrict the returned fields, as for get_records.
+    :param data_partition_id:   Data partition to use. Defaults to the client's data partition.
+    :returns:                   iterator of record dicts. Records that could not be fetched are omitted.
+    """
+    max_pending = max_pending or 2 * max_workers
+    id_batches = queue.Queue(maxsize=max_pending)
+    hydrated = queue.Queue(maxsize=max_pending)
+    stopped = threading.Event()
+    # In ordered mode, batches more than max_pending ahead of the next one to yield wait before being fetched, so
+    # that a stalled batch cannot make the reorder buffer grow without bound.
+    window = threading.Condition()
+    next_to_yield = [0]
+
+    id_query = {k: v for k, v in query.items() if k != 'cursor'}
+    id_query['returnedFields'] = ['id']
+    id_query['limit'] = MAX_QUERY_LIMIT
+
+    def put(target, item):
+        while not stopped.is_set():
+            try:
+                target.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(source):
+        while not stopped.is_set():
+            try:
+                return source.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def search_stage():
+        try:
+            sequence = 0
+            for results, _ in client.search.query_with_paging(id_query, data_partition_id=data_partition_id):
+                for batch in chunked((result['id'] for result in results), batch_size):
+                    if not put(id_batches, (sequence, batch)):
+                        return
+                    sequence += 1
+        except Exception as e:
+            put(hydrated, (None, e))
+        finally:
+            for _ in range(max_workers):
+                put(id_batches, _DONE)
+
+    def hydrate_stage():
+        while True:
+            item = get(id_batches)
+            if item is _DONE:
+                put(hydrated, _DONE)
+                return
+            sequence, record_ids = item
+            if ordered:
+                with window:
+                    while sequence >= next_to_yield[0] + max_pending and not stopped.is_set():
+                        window.wait(_POLL_INTERVAL)
+            try:
+                response = client.storage.get_records(record_ids, attributes, data_partition_id=data_partition_id)
+                records = response['records']
+            except Exception as e:
+                records = e
+            if not put(hydrated, (sequence, records)):
+                return
+
+    with ThreadPoolExecutor(max_workers=max_workers + 1) as executor:
+        executor.submit(search_stage)
+        for _ in range(max_workers):
+            executor.submit(hydrate_stage)
+
+        try:
+            finished_workers = 0
+            reorder_buffer = {}
+            while finished_workers < max_workers:
+                item = hydrated.get()
+                if item is _DONE:
+                    finished_workers += 1
+                    continue
+                sequence, records = item
+                if isinstance(records, Exception):
+                    raise records
+                if not ordered:
+                    yield from records
+                    continue
+                reorder_buffer[sequence] = records
+                while next_to_yield[0] in reorder_buffer:
+                    records = reorder_buffer.pop(next_to_yield[0])
+                    with window:
+                        next_to_yield[0] += 1
+                        window.notify_all()
+                    yield from records
+        finally:
+            stopped.set()
@@ -2,12 +2,48 @@ class BaseService():
 
     def __init__(self, client, service_name: str, service_version: int):
         self._client = client
+        self._service_name = service_name
         self._service_url = f'{self._client.api_url}/api/{service_name}/v{service_version}'
 
     
-    def _headers(self):
+    def _headers(self, data_partition_id: str = None):
         return {
             "Content-Type": "application/json",
-            "data-partition-id": self._client._data_partition_id,
+            "data-partition-id": data_partition_id or self._client._data_partition_id,
             "Authorization": "Bearer " + self._client.access_token
-        }
\ No newline at end of file
+        }
+
+    def _request(self, method: str, url: str, data_partition_id: str = None, hedge: bool = False, **kwargs):
+        """Sends a request over the client's shared connection pool and raises for any error status.
+
+        :param data_partition_id:   Data partition to send the request to. Defaults to the client's partition.
+        :param hedge:               If True and the client has a hedging policy, the request may be sent twice.
+                                    Only set for idempotent reads.
+        :raises osdu.circuit_breaker.CircuitOpenError:  If the client has a circuit breaker policy, and the circuit
+                                                        of this service endpoint is open.
+        """
+        headers = self._headers(data_partition_id)
+
+        def send():
+            response = self._client.session.request(method, url, headers=headers, **kwargs)
+            response.raise_for_status()
+            return response
+
+        hedging = self._client.hedging
+        if hedge and hedging is not None:
+            def call():
+                return hedging.run(f'{self._service_name}:{method}', send)
+        else:
+            call = send
+
+        # The circuit breaker sees a hedged request as a single call.
+        circuit_breaker = self._client.circuit_breaker
+        if circuit_breaker is not None:
+            return circuit_breaker.call(self._endpoint_key(method, url), call)
+        return call()
+
+    def _endpoint_key(self, method: str, url: str) -> str:
+        """Returns the circuit breaker key of a request, e.g. 'storage:GET /records'."""
+        path = url[len(self._service_url):] if url.startswith(self._service_url) else url
+        segment = path.lstrip('/').split('/', 1)[0].split('?', 1)[0]
+        return f'{self._service_name}:{method.upper()} /{segment}'
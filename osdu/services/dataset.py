@@ -1,7 +1,6 @@
 """ Provides a simple Python interface to the OSDU Dataset API.
 """
 from typing import List
-import requests
 from .base import BaseService
 
 
@@ -17,8 +16,7 @@ class DatasetService(BaseService):
         :returns:           The API Response
         """
         url = f'{self._service_url}/getDatasetRegistry?id={registry_id}'
-        response = requests.get(url=url, headers=self._headers())
-        response.raise_for_status()
+        response = self._request('get', url)
 
         return response.json()
 
@@ -30,8 +28,7 @@ class DatasetService(BaseService):
         """
         url = f'{self._service_url}/getDatasetRegistry?'
         data = {'datasetRegistryIds': registry_ids}
-        response = requests.post(url=url, headers=self._headers(), json=data)
-        response.raise_for_status()
+        response = self._request('post', url, json=data)
 
         return response.json()
 
@@ -42,8 +39,7 @@ class DatasetService(BaseService):
         :returns:               The API Response
         """
         url = f'{self._service_url}/getStorageInstructions?kindSubType={kind_subtype}'
-        response = requests.get(url, headers=self._headers())
-        response.raise_for_status()
+        response = self._request('get', url)
 
         return response.json()
 
@@ -54,9 +50,7 @@ class DatasetService(BaseService):
         :returns:                   The API Response
         """
         url = f'{self._service_url}/registerDataset'
-        response = requests.put(
-            url, headers=self._headers(), json=datasetRegistries)
-        response.raise_for_status()
+        response = self._request('put', url, json=datasetRegistries)
 
         return response.json()
 
@@ -68,8 +62,6 @@ class DatasetService(BaseService):
         """
         url = f'{self._service_url}/getRetrievalInstructions'
         data = {'datasetRegistryIds': dataset_registry_ids}
-        response = requests.post(
-            url, headers=self._headers(), json=data)
-        response.raise_for_status()
+        response = self._request('post', url, json=data)
 
         return response.json()
@@ -1,7 +1,6 @@
 """ Provides a simple Python interface to the OSDU Entitlements API.
 """
 import json
-import requests
 from .base import BaseService
 
 
@@ -22,8 +21,7 @@ class EntitlementsService(BaseService):
         
         url = f'{self._service_url}/groups'
         query = {}
-        response = requests.get(url=url, headers=self._headers(), json=query)
-        response.raise_for_status()
+        response = self._request('get', url, json=query)
         return response.json()
 
     def get_group_members(self, groupEmail:str=None) -> dict:
@@ -38,8 +36,7 @@ class EntitlementsService(BaseService):
         
         url = f'{self._service_url}/groups/' + groupEmail + '/members'
         query = ''
-        response = requests.get(url=url, headers=self._headers(), json=query)
-        response.raise_for_status()
+        response = self._request('get', url, json=query)
         return response.json()
 
     def add_group_member(self, groupEmail:str, query: dict) -> dict:
@@ -53,8 +50,7 @@ class EntitlementsService(BaseService):
         """
         
         url = f'{self._service_url}/groups/' + groupEmail + '/members'
-        response = requests.post(url=url, headers=self._headers(), json=query)
-        response.raise_for_status()
+        response = self._request('post', url, json=query)
         return response.json()
                 
     def delete_group_member(self, groupEmail:str, query: dict) -> dict:
@@ -68,8 +64,7 @@ class EntitlementsService(BaseService):
         """
         
         url = f'{self._service_url}/groups/' + groupEmail + '/members'
-        response = requests.delete(url=url, headers=self._headers(), json=query)
-        response.raise_for_status()
+        response = self._request('delete', url, json=query)
         return response.json()
 
 
@@ -88,6 +83,5 @@ class EntitlementsService(BaseService):
         """
         
         url = f'{self._service_url}/groups/' + groupEmail + '/members'
-        response = requests.delete(url=url, headers=self._headers(), json=query)
-        response.raise_for_status()
+        response = self._request('delete', url, json=query)
         return response.json()
\ No newline at end of file
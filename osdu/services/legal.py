@@ -0,0 +1,154 @@
+""" Provides a simple Python interface to the OSDU Legal API.
+"""
+import threading
+from time import monotonic
+from typing import List
+
+from .base import BaseService
+from ..utils import chunked
+
+# Maximum number of legal tag names per batch retrieve or validate request.
+MAX_LEGAL_TAGS_PER_REQUEST = 25
+
+
+class LegalCheckError(ValueError):
+    """Raised by the storage legal pre-flight check in 'reject' mode, before any record is sent.
+
+    - rejected: list of dicts containing the 'index' and 'id' of each invalid record, and the 'reason'.
+    """
+
+    def __init__(self, rejected: list):
+        reasons = '; '.join(f"{r['id'] or '#' + str(r['index'])}: {r['reason']}" for r in rejected[:5])
+        more = f' (and {len(rejected) - 5} more)' if len(rejected) > 5 else ''
+        super().__init__(f'{len(rejected)} record(s) failed the legal check: {reasons}{more}')
+        self.rejected = rejected
+
+
+class LegalService(BaseService):
+
+    def __init__(self, client, cache_ttl: float = 300):
+        """
+        :param cache_ttl:   Seconds for which the validity of a legal tag, and the legal properties, are cached.
+        """
+        super().__init__(client, 'legal', service_version=1)
+        self._cache_ttl = cache_ttl
+        self._cache_lock = threading.Lock()
+        # {(data partition, legal tag name): (expires at, reason or None if valid)}
+        self._validity = {}
+        # {data partition: (expires at, properties)}
+        self._properties = {}
+
+    @property
+    def cache_ttl(self) -> float:
+        return self._cache_ttl
+
+    @cache_ttl.setter
+    def cache_ttl(self, val: float):
+        self._cache_ttl = val
+
+    def get_legal_tag(self, name: str) -> dict:
+        """Returns the legal tag with the given name."""
+        url = f'{self._service_url}/legaltags/{name}'
+        response = self._request('get', url)
+        return response.json()
+
+    def list_legal_tags(self, valid: bool = True) -> List[dict]:
+        """Returns all legal tags of the data partition that are valid, or that are invalid if `valid` is False."""
+        url = f'{self._service_url}/legaltags'
+        response = self._request('get', url, params={'valid': str(valid).lower()})
+        return response.json()['legalTags']
+
+    def get_legal_tags(self, names: List[str]) -> List[dict]:
+        """Returns the legal tags with the given names, in batches of up to 25 names per request."""
+        url = f'{self._service_url}/legaltags:batchRetrieve'
+        legal_tags = []
+        for batch in chunked(names, MAX_LEGAL_TAGS_PER_REQUEST):
+            response = self._request('post', url, json={'names': batch})
+            legal_tags.extend(response.json()['legalTags'])
+        return legal_tags
+
+    def get_properties(self, use_cache: bool = True) -> dict:
+        """Returns the allowed values of legal tag properties: countriesOfOrigin, otherRelevantDataCountries,
+        securityClassifications, exportClassificationControlNumbers, personalDataTypes and dataTypes.
+        """
+        partition = self._client.data_partition_id
+        now = monotonic()
+        if use_cache:
+            with self._cache_lock:
+                cached = self._properties.get(partition)
+            if cached is not None and cached[0] > now:
+                return cached[1]
+
+        url = f'{self._service_url}/legaltags:properties'
+        properties = self._request('get', url).json()
+        with self._cache_lock:
+            self._properties[partition] = (now + self._cache_ttl, properties)
+        return properties
+
+    def validate_legal_tags(self, names: List[str], use_cache: bool = True) -> dict:
+        """Checks whether legal tags exist and are valid. Results are cached for `cache_ttl` seconds, so only names
+        that were not checked recently are sent to the legal service.
+
+        :returns:   dict of {name: reason} for the invalid legal tags. Empty if all are valid.
+        """
+        partition = self._client.data_partition_id
+        names = list(dict.fromkeys(names))
+        now = monotonic()
+        invalid = {}
+        unknown = []
+        with self._cache_lock:
+            for name in names:
+                cached = self._validity.get((partition, name)) if use_cache else None
+                if cached is None or cached[0] <= now:
+                    unknown.append(name)
+                elif cached[1] is not None:
+                    invalid[name] = cached[1]
+
+        url = f'{self._service_url}/legaltags:validate'
+        for batch in chunked(unknown, MAX_LEGAL_TAGS_PER_REQUEST):
+            response = self._request('post', url, json={'names': batch})
+            reasons = {tag['name']: tag.get('reason') or 'Invalid legal tag'
+                       for tag in response.json().get('invalidLegalTags', [])}
+            invalid.update(reasons)
+            expires_at = monotonic() + self._cache_ttl
+            with self._cache_lock:
+                for name in batch:
+                    self._validity[(partition, name)] = (expires_at, reasons.get(name))
+        return invalid
+
+    def clear_cache(self):
+        with self._cache_lock:
+            self._validity.clear()
+            self._properties.clear()
+
+    def check_records(self, records: List[dict]) -> list:
+        """Checks the legal section of records locally, using the cached legal tag validity and properties. Each
+        record needs at least one valid legal tag, and known country codes in 'otherRelevantDataCountries'.
+
+        :returns:   list of dicts containing the 'index' and 'id' of each invalid record, and the 'reason'.
+        """
+        names = {name for record in records for name in (record.get('legal') or {}).get('legaltags') or []}
+        invalid_tags = self.validate_legal_tags(sorted(names)) if names else {}
+        countries = None
+
+        rejected = []
+        for index, record in enumerate(records):
+            legal = record.get('legal') or {}
+            reasons = []
+            legal_tags = legal.get('legaltags') or []
+            if not legal_tags:
+                reasons.append('no legal tags')
+            for name in legal_tags:
+                if name in invalid_tags:
+                    reasons.append(f"invalid legal tag '{name}': {invalid_tags[name]}")
+            record_countries = legal.get('otherRelevantDataCountries') or []
+            if not record_countries:
+                reasons.append('no otherRelevantDataCountries')
+            elif countries is None:
+                countries = self.get_properties().get('otherRelevantDataCountries', {})
+            for code in record_countries:
+                if code not in countries:
+                    reasons.append(f"unknown country code '{code}' in otherRelevantDataCountries")
+            if reasons:
+                rejected.append({'index': index, 'id': record.get('id'), 'reason': '; '.join(reasons)})
+        return rejected
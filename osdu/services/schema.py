@@ -0,0 +1,164 @@
+""" Provides a simple Python interface to the OSDU Schema API, and local validation of records against the schema of
+their kind.
+
+Validation requires: `jsonschema>=4.18` (Python 3.8+), installed with `pip install 'osdupy[schema]'`
+"""
+import json
+import os
+import threading
+from typing import List
+from urllib.parse import quote
+
+import requests
+
+from .base import BaseService
+from ..utils import ordered_map
+
+
+class SchemaValidationError(ValueError):
+    """Raised by the storage schema pre-flight check in 'reject' mode, before any record is sent.
+
+    - rejected: list of dicts containing the 'index', 'id' and 'kind' of each invalid record, and its 'errors'.
+    """
+
+    def __init__(self, rejected: list):
+        first = rejected[0]
+        error = first['errors'][0]
+        super().__init__(f"{len(rejected)} record(s) failed schema validation, e.g. "
+                         f"{first['id'] or '#' + str(first['index'])} at '{error['path']}': {error['message']}")
+        self.rejected = rejected
+
+
+class SchemaService(BaseService):
+
+    def __init__(self, client, cache_dir: str = None):
+        """
+        :param cache_dir:   Optional directory in which fetched schemas are kept across runs. Schemas are immutable
+                            for a given kind version, so cached schemas never expire.
+        """
+        super().__init__(client, 'schema-service', service_version=1)
+        self._cache_dir = cache_dir
+        self._lock = threading.Lock()
+        # {kind: schema dict}
+        self._schemas = {}
+        # {kind: jsonschema validator, or None if the kind has no registered schema}
+        self._validators = {}
+
+    @property
+    def cache_dir(self) -> str:
+        return self._cache_dir
+
+    @cache_dir.setter
+    def cache_dir(self, val: str):
+        self._cache_dir = val
+
+    def get_schema(self, kind: str) -> dict:
+        """Returns the JSON schema of a kind, e.g. 'osdu:wks:master-data--Well:1.0.0', from the in-memory cache,
+        the disk cache or the schema service.
+        """
+        with self._lock:
+            schema = self._schemas.get(kind)
+        if schema is not None:
+            return schema
+
+        schema = self._read_cached_schema(kind)
+        if schema is None:
+            url = f'{self._service_url}/schema/{kind}'
+            schema = self._request('get', url).json()
+            self._write_cached_schema(kind, schema)
+        with self._lock:
+            self._schemas[kind] = schema
+        return schema
+
+    def validator(self, kind: str):
+        """Returns the compiled `jsonschema` validator for a kind, or None if the schema service has no schema for
+        it. Validators are built once per kind and reused. References to other schemas by kind, e.g.
+        `{"$ref": "osdu:wks:AbstractAccessControlList:1.0.0"}`, are resolved with get_schema.
+        """
+        with self._lock:
+            if kind in self._validators:
+                return self._validators[kind]
+        try:
+            from jsonschema import FormatChecker, validators
+            from referencing import Registry, Resource
+            from referencing.jsonschema import DRAFT7
+        except ImportError as e:
+            raise ImportError("Validating records requires jsonschema>=4.18: pip install 'osdupy[schema]'") from e
+
+        def retrieve(uri: str):
+            return Resource.from_contents(self.get_schema(uri), default_specification=DRAFT7)
+
+        try:
+            schema = self.get_schema(kind)
+        except requests.HTTPError as e:
+            if getattr(e.response, 'status_code', None) != 404:
+                raise
+            validator = None
+        else:
+            cls = validators.validator_for(schema)
+            cls.check_schema(schema)
+            validator = cls(schema, format_checker=FormatChecker(), registry=Registry(retrieve=retrieve))
+        with self._lock:
+            self._validators[kind] = validator
+        return validator
+
+    def validate_record(self, record: dict) -> list:
+        """Validates a record against the schema of its kind.
+
+        :returns:   list of dicts containing the 'path' (e.g. 'data.SpudDate') and 'message' of each error. Empty if
+                    the record is valid, or if its kind has no registered schema.
+        """
+        if not record.get('kind'):
+            return [{'path': 'kind', 'message': 'record has no kind'}]
+        validator = self.validator(record['kind'])
+        if validator is None:
+            return []
+        errors = sorted(validator.iter_errors(record), key=lambda e: list(map(str, e.absolute_path)))
+        return [{'path': '.'.join(str(part) for part in error.absolute_path), 'message': error.message}
+                for error in errors]
+
+    def validate_records(self, records: List[dict], max_workers: int = 4) -> list:
+        """Validates records against the schemas of their kinds. The schemas of distinct kinds are fetched
+        concurrently on `max_workers` threads, then the records are validated one after the other: validation is
+        CPU-bound, so more threads would not make it faster.
+
+        :returns:   list of dicts containing the 'index', 'id' and 'kind' of each invalid record, and its 'errors'
+                    as returned by validate_record.
+        """
+        kinds = list(dict.fromkeys(record.get('kind') for record in records if record.get('kind')))
+        list(ordered_map(self.validator, kinds, max_workers=max_workers))
+
+        rejected = []
+        for index, record in enumerate(records):
+            errors = self.validate_record(record)
+            if errors:
+                rejected.append({'index': index, 'id': record.get('id'), 'kind': record.get('kind'), 'errors': errors})
+        return rejected
+
+    def clear_cache(self):
+        """Clears the in-memory cache. The disk cache, if any, is kept."""
+        with self._lock:
+            self._schemas.clear()
+            self._validators.clear()
+
+    def _cache_path(self, kind: str) -> str:
+        return os.path.join(os.path.expanduser(self._cache_dir), quote(kind, safe='') + '.json')
+
+    def _read_cached_schema(self, kind: str) -> dict:
+        if self._cache_dir is None:
+            return None
+        try:
+            with open(self._cache_path(kind)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_cached_schema(self, kind: str, schema: dict):
+        if self._cache_dir is None:
+            return
+        path = self._cache_path(kind)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(schema, f)
+        os.replace(tmp_path, path)
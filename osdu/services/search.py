@@ -1,20 +1,84 @@
 """ Provides a simple Python interface to the OSDU Search API.
 """
-import requests
+import copy
+import json
+import os
+import re
+from collections import Counter, namedtuple
+from functools import reduce
+from typing import List
 from .base import BaseService
+from ..cache import fingerprint
+from ..models import Record, SearchResult
+from ..utils import ordered_map
+
+# Maximum number of results the search API returns for a single request.
+MAX_QUERY_LIMIT = 1000
+
+# Result of SearchService.plan().
+#   strategy:       'count' if no result pages need to be fetched, 'query' for a single query call, or
+#                   'cursor' for query_with_cursor paging.
+#   total_count:    totalCount reported by the count request.
+#   limit:          'limit' to send with each result request.
+#   query:          query body to send for the result pages.
+#   aggregations:   aggregations answered by the count request, if 'aggregateBy' was specified.
+#   max_results:        maximum number of results to return, or None for all.
+#   data_partition_id:  data partition to search, or None for the client's data partition.
+QueryPlan = namedtuple('QueryPlan', ['strategy', 'total_count', 'limit', 'query', 'aggregations', 'max_results',
+                                     'data_partition_id'])
+
+# Result of one query passed to SearchService.query_many().
+#   response:   the query response dict, or None if the query failed.
+#   error:      the exception raised by the query, or None if it succeeded.
+MultiQueryResult = namedtuple('MultiQueryResult', ['response', 'error'])
+
+# A 'field:value' clause of a Lucene query string, with a plain or double-quoted value.
+_FILTER_CLAUSE = re.compile(r'^([\w.\-]+):("(?:[^"\\]|\\.)*"|[^\s"*?\[\]{}()~^:\\]+)$')
+
+
+def build_query(kind: str = '*:*:*:*', query: str = None, returned_fields: list = None, aggregate_by: str = None,
+                sort: dict = None, spatial_filter: dict = None, limit: int = None) -> dict:
+    """Builds a search query body, only including the members that are given.
+
+    :param kind:            Kind to search, e.g. 'osdu:wks:master-data--Well:1.0.0'. Wildcards are supported.
+    :param query:           Lucene query string, e.g. 'data.FacilityName:"Well 1"'
+    :param returned_fields: Only return these fields for each result, e.g. ['id', 'data.FacilityName']
+    :param aggregate_by:    Field to aggregate result counts by.
+    :param sort:            dict with 'field' and 'order' lists.
+    :param spatial_filter:  Spatial filter as described in the OSDU query syntax.
+    :param limit:           Number of results to return. 0 to return only totalCount and aggregations.
+    """
+    body = {'kind': kind}
+    for key, val in (('query', query), ('returnedFields', returned_fields), ('aggregateBy', aggregate_by),
+                     ('sort', sort), ('spatialFilter', spatial_filter), ('limit', limit)):
+        if val is not None:
+            body[key] = val
+    return body
 
 
 class SearchService(BaseService):
 
     def __init__(self, client):
         super().__init__(client, 'search', service_version=2)
+        self._cache = None
+
+    @property
+    def cache(self):
+        """Optional `osdu.cache.SearchCache` used for query and completed query_with_paging result sets."""
+        return self._cache
 
-    def query(self, query: dict) -> dict:
+    @cache.setter
+    def cache(self, val):
+        self._cache = val
+
+    def query(self, query: dict, typed: bool = False, data_partition_id: str = None) -> dict:
         """Executes a query against the OSDU search service.
 
         :param query:   dict representing the JSON-style query to be sent to the search API. Must adhere to
                         the Lucene syntax suported by OSDU. For more details, see: 
                         https://community.opengroup.org/osdu/documentation/-/wikis/Releases/R2.0/OSDU-Query-Syntax
+        :param typed:   If True, return an `osdu.models.SearchResult` instead of a dict.
+        :param data_partition_id:   Data partition to search. Defaults to the client's data partition.
 
         :returns:       dict containing 3 items: aggregations, results, totalCount
                         - aggregations: dict:   returned only if 'aggregateBy' specified in query
@@ -23,18 +87,32 @@ class SearchService(BaseService):
                                                 query or the 1,000 record limit of the API
         """
         url = f'{self._service_url}/query'
-        response = requests.post(url=url, headers=self._headers(), json=query)
-        response.raise_for_status()
+        cache = self._cache
+        if cache is None:
+            response = self._request('post', url, data_partition_id, hedge=True, json=query)
+            response_values = response.json()
+        else:
+            key = cache.fingerprint(query, data_partition_id or self._client.data_partition_id)
+            content = cache.get(key)
+            if content is None:
+                response = self._request('post', url, data_partition_id, hedge=True, json=query)
+                content = response.content
+                cache.put(key, content)
+            response_values = json.loads(content)
 
-        return response.json()
+        if typed:
+            return SearchResult.from_dict(response_values)
+        return response_values
 
-    def query_with_paging(self, query: dict):
+    def query_with_paging(self, query: dict, typed: bool = False, data_partition_id: str = None):
         """Executes a query with cursor against the OSDU search service. Returns a generator, which can than be
         iterated over to retrieve each page in the result set without having to deal with any cursor.
 
         :param query:   dict representing the JSON-style query to be sent to the search API. Must adhere to
                         the Lucene syntax suported by OSDU. For more details, see: 
                         https://community.opengroup.org/osdu/documentation/-/wikis/Releases/R2.0/OSDU-Query-Syntax
+        :param typed:   If True, each page is a list of `osdu.models.Record` instead of dicts.
+        :param data_partition_id:   Data partition to search. Defaults to the client's data partition.
 
         :returns:       iterator of tuple containing 2 items: (results, totalCount)
                         - results:      list:   one page of records resutling from search query. Default page size
@@ -43,6 +121,190 @@ class SearchService(BaseService):
                         - totalCount:   int:    the total number of results despite any 'limit' specified in the
                                                 query or the 1,000 record limit of the API
         """
+        cache = self._cache
+        if cache is None:
+            yield from self._query_with_cursor(query, typed, data_partition_id)
+            return
+
+        key = cache.fingerprint(query, data_partition_id or self._client.data_partition_id, 'query_with_cursor')
+        pages = cache.get_pages(key)
+        if pages is not None:
+            for page in pages:
+                results = page['results']
+                if typed:
+                    results = [Record.from_dict(hit) for hit in results]
+                yield results, page['totalCount']
+            return
+
+        # Only result sets that are iterated to the end are cached.
+        writer = cache.page_writer(key)
+        completed = False
+        try:
+            for results, total_count in self._query_with_cursor(query, False, data_partition_id):
+                writer.append({'results': results, 'totalCount': total_count})
+                if typed:
+                    results = [Record.from_dict(hit) for hit in results]
+                yield results, total_count
+            completed = True
+        finally:
+            if completed:
+                writer.commit()
+            else:
+                writer.discard()
+
+    def map_pages(self, query: dict, func, max_workers: int = None, max_pending: int = None,
+                  data_partition_id: str = None):
+        """Pages through a search like query_with_paging, and applies `func` to the results of each page in a pool
+        of processes, so that CPU-heavy work on the results uses all cores. Pages are fetched in this process, and
+        at most `max_pending` pages are queued or being processed at any time.
+
+        :param func:        Function taking a list of result dicts. It must be picklable, i.e. defined at module
+                            level. To use a client inside it, bind one with functools.partial: clients are picklable.
+                            Each page is sent with the client's token as of when the page is submitted; a worker
+                            whose copy of the token expires refreshes it on its own.
+        :param max_workers: Number of processes. Defaults to the number of CPUs.
+        :param max_pending: Maximum number of pages in flight. Defaults to 2 * max_workers.
+        :returns:           iterator of the return values of `func`, in page order.
+        """
+        # Imported here, as it pulls in multiprocessing, which slows down `import osdu.client`.
+        from concurrent.futures import ProcessPoolExecutor
+
+        max_workers = max_workers or os.cpu_count() or 1
+        pages = (results for results, _ in self.query_with_paging(query, data_partition_id=data_partition_id))
+        yield from ordered_map(func, pages, max_workers=max_workers, max_pending=max_pending,
+                               executor_class=ProcessPoolExecutor)
+
+    def map_reduce(self, query: dict, mapper, reducer, initial, max_workers: int = None, max_pending: int = None,
+                   data_partition_id: str = None):
+        """Applies `mapper` to each page of search results in a pool of processes (see map_pages), and combines
+        the mapped values in this process, in page order, with `reducer(accumulated, value)` starting from `initial`.
+        """
+        values = self.map_pages(query, mapper, max_workers, max_pending, data_partition_id)
+        return reduce(reducer, values, initial)
+
+    def query_many(self, queries, max_workers: int = 8, merge_fields: List[str] = (), data_partition_id: str = None):
+        """Runs many independent queries concurrently. Identical query bodies are only sent once.
+
+        With `merge_fields`, count queries ('limit' 0, no 'aggregateBy') that differ only in the value of one
+        'field:value' clause on one of those fields, in a query string made of such clauses joined by AND, e.g.
+        'data.BasinID:"A" AND data.Status:Active' and 'data.BasinID:"B" AND data.Status:Active', are answered by a
+        single query that aggregates by that field. Their responses only contain 'results' (empty), 'totalCount' and
+        'aggregations' (None). Values that the aggregation does not account for are queried individually.
+
+        Only list keyword fields, which hold exact values such as ids, references and codes. A clause on an analyzed
+        text field also matches other values (e.g. 'data.Basin:"North"' matches "North Sea"), which the buckets of an
+        aggregation do not count, so merging it would change the result.
+
+        :param queries:         list or dict of query bodies.
+        :param max_workers:     Maximum number of concurrent requests.
+        :param merge_fields:    Keyword fields whose filter clauses may be merged into one aggregation. See above.
+        :param data_partition_id:   Data partition to search. Defaults to the client's data partition.
+        :returns:           list of MultiQueryResult in input order, or dict with the same keys if `queries` is a
+                            dict. Failed queries have their exception in 'error', and do not affect the others.
+        """
+        keys = list(queries) if isinstance(queries, dict) else None
+        bodies = [queries[key] for key in keys] if keys is not None else list(queries)
+        partition = data_partition_id or self._client.data_partition_id
+
+        # Distinct bodies by fingerprint, in order of first appearance.
+        unique = {}
+        for body in bodies:
+            unique.setdefault(fingerprint(body, partition), body)
+        groups = self._merge_groups(unique, set(merge_fields)) if merge_fields else []
+        merged = {key for group in groups for key in group['members']}
+        tasks = [('merged', group) for group in groups] + [('single', key) for key in unique if key not in merged]
+
+        def run(task):
+            kind, item = task
+            if kind == 'single':
+                return {item: self._query_outcome(unique[item], data_partition_id)}
+            return self._run_merged(item, unique, data_partition_id)
+
+        outcomes = {}
+        for results in ordered_map(run, tasks, max_workers=max_workers):
+            outcomes.update(results)
+
+        answered = set()
+        results = []
+        for body in bodies:
+            key = fingerprint(body, partition)
+            outcome = outcomes[key]
+            if key in answered and outcome.response is not None:
+                # Each duplicate gets its own copy, so callers can modify responses independently.
+                outcome = MultiQueryResult(copy.deepcopy(outcome.response), None)
+            answered.add(key)
+            results.append(outcome)
+        return dict(zip(keys, results)) if keys is not None else results
+
+    def _query_outcome(self, query: dict, data_partition_id: str) -> MultiQueryResult:
+        try:
+            return MultiQueryResult(self.query(query, data_partition_id=data_partition_id), None)
+        except Exception as e:
+            return MultiQueryResult(None, e)
+
+    def _run_merged(self, group: dict, unique: dict, data_partition_id: str) -> dict:
+        """Answers a group of count queries with one aggregateBy query. Returns {fingerprint: MultiQueryResult}."""
+        outcome = self._query_outcome(group['query'], data_partition_id)
+        if outcome.error is not None:
+            return {key: outcome for key in group['members']}
+
+        buckets = {str(bucket['key']): bucket['count'] for bucket in outcome.response.get('aggregations') or []}
+        # If the buckets add up to the total, values without a bucket have no matches. Otherwise the aggregation
+        # may have been truncated, and those values are queried individually.
+        complete = sum(buckets.values()) == outcome.response.get('totalCount')
+        results = {}
+        for key, value in group['members'].items():
+            if value in buckets or complete:
+                response = {'results': [], 'aggregations': None, 'totalCount': buckets.get(value, 0)}
+                results[key] = MultiQueryResult(response, None)
+            else:
+                results[key] = self._query_outcome(unique[key], data_partition_id)
+        return results
+
+    @staticmethod
+    def _merge_groups(unique: dict, merge_fields: set) -> list:
+        """Finds count queries that differ only by the value of one filter clause on one of `merge_fields`.
+
+        :returns:   list of dicts containing 'query' (the merged aggregateBy query) and 'members' ({fingerprint:
+                    filter value of that query}).
+        """
+        candidates = {}
+        for key, body in unique.items():
+            if body.get('limit') != 0 or 'aggregateBy' in body or not isinstance(body.get('query'), str):
+                continue
+            clauses = _parse_filter_clauses(body['query'])
+            if clauses is None:
+                continue
+            rest = json.dumps({k: v for k, v in body.items() if k != 'query'}, sort_keys=True)
+            options = []
+            for i, (field, value) in enumerate(clauses):
+                if field not in merge_fields:
+                    continue
+                others = tuple(sorted(f'{f}:{v}' for j, (f, v) in enumerate(clauses) if j != i))
+                options.append(((rest, others, field), value))
+            if options:
+                candidates[key] = options
+
+        # Assign each query to the grouping it shares with the most other queries.
+        sizes = Counter(group_key for options in candidates.values() for group_key, _ in options)
+        groups = {}
+        for key, options in candidates.items():
+            group_key, value = max(options, key=lambda option: sizes[option[0]])
+            if sizes[group_key] > 1:
+                groups.setdefault(group_key, {})[key] = _unquote(value)
+
+        merged = []
+        for (rest, others, field), members in groups.items():
+            if len(members) < 2 or len(set(members.values())) < len(members):
+                continue
+            query = json.loads(rest)
+            if others:
+                query['query'] = ' AND '.join(others)
+            query['aggregateBy'] = field
+            merged.append({'query': query, 'members': members})
+        return merged
+
+    def _query_with_cursor(self, query: dict, typed: bool, data_partition_id: str):
         url = f'{self._service_url}/query_with_cursor'
         # Initial cursor can be anything, as it is only for the while-loop condition and does not get sent
         # in the request. A non-empty string value helps prevent accidents like sloppy/implicit
@@ -53,9 +315,7 @@ class SearchService(BaseService):
             if cursor != 'initial':
                 query['cursor'] = cursor
 
-            response = requests.post(
-                url=url, headers=self._headers(), json=query)
-            response.raise_for_status()
+            response = self._request('post', url, data_partition_id, json=query)
 
             response_values: dict = response.json()
             # In older versions of OSDU, no cursor was returned on the last page. In newer versions, a null cursor is returned.
@@ -63,5 +323,111 @@ class SearchService(BaseService):
 
             if 'results' in response_values and 'totalCount' in response_values:
                 results = response_values['results']
+                if typed:
+                    results = [Record.from_dict(hit) for hit in results]
                 total_count = response_values['totalCount']
                 yield results, total_count
+
+    def count(self, query: dict, data_partition_id: str = None) -> dict:
+        """Returns only the totalCount (and aggregations, if 'aggregateBy' is specified) for the given query
+        without fetching any results.
+
+        :param data_partition_id:   Data partition to search. Defaults to the client's data partition.
+        :returns:                   dict containing 'totalCount' and 'aggregations'.
+        """
+        count_query = {k: v for k, v in query.items() if k not in ('returnedFields', 'sort', 'cursor', 'offset')}
+        count_query['limit'] = 0
+
+        return self.query(count_query, data_partition_id=data_partition_id)
+
+    def plan(self, query: dict, max_results: int = None, data_partition_id: str = None) -> QueryPlan:
+        """Runs a count for the given query and decides how to fetch its results with as few requests as possible.
+
+        A query with 'limit' 0 is answered by the count request alone. Otherwise, result sets that fit in a single
+        request are fetched with one query call, and larger ones with the cursor API using the largest page size.
+        Any 'aggregateBy' is answered by the count request and is not repeated for the result pages.
+
+        :param query:               dict representing the JSON-style query. The planner chooses the page size
+                                    itself; a 'limit' in the query caps the number of results like max_results.
+                                    Use 'returnedFields' to fetch only the fields you need.
+        :param max_results:         Maximum number of results to fetch. Defaults to all results.
+        :param data_partition_id:   Data partition to search. Defaults to the client's data partition.
+        :returns:                   QueryPlan to pass to execute().
+        """
+        if 'offset' in query:
+            raise ValueError("Planned queries do not support 'offset'. Use 'max_results' instead.")
+        if query.get('limit') is not None:
+            max_results = query['limit'] if max_results is None else min(max_results, query['limit'])
+
+        count = self.count(query, data_partition_id)
+        total_count = count.get('totalCount', 0)
+        wanted = total_count if max_results is None else min(total_count, max_results)
+        page_query = {k: v for k, v in query.items() if k not in ('aggregateBy', 'limit', 'cursor')}
+
+        if wanted == 0:
+            strategy, limit = 'count', 0
+        elif wanted <= MAX_QUERY_LIMIT:
+            strategy, limit = 'query', wanted
+        else:
+            strategy, limit = 'cursor', MAX_QUERY_LIMIT
+        page_query['limit'] = limit
+
+        return QueryPlan(strategy, total_count, limit, page_query, count.get('aggregations'), max_results,
+                         data_partition_id)
+
+    def execute(self, plan: QueryPlan, typed: bool = False):
+        """Fetches the results for a QueryPlan.
+
+        :returns:       iterator of tuple containing 2 items: (results, totalCount), as for query_with_paging.
+                        Nothing is yielded for 'count' plans; use the plan's total_count and aggregations.
+        """
+        if plan.strategy == 'query':
+            response = self.query(dict(plan.query), typed=typed, data_partition_id=plan.data_partition_id)
+            if typed:
+                yield response.results, response.total_count
+            else:
+                yield response['results'], response['totalCount']
+        elif plan.strategy == 'cursor':
+            remaining = plan.max_results
+            for results, total_count in self.query_with_paging(dict(plan.query), typed=typed,
+                                                               data_partition_id=plan.data_partition_id):
+                if remaining is not None:
+                    results = results[:remaining]
+                    remaining -= len(results)
+                yield results, total_count
+                if remaining is not None and remaining <= 0:
+                    break
+
+    def query_planned(self, query: dict, max_results: int = None, typed: bool = False, data_partition_id: str = None):
+        """Plans and executes the given query. See plan() for details.
+
+        :returns:       iterator of tuple containing 2 items: (results, totalCount), as for query_with_paging.
+        """
+        return self.execute(self.plan(query, max_results, data_partition_id), typed=typed)
+
+    def aggregate(self, query: dict, aggregate_by: str, data_partition_id: str = None) -> list:
+        """Returns the aggregation buckets for the given field without fetching any results.
+
+        :param data_partition_id:   Data partition to search. Defaults to the client's data partition.
+        :returns:                   list of dicts containing 'key' and 'count'.
+        """
+        return self.count(dict(query, aggregateBy=aggregate_by), data_partition_id).get('aggregations') or []
+
+
+def _parse_filter_clauses(query_string: str):
+    """Splits a Lucene query string made only of 'field:value' clauses joined by AND. Returns a list of (field,
+    value) tuples, or None if the query string has any other form.
+    """
+    clauses = []
+    for clause in re.split(r'\s+AND\s+', query_string.strip()):
+        match = _FILTER_CLAUSE.match(clause)
+        if match is None:
+            return None
+        clauses.append((match.group(1), match.group(2)))
+    return clauses
+
+
+def _unquote(value: str) -> str:
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return re.sub(r'\\(.)', r'\1', value[1:-1])
+    return value
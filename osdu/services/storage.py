@@ -1,36 +1,284 @@
 """ Provides a simple Python interface to the OSDU Storage API.
 """
-from typing import List
+import copy
+import re
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, List
+
 import requests
+
 from .base import BaseService
+from .search import MAX_QUERY_LIMIT
+from ..loader import BatchLoader
+from ..models import Record, RecordsResult
+from ..utils import RateLimiter, chunked, diff_records, ordered_map
+
+if TYPE_CHECKING:
+    from ..hash_index import ContentHashIndex
+
+# Maximum number of record ids accepted by a single query/records request.
+MAX_RECORDS_PER_REQUEST = 100
+
+# Maximum number of records accepted by a single store_records request.
+MAX_STORE_RECORDS = 500
+
+# Matches references to other records, e.g. 'opendes:master-data--Well:1234:' or
+# 'opendes:reference-data--UnitOfMeasure:m:1600000000000'. The trailing ':{version}' is required, but may be empty.
+REFERENCE_PATTERN = re.compile(r'^[\w\-\.]+:[\w\-\.]+--[\w\-\.]+:[\w\-\.\:\%]+:[0-9]*$')
+
+# Number of specific record versions kept in memory by get_records_history. Versions never change once written.
+VERSION_CACHE_SIZE = 4096
+
+
+class BulkReport:
+    """Outcome of a bulk delete or purge.
+
+    - succeeded:    list of record ids processed successfully in this run.
+    - failed:       dict of {record id: error message} for records that failed in this run.
+    - skipped:      number of record ids skipped because the checkpoint shows they already succeeded.
+    - pending:      for dry runs, the number of record ids that would have been processed.
+    """
+
+    def __init__(self, dry_run: bool = False):
+        self.dry_run = dry_run
+        self.succeeded = []
+        self.failed = {}
+        self.skipped = 0
+        self.pending = 0
+
+    def __repr__(self):
+        return (f'BulkReport(dry_run={self.dry_run}, succeeded={len(self.succeeded)}, failed={len(self.failed)}, '
+                f'skipped={self.skipped}, pending={self.pending})')
 
 
 class StorageService(BaseService):
 
     def __init__(self, client):
         super().__init__(client, service_name='storage', service_version=2)
+        self._loader = None
+        self._legal_check = None
+        self._schema_validation = None
+        self._schema_validation_workers = 4
+        self._version_cache = OrderedDict()
+        self._version_cache_lock = threading.Lock()
+
+    @property
+    def loader(self):
+        """The `osdu.loader.BatchLoader` used by get_record if batching is enabled, otherwise None."""
+        return self._loader
+
+    def enable_batching(self, window: float = 0.005, max_batch_size: int = MAX_RECORDS_PER_REQUEST):
+        """Batches get_record calls made concurrently from multiple threads. Calls arriving within `window`
+        seconds of each other (up to `max_batch_size` distinct ids) are fetched with a single get_records request,
+        and identical ids are only fetched once.
+        """
+        self._loader = BatchLoader(self._get_records_by_id, window=window, max_batch_size=max_batch_size)
 
-    def get_record(self, record_id: str):
-        """Returns the latest version of the given record."""
+    def disable_batching(self):
+        if self._loader is not None:
+            self._loader.flush()
+        self._loader = None
+
+    @property
+    def legal_check(self) -> str:
+        """Mode of the legal pre-flight check of store_records: 'reject', 'split', or None if disabled."""
+        return self._legal_check
+
+    def enable_legal_check(self, mode: str = 'reject'):
+        """Checks the legal tags and otherRelevantDataCountries of records in store_records before sending them,
+        using the legal service's cached validity of each legal tag. See `LegalService.check_records`.
+
+        :param mode:    'reject' to raise `osdu.services.legal.LegalCheckError` without storing anything if any record
+                        is invalid, or 'split' to store only the valid records and return the others as
+                        'rejectedRecords'.
+        """
+        if mode not in ('reject', 'split'):
+            raise ValueError("mode must be 'reject' or 'split'")
+        self._legal_check = mode
+
+    def disable_legal_check(self):
+        self._legal_check = None
+
+    @property
+    def schema_validation(self) -> str:
+        """Mode of the schema pre-flight validation of store_records: 'reject', 'split', or None if disabled."""
+        return self._schema_validation
+
+    def enable_schema_validation(self, mode: str = 'reject', max_workers: int = 4):
+        """Validates records in store_records against the schemas of their kinds before sending them, using the
+        schema service's cached validators. See `SchemaService.validate_records`. Requires `jsonschema`.
+
+        :param mode:        'reject' to raise `osdu.services.schema.SchemaValidationError` without storing anything if
+                            any record is invalid, or 'split' to store only the valid records and return the others
+                            as 'rejectedRecords'.
+        :param max_workers: Number of threads fetching the schemas of distinct kinds.
+        """
+        if mode not in ('reject', 'split'):
+            raise ValueError("mode must be 'reject' or 'split'")
+        self._schema_validation = mode
+        self._schema_validation_workers = max_workers
+
+    def disable_schema_validation(self):
+        self._schema_validation = None
+
+    def get_record(self, record_id: str, typed: bool = False):
+        """Returns the latest version of the given record. If `typed`, returns an `osdu.models.Record`."""
+        if self._loader is not None:
+            record = self._loader.load(record_id)
+        else:
+            record = self._get_record(record_id)
+
+        if typed:
+            return Record.from_dict(record)
+        return record
+
+    def _get_record(self, record_id: str) -> dict:
         url = f'{self._service_url}/records/{record_id}'
-        response = self.__execute_request('get', url)
+        response = self.__execute_request('get', url, hedge=True)
 
         return response.json()
 
-    def get_records(self, record_ids: List[str], attributes: List[str] = []):
+    def _get_records_by_id(self, record_ids: List[str]) -> dict:
+        """Batch function for the get_record loader."""
+        records = {record['id']: record for record in self.get_records(record_ids)['records']}
+        for record_id in record_ids:
+            if record_id not in records:
+                # Fall back to a single request for ids that the batch did not return, so that the caller gets
+                # the same error (e.g. 404) it would have got without batching.
+                try:
+                    records[record_id] = self._get_record(record_id)
+                except Exception as e:
+                    records[record_id] = e
+        return records
+
+    def get_records(self, record_ids: List[str], attributes: List[str] = [], typed: bool = False,
+                    data_partition_id: str = None):
         """Fetches multiple records at once.
 
         :param record_ids:  List of record ids. Each record id must follow the naming convention {OSDU-Account-Id}:{dataset-name}:{record-type}:{version}.
                             example: tenant1:well:123456789
         :param attributes:  Filter attributes to restrict the returned fields of the record. Usage: data.{record-data-field-name}.
                             example: data.wellName
+        :param typed:       If True, return an `osdu.models.RecordsResult` instead of a dict.
+        :param data_partition_id:   Data partition to fetch from. Defaults to the client's data partition.
         """
         url = f'{self._service_url}/query/records'
         payload = {'records': record_ids, 'attributes': attributes}
-        response = self.__execute_request('post', url, json=payload)
+        response = self.__execute_request('post', url, json=payload, data_partition_id=data_partition_id, hedge=True)
 
+        if typed:
+            return RecordsResult.from_dict(response.json())
         return response.json()
 
+    def fetch_records(self, record_ids, attributes: List[str] = [], batch_size: int = MAX_RECORDS_PER_REQUEST,
+                      max_workers: int = 4, data_partition_id: str = None):
+        """Fetches any number of records with concurrent get_records calls of up to `batch_size` ids each.
+
+        :param record_ids:  Iterable of record ids. It is consumed lazily, so it may be a generator.
+        :param attributes:  Filter attributes to restrict the returned fields, as for get_records.
+        :param batch_size:  Number of record ids per get_records call.
+        :param max_workers: Maximum number of concurrent get_records calls.
+        :param data_partition_id:   Data partition to fetch from. Defaults to the client's data partition.
+        :returns:           iterator of record dicts, in the order of the batches they were requested in. Records
+                            that could not be fetched are omitted.
+        """
+        def fetch_batch(batch):
+            return self.get_records(batch, attributes, data_partition_id=data_partition_id)['records']
+
+        for records in ordered_map(fetch_batch, chunked(record_ids, batch_size), max_workers=max_workers):
+            yield from records
+
+    def expand_references(self, records_or_ids, depth: int = 1, strip_version: bool = True,
+                          field_pattern: str = r'IDs?$', batch_size: int = MAX_RECORDS_PER_REQUEST,
+                          max_workers: int = 4) -> dict:
+        """Resolves the records referenced by the given records, e.g. through data.WellID or data.WellboreID, level
+        by level. Each referenced id is only fetched once across the whole set, and each level is fetched with
+        concurrent get_records batches.
+
+        :param records_or_ids:  Iterable of record dicts and/or record ids to start from. Ids are fetched first.
+        :param depth:           Number of levels of references to follow.
+        :param strip_version:   If True, strip the ':{version}' suffix of references, so that the latest version of
+                                each referenced record is fetched. If False, references with a version are fetched
+                                at that version with get_record_version, and stored under '{id}:{version}'; those
+                                with an empty version still resolve to the latest version.
+        :param field_pattern:   Regex matched against the names of data fields holding references.
+        :param batch_size:      Number of record ids per get_records call.
+        :param max_workers:     Maximum number of concurrent get_records calls.
+        :returns:               dict of {record id: record} with the starting records and all resolved references.
+                                References that could not be fetched are omitted.
+        """
+        field_regex = re.compile(field_pattern)
+        records = {}
+        to_fetch = []
+        for item in records_or_ids:
+            if isinstance(item, Record):
+                item = item.to_dict()
+            if isinstance(item, dict):
+                records[item['id']] = item
+            else:
+                to_fetch.append(item)
+        frontier = list(records.values())
+        frontier.extend(self._fetch_new(to_fetch, records, batch_size, max_workers))
+
+        for _ in range(depth):
+            references = set()
+            for record in frontier:
+                references.update(self._find_references(record.get('data'), field_regex, strip_version))
+            frontier = self._fetch_new([record_id for record_id, version in references if not version], records,
+                                       batch_size, max_workers)
+            frontier.extend(self._fetch_new_versions([reference for reference in references if reference[1]],
+                                                     records, max_workers))
+            if not frontier:
+                break
+        return {record_id: record for record_id, record in records.items() if record is not None}
+
+    def _fetch_new(self, record_ids, records: dict, batch_size: int, max_workers: int) -> list:
+        """Fetches the ids not in `records` yet, adds them to `records` and returns the fetched records."""
+        new_ids = sorted(set(record_ids) - set(records))
+        fetched = list(self.fetch_records(new_ids, batch_size=batch_size, max_workers=max_workers))
+        for record in fetched:
+            records[record['id']] = record
+        # Also remember ids that could not be fetched, so they are not requested again at the next level.
+        for record_id in new_ids:
+            records.setdefault(record_id, None)
+        return fetched
+
+    def _fetch_new_versions(self, references, records: dict, max_workers: int) -> list:
+        """Fetches the (record id, version) references not in `records` yet, adds them to `records` under
+        '{id}:{version}' and returns the fetched records. Versions that do not exist are remembered as None.
+        """
+        new_references = sorted(reference for reference in set(references) if '{}:{}'.format(*reference) not in records)
+
+        def fetch(reference):
+            try:
+                return self._get_cached_record_version(*reference)
+            except requests.HTTPError as e:
+                if e.response is not None and e.response.status_code == 404:
+                    return None
+                raise
+
+        fetched = []
+        for (record_id, version), record in zip(new_references,
+                                                ordered_map(fetch, new_references, max_workers=max_workers)):
+            records[f'{record_id}:{version}'] = record
+            if record is not None:
+                fetched.append(record)
+        return fetched
+
+    @classmethod
+    def _find_references(cls, value, field_regex, strip_version: bool, field: str = ''):
+        """Yields a (record id, version) tuple for each reference, with an empty version if it is stripped."""
+        if isinstance(value, dict):
+            for key, child in value.items():
+                yield from cls._find_references(child, field_regex, strip_version, key)
+        elif isinstance(value, list):
+            for child in value:
+                yield from cls._find_references(child, field_regex, strip_version, field)
+        elif isinstance(value, str) and field_regex.search(field) and REFERENCE_PATTERN.match(value):
+            record_id, _, version = value.rpartition(':')
+            yield record_id, '' if strip_version else version
+
     def query_all_kinds(self):
         """Returns a list of all kinds in the current data partition."""
         url = f'{self._service_url}/query/kinds'
@@ -43,11 +291,120 @@ class StorageService(BaseService):
         in the Data Ecosystem, then a new record is created. If the id is related to an existing record in the Data 
         Ecosystemthen an update operation takes place and a new version of the record is created.
 
+        :param records: List of record dicts and/or `osdu.models.Record` objects.
+        :raises osdu.services.legal.LegalCheckError:    If the legal check is enabled in 'reject' mode and any
+                                                        record has invalid legal tags or countries.
+        :raises osdu.services.schema.SchemaValidationError: If schema validation is enabled in 'reject' mode and any
+                                                            record does not match the schema of its kind.
         """
         url = f'{self._service_url}/records'
-        response = self.__execute_request('put', url, json=records)
+        records = [record.to_dict() if isinstance(record, Record) else record for record in records]
+        if self._legal_check is None and self._schema_validation is None:
+            return self.__execute_request('put', url, json=records).json()
 
-        return response.json()
+        records, rejected = self._preflight(records)
+        if records:
+            result = self.__execute_request('put', url, json=records).json()
+        else:
+            result = {'recordCount': 0, 'recordIds': [], 'skippedRecordIds': []}
+        result['rejectedRecords'] = rejected
+        return result
+
+    def _preflight(self, records: List[dict]):
+        """Runs the enabled legal and schema checks. Returns the records that passed, and the rejected ones with
+        'index' relative to the given list.
+        """
+        if self._legal_check is None and self._schema_validation is None:
+            return records, []
+        # Only imported once a check is enabled, to keep `import osdu.client` fast.
+        from .legal import LegalCheckError
+        from .schema import SchemaValidationError
+
+        checks = [
+            (self._legal_check, self._client.legal.check_records, LegalCheckError),
+            (self._schema_validation,
+             lambda batch: self._client.schema.validate_records(batch, self._schema_validation_workers),
+             SchemaValidationError),
+        ]
+        positions = list(range(len(records)))
+        rejected = []
+        for mode, check, error in checks:
+            if mode is None or not records:
+                continue
+            problems = check(records)
+            for problem in problems:
+                problem['index'] = positions[problem['index']]
+            if problems and mode == 'reject':
+                raise error(problems)
+            rejected_indexes = {problem['index'] for problem in problems}
+            kept = [(position, record) for position, record in zip(positions, records)
+                    if position not in rejected_indexes]
+            positions = [position for position, _ in kept]
+            records = [record for _, record in kept]
+            rejected.extend(problems)
+        rejected.sort(key=lambda problem: problem['index'])
+        return records, rejected
+
+    def upsert_records(self, records, index: 'ContentHashIndex', batch_size: int = MAX_STORE_RECORDS,
+                       fetch_missing: bool = True) -> dict:
+        """Stores only the records whose content (kind, acl, legal, data, ancestry, meta, tags) changed since they were
+        last stored through the given index, so unchanged records do not create new record versions.
+
+        The index only knows about writes made through it. Records changed on the server by anyone else are not
+        detected unless they are also changed locally.
+
+        :param records:         Iterable of record dicts and/or `osdu.models.Record` objects. Consumed in batches.
+        :param index:           ContentHashIndex holding the hash of the last stored content of each record id.
+        :param batch_size:      Number of records per store_records request.
+        :param fetch_missing:   If True, records that are not in the index yet are fetched with get_records and their
+                                current content is added to the index before comparing, e.g. on the first run.
+        :returns:               dict containing:
+                                - recordCount:      int:    number of records stored
+                                - recordIds:        list:   ids of the records stored
+                                - skippedRecordIds: list:   ids of the unchanged records that were not sent
+                                - rejectedRecords:  list:   records rejected by the legal check or schema validation
+                                                            (see store_records), with 'index' relative to `records`
+        """
+        from ..hash_index import content_hash
+
+        result = {'recordCount': 0, 'recordIds': [], 'skippedRecordIds': [], 'rejectedRecords': []}
+        offset = 0
+        for batch in chunked(records, batch_size):
+            batch_offset = offset
+            offset += len(batch)
+            batch = [record.to_dict() if isinstance(record, Record) else record for record in batch]
+            hashes = [content_hash(record) for record in batch]
+            record_ids = [record['id'] for record in batch if record.get('id')]
+            known = index.get_many(record_ids)
+
+            missing = [record_id for record_id in record_ids if record_id not in known]
+            if fetch_missing and missing:
+                current = {record['id']: content_hash(record) for record in self.fetch_records(missing)}
+                index.set_many(current)
+                known.update(current)
+
+            changed = [(position, record, digest) for position, (record, digest) in enumerate(zip(batch, hashes))
+                       if not record.get('id') or known.get(record['id']) != digest]
+            result['skippedRecordIds'].extend(
+                record['id'] for record, digest in zip(batch, hashes)
+                if record.get('id') and known.get(record['id']) == digest)
+            if not changed:
+                continue
+
+            response = self.store_records([record for _, record, _ in changed])
+            rejected = response.get('rejectedRecords') or []
+            for problem in rejected:
+                result['rejectedRecords'].append(dict(problem, index=batch_offset + changed[problem['index']][0]))
+            rejected_indexes = {problem['index'] for problem in rejected}
+            accepted = [item for i, item in enumerate(changed) if i not in rejected_indexes]
+            stored_ids = response.get('recordIds') or []
+            # Stored record ids are returned in the order the accepted records were sent. Generated ids are only
+            # known from that order.
+            index.set_many({record.get('id') or stored_id: digest
+                            for stored_id, (_, record, digest) in zip(stored_ids, accepted)})
+            result['recordCount'] += response.get('recordCount', len(stored_ids))
+            result['recordIds'].extend(stored_ids)
+        return result
 
     def delete_record(self, record_id: str) -> bool:
         """Performs a logical deletion of the given record. This operation can be reverted later.
@@ -69,6 +426,85 @@ class StorageService(BaseService):
 
         return response.status_code == 204
 
+    def delete_records(self, record_ids=None, query: dict = None, max_workers: int = 8, rate_limit: float = None,
+                       checkpoint=None, dry_run: bool = False) -> BulkReport:
+        """Performs a logical deletion of many records concurrently. See delete_record.
+
+        :param record_ids:  Iterable of record ids to delete. Consumed lazily, so it may be a generator.
+        :param query:       Search query whose results should be deleted, instead of record_ids.
+        :param max_workers: Maximum number of concurrent delete requests.
+        :param rate_limit:  Maximum number of delete requests per second. Defaults to no limit.
+        :param checkpoint:  `osdu.checkpoint.Checkpoint` or path of a checkpoint file. Each outcome is recorded in it,
+                            and records that already succeeded in a previous run are skipped.
+        :param dry_run:     If True, only count the records that would be deleted.
+        :returns:           BulkReport
+        """
+        return self._bulk(self.delete_record, record_ids, query, max_workers, rate_limit, checkpoint, dry_run)
+
+    def purge_records(self, record_ids=None, query: dict = None, max_workers: int = 8, rate_limit: float = None,
+                      checkpoint=None, dry_run: bool = False) -> BulkReport:
+        """Performs the physical deletion of many records and all of their versions concurrently. This operation
+        cannot be undone. Takes the same arguments as delete_records.
+
+        :returns:           BulkReport
+        """
+        return self._bulk(self.purge_record, record_ids, query, max_workers, rate_limit, checkpoint, dry_run)
+
+    def _bulk(self, operation, record_ids, query, max_workers, rate_limit, checkpoint, dry_run) -> BulkReport:
+        if (record_ids is None) == (query is None):
+            raise ValueError("Exactly one of 'record_ids' or 'query' must be provided.")
+        if query is not None:
+            record_ids = self._search_record_ids(query)
+        owns_checkpoint = isinstance(checkpoint, str)
+        if owns_checkpoint:
+            from ..checkpoint import Checkpoint
+            checkpoint = Checkpoint(checkpoint)
+        limiter = RateLimiter(rate_limit) if rate_limit else None
+        report = BulkReport(dry_run)
+
+        def remaining_ids():
+            for record_id in record_ids:
+                if checkpoint is not None and checkpoint.succeeded(record_id):
+                    report.skipped += 1
+                else:
+                    yield record_id
+
+        def run(record_id):
+            if limiter is not None:
+                limiter.acquire()
+            try:
+                ok = operation(record_id)
+                error = None if ok else 'Unexpected response status'
+            except Exception as e:
+                ok, error = False, str(e)
+            if checkpoint is not None:
+                checkpoint.record(record_id, ok, error)
+            return record_id, ok, error
+
+        try:
+            if dry_run:
+                report.pending = sum(1 for _ in remaining_ids())
+                return report
+
+            for record_id, ok, error in ordered_map(run, remaining_ids(), max_workers=max_workers):
+                if ok:
+                    report.succeeded.append(record_id)
+                else:
+                    report.failed[record_id] = error
+            return report
+        finally:
+            if owns_checkpoint:
+                checkpoint.close()
+            elif checkpoint is not None:
+                checkpoint.flush()
+
+    def _search_record_ids(self, query: dict):
+        id_query = dict(query, returnedFields=['id'], limit=MAX_QUERY_LIMIT)
+        id_query.pop('cursor', None)
+        for results, _ in self._client.search.query_with_paging(id_query):
+            for result in results:
+                yield result['id']
+
     def get_all_record_versions(self, record_id: str):
         """Returns a list containing all versions for the given record id."""
         url = f'{self._service_url}/records/versions/{record_id}'
@@ -76,16 +512,69 @@ class StorageService(BaseService):
 
         return response.json()
 
-    def get_record_version(self, record_id: str, version: str):
-        """Retrieves the specific version of the given record."""
+    def get_record_version(self, record_id: str, version: str, typed: bool = False):
+        """Retrieves the specific version of the given record. If `typed`, returns an `osdu.models.Record`."""
         url = f'{self._service_url}/records/{record_id}/{version}'
         response = self.__execute_request('get', url)
 
+        if typed:
+            return Record.from_dict(response.json())
         return response.json()
 
-    def __execute_request(self, method: str, url: str, json=None):
-        headers = self._headers()
-        response = requests.request(method, url, headers=headers, json=json)
-        response.raise_for_status()
+    def get_records_history(self, record_ids, versions=None, diff: bool = False, max_workers: int = 8) -> dict:
+        """Fetches the version history of many records concurrently. Version lists are fetched first, then the
+        selected versions are fetched in parallel. Fetched versions are cached, as they never change.
+
+        :param record_ids:  Iterable of record ids. Repeated ids are fetched once.
+        :param versions:    Which versions to fetch for each record. None for all versions, an int N for the latest
+                            N versions, or a callable taking (record_id, versions) and returning the versions to fetch.
+        :param diff:        If True, include the changes from the previous fetched version with each version.
+        :param max_workers: Maximum number of concurrent requests.
+        :returns:           dict of {record id: list of versions, oldest first}. Each version is a dict containing:
+                            - version:  the version number
+                            - record:   dict of the record at that version
+                            - changes:  only if diff, list of changes from the previous version as returned by
+                                        osdu.utils.diff_records, or None for the first version
+        """
+        record_ids = list(dict.fromkeys(record_ids))
+        version_lists = ordered_map(self.get_all_record_versions, record_ids, max_workers=max_workers)
+        selected = {}
+        for record_id, version_list in zip(record_ids, version_lists):
+            all_versions = sorted(version_list.get('versions') or [])
+            if versions is None:
+                selected[record_id] = all_versions
+            elif callable(versions):
+                selected[record_id] = sorted(versions(record_id, all_versions))
+            else:
+                selected[record_id] = all_versions[-versions:] if versions > 0 else []
+
+        pairs = [(record_id, version) for record_id in record_ids for version in selected[record_id]]
+        fetched = ordered_map(lambda pair: self._get_cached_record_version(*pair), pairs, max_workers=max_workers)
+
+        history = {record_id: [] for record_id in record_ids}
+        for (record_id, version), record in zip(pairs, fetched):
+            entry = {'version': version, 'record': record}
+            if diff:
+                previous = history[record_id][-1]['record'] if history[record_id] else None
+                entry['changes'] = diff_records(previous, record) if previous is not None else None
+            history[record_id].append(entry)
+        return history
+
+    def _get_cached_record_version(self, record_id: str, version) -> dict:
+        key = (record_id, str(version))
+        with self._version_cache_lock:
+            record = self._version_cache.get(key)
+            if record is not None:
+                self._version_cache.move_to_end(key)
+        if record is None:
+            record = self.get_record_version(record_id, version)
+            with self._version_cache_lock:
+                self._version_cache[key] = record
+                while len(self._version_cache) > VERSION_CACHE_SIZE:
+                    self._version_cache.popitem(last=False)
+        # Callers get a copy, so that changes they make never leak into the cache.
+        return copy.deepcopy(record)
 
-        return response
+    def __execute_request(self, method: str, url: str, json=None, data_partition_id: str = None,
+                          hedge: bool = False):
+        return self._request(method, url, data_partition_id, hedge=hedge, json=json)
@@ -0,0 +1,156 @@
+""" Incremental sync of records that changed since the previous run.
+
+Usage:
+    from osdu.sync import IncrementalSync, WatermarkStore
+
+    sync = IncrementalSync(osdu_client, WatermarkStore('sync-state.json'))
+    for record in sync.changes({'kind': 'osdu:wks:master-data--Well:1.0.0'}):
+        # Do stuff with each new or updated record...
+"""
+import json
+import os
+import threading
+
+from .cache import fingerprint
+from .services.search import MAX_QUERY_LIMIT
+from .services.storage import MAX_RECORDS_PER_REQUEST
+
+
+class WatermarkStore:
+    """Small JSON file that maps sync keys to the highest watermark value seen for them."""
+
+    def __init__(self, path: str):
+        self._path = path
+        self._lock = threading.Lock()
+        self._state = {}
+        if os.path.exists(path):
+            with open(path, 'r') as _file:
+                self._state = json.load(_file)
+
+    def get(self, key: str):
+        with self._lock:
+            return self._state.get(key)
+
+    def set(self, key: str, value):
+        with self._lock:
+            self._state[key] = value
+            self._save()
+
+    def delete(self, key: str):
+        with self._lock:
+            if self._state.pop(key, None) is not None:
+                self._save()
+
+    def _save(self):
+        # Write to a temporary file first, so a crash never leaves a truncated state file behind.
+        tmp_path = f'{self._path}.tmp'
+        with open(tmp_path, 'w') as _file:
+            json.dump(self._state, _file, indent=2, sort_keys=True)
+        os.replace(tmp_path, self._path)
+
+
+class IncrementalSync:
+    """Fetches only the records matching a query that changed since the last completed run.
+
+    A watermark (the highest value of `watermark_field` seen) is kept per query in a WatermarkStore. Each run
+    searches for records above the watermark, fetches their full bodies with StorageService.get_records and
+    advances the watermark once all changes have been consumed. Records that could not be fetched are listed in
+    `failed_ids`, and the watermark is not advanced past the lowest of their values, so the next run fetches them
+    again.
+    """
+
+    def __init__(self, client, store: WatermarkStore, watermark_field: str = 'version',
+                 batch_size: int = MAX_RECORDS_PER_REQUEST, max_workers: int = 4, overlap: float = 0):
+        """
+        :param client:          OSDU client to use.
+        :param store:           WatermarkStore for persisting watermarks between runs.
+        :param watermark_field: Search field that increases on every change, e.g. 'version' or 'modifyTime'.
+                                'version' is set on every record, while 'modifyTime' is missing on records that
+                                were never updated.
+        :param batch_size:      Number of record ids per get_records call.
+        :param max_workers:     Maximum number of concurrent get_records calls.
+        :param overlap:         Amount subtracted from numeric watermarks when searching, in units of the watermark
+                                field (microseconds for 'version'). Records that reach the search index late, with
+                                a value just below the watermark, are then still found. Records in the overlap are
+                                yielded again.
+        """
+        self._client = client
+        self._store = store
+        self._watermark_field = watermark_field
+        self._batch_size = batch_size
+        self._max_workers = max_workers
+        self._overlap = overlap
+        self._failed_ids = {}
+
+    @property
+    def failed_ids(self) -> dict:
+        """{record id: watermark value} of the records found by the last run that could not be fetched."""
+        return dict(self._failed_ids)
+
+    def key(self, query: dict) -> str:
+        """Returns the default watermark key for a query in the client's current data partition."""
+        return fingerprint(query, self._client.data_partition_id, f'sync:{self._watermark_field}')
+
+    def watermark(self, query: dict, key: str = None):
+        """Returns the current watermark for the query, or None if it has never been synced."""
+        return self._store.get(key or self.key(query))
+
+    def reset(self, query: dict, key: str = None):
+        """Forgets the watermark for the query, so the next run fetches all matching records."""
+        self._store.delete(key or self.key(query))
+
+    def changed_query(self, query: dict, watermark) -> dict:
+        """Returns the search query for records of `query` above the given watermark."""
+        changed = dict(query)
+        changed.pop('cursor', None)
+        changed['returnedFields'] = ['id', self._watermark_field]
+        changed['limit'] = MAX_QUERY_LIMIT
+        if watermark is not None:
+            if self._overlap:
+                if not isinstance(watermark, (int, float)):
+                    raise ValueError(f'overlap requires a numeric watermark, not {watermark!r}')
+                watermark -= self._overlap
+            value = json.dumps(watermark)
+            condition = f'{self._watermark_field}:>{value}'
+            lucene = (query.get('query') or '').strip()
+            changed['query'] = f'({lucene}) AND {condition}' if lucene else condition
+        return changed
+
+    def changes(self, query: dict, key: str = None, hydrate: bool = True):
+        """Yields the records matching `query` that changed since the last completed run. The first run yields
+        all matching records. The watermark is only advanced once the generator has been iterated to the end, and
+        not past records that could not be fetched. See `failed_ids`.
+
+        :param query:   Search query selecting the records to sync, e.g. {'kind': 'osdu:wks:master-data--Well:1.0.0'}
+        :param key:     Watermark key. Defaults to a fingerprint of the query and data partition.
+        :param hydrate: If True, yield full records from the storage service. Otherwise yield the search hits,
+                        which only contain 'id' and the watermark field.
+        """
+        key = key or self.key(query)
+        previous = self._store.get(key)
+        search = self._client.search.query_with_paging(self.changed_query(query, previous))
+        values = []
+        failed = {}
+
+        for hits, _ in search:
+            values.extend(hit[self._watermark_field] for hit in hits if hit.get(self._watermark_field) is not None)
+            if hydrate:
+                fetched = set()
+                for record in self._client.storage.fetch_records(
+                        (hit['id'] for hit in hits), batch_size=self._batch_size, max_workers=self._max_workers):
+                    fetched.add(record.get('id'))
+                    yield record
+                failed.update((hit['id'], hit.get(self._watermark_field)) for hit in hits if hit['id'] not in fetched)
+            else:
+                yield from hits
+        self._failed_ids = failed
+
+        failed_values = [value for value in failed.values() if value is not None]
+        if failed_values:
+            lowest = min(failed_values)
+            values = [value for value in values if value < lowest]
+        if previous is not None:
+            values.append(previous)
+        highest = max(values, default=None)
+        if highest is not None and highest != previous:
+            self._store.set(key, highest)
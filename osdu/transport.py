@@ -0,0 +1,162 @@
+""" HTTP/2 transport for the OSDU services, so that many concurrent requests share a few multiplexed connections.
+
+Requires: `httpx[http2]==0.28.*` and `httpcore==1.0.*` (Python 3.8+), installed with `pip install 'osdupy[http2]'`
+
+Usage:
+    osdu_client.transport = 'http2'
+    record = osdu_client.storage.get_record('opendes:master-data--Well:1234')
+"""
+import threading
+
+import requests
+
+# Transports accepted by `BaseOsduClient.transport`.
+TRANSPORTS = ('http1', 'http2')
+# Maximum number of connections per host, as for the requests pool. HTTP/2 multiplexes concurrent requests over
+# one connection, but servers that only speak HTTP/1.1 need a connection per concurrent request.
+DEFAULT_MAX_CONNECTIONS = 32
+
+
+class Http2Response:
+    """Wraps an `httpx.Response` with the parts of the `requests.Response` interface used by the services, so that
+    callers see the same values and exceptions whichever transport is used.
+    """
+
+    def __init__(self, response):
+        self._response = response
+
+    @property
+    def status_code(self) -> int:
+        return self._response.status_code
+
+    @property
+    def headers(self):
+        return self._response.headers
+
+    @property
+    def content(self) -> bytes:
+        return self._response.content
+
+    @property
+    def text(self) -> str:
+        return self._response.text
+
+    @property
+    def url(self) -> str:
+        return str(self._response.url)
+
+    @property
+    def http_version(self) -> str:
+        """'HTTP/2' or 'HTTP/1.1', as negotiated with the server."""
+        return self._response.http_version
+
+    def json(self, **kwargs):
+        return self._response.json(**kwargs)
+
+    def raise_for_status(self):
+        if 400 <= self.status_code < 600:
+            kind = 'Client' if self.status_code < 500 else 'Server'
+            raise requests.HTTPError(f'{self.status_code} {kind} Error: {self._response.reason_phrase} for url: '
+                                     f'{self.url}', response=self)
+
+    def close(self):
+        self._response.close()
+
+
+class _StreamOpeningConnection:
+    """Wraps an httpcore connection so that only one request at a time opens a stream on it.
+
+    httpcore allocates HTTP/2 stream ids and sends the request headers in two steps that are not atomic across
+    threads, so concurrent requests could open their streams out of order, which servers reject with a
+    PROTOCOL_ERROR. The lock is held per connection and released once the request headers are sent, so responses
+    are still awaited concurrently and connecting to one host does not hold up requests on other connections.
+    """
+
+    def __init__(self, connection):
+        self._connection = connection
+        self._lock = threading.Lock()
+
+    def handle_request(self, request):
+        trace = request.extensions.get('trace')
+        released = []
+
+        def release_lock(event, info):
+            if event.endswith('send_request_headers.complete') and not released:
+                released.append(True)
+                self._lock.release()
+            if trace is not None:
+                trace(event, info)
+
+        self._lock.acquire()
+        # The pool retries the same request on another connection if this one turns out to be unavailable.
+        request.extensions = dict(request.extensions, trace=release_lock)
+        try:
+            return self._connection.handle_request(request)
+        finally:
+            request.extensions = {k: v for k, v in request.extensions.items() if k != 'trace'}
+            if trace is not None:
+                request.extensions['trace'] = trace
+            if not released:
+                released.append(True)
+                self._lock.release()
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+class Http2Session:
+    """Drop-in replacement for the `requests.Session` used by the client, sending requests over HTTP/2 with httpx.
+
+    The protocol is negotiated per connection (ALPN), so servers that do not support HTTP/2 are spoken to over
+    HTTP/1.1. Safe to use from multiple threads: concurrent requests are multiplexed as streams over one connection
+    per host, or spread over up to `max_connections` connections per host when HTTP/2 is not negotiated.
+    """
+
+    def __init__(self, max_connections: int = DEFAULT_MAX_CONNECTIONS, timeout: float = None, verify=True):
+        """
+        :param max_connections: Maximum number of connections per host.
+        :param timeout:         Default timeout in seconds for each request. None waits indefinitely, like requests.
+        :param verify:          Whether to verify TLS certificates, or an ssl.SSLContext to verify them with.
+        """
+        try:
+            import httpx
+            import h2  # noqa: F401 (httpx only imports it when the first HTTP/2 connection is made.)
+        except ImportError as e:
+            raise ImportError("The 'http2' transport requires httpx with HTTP/2 support: "
+                              "pip install 'osdupy[http2]'") from e
+        self._httpx = httpx
+        transport = httpx.HTTPTransport(
+            http2=True, verify=verify,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections))
+        # httpx does not expose its httpcore pool, which creates the connections through this method. This relies on
+        # httpcore internals, hence the pinned versions of the 'http2' extra.
+        pool = transport._pool
+        create_connection = pool.create_connection
+        pool.create_connection = lambda origin: _StreamOpeningConnection(create_connection(origin))
+        self._client = httpx.Client(transport=transport, timeout=timeout)
+
+    def request(self, method: str, url: str, headers: dict = None, params=None, data=None, json=None,
+                timeout=None, **kwargs) -> Http2Response:
+        """Sends a request. Accepts the same common arguments as `requests.Session.request`."""
+        if kwargs:
+            raise TypeError(f'Unsupported arguments for the http2 transport: {sorted(kwargs)}')
+        options = {} if timeout is None else {'timeout': timeout}
+        httpx = self._httpx
+        try:
+            response = self._client.request(method.upper(), url, headers=headers, params=params, json=json,
+                                            content=data if isinstance(data, (str, bytes)) else None,
+                                            data=data if isinstance(data, dict) else None, **options)
+        except httpx.TimeoutException as e:
+            raise requests.Timeout(str(e)) from e
+        except httpx.TransportError as e:
+            raise requests.ConnectionError(str(e)) from e
+        return Http2Response(response)
+
+    def close(self):
+        self._client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,4 +1,9 @@
 import json
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from time import monotonic, sleep
 
 
 def print_json(obj):
@@ -13,3 +18,108 @@ def batches(lst, n):
     """Yield successive n-sized batches from list."""
     for i in range(0, len(lst), n):
         yield lst[i:i + n]
+
+
+def diff_records(old, new, path: str = '') -> list:
+    """Returns the structural differences between two JSON-like values, e.g. two versions of a record.
+
+    :returns:   list of dicts, one per changed leaf, containing:
+                - path: str:    dotted path of the value, with list indexes in brackets, e.g. 'data.Names[0].Name'
+                - op:   str:    'add', 'remove' or 'change'
+                - old:          previous value, or None for 'add'
+                - new:          new value, or None for 'remove'
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        changes = []
+        for key in list(old) + [k for k in new if k not in old]:
+            child = f'{path}.{key}' if path else str(key)
+            if key not in new:
+                changes.append({'path': child, 'op': 'remove', 'old': old[key], 'new': None})
+            elif key not in old:
+                changes.append({'path': child, 'op': 'add', 'old': None, 'new': new[key]})
+            else:
+                changes.extend(diff_records(old[key], new[key], child))
+        return changes
+    if isinstance(old, list) and isinstance(new, list):
+        changes = []
+        for i in range(max(len(old), len(new))):
+            child = f'{path}[{i}]'
+            if i >= len(new):
+                changes.append({'path': child, 'op': 'remove', 'old': old[i], 'new': None})
+            elif i >= len(old):
+                changes.append({'path': child, 'op': 'add', 'old': None, 'new': new[i]})
+            else:
+                changes.extend(diff_records(old[i], new[i], child))
+        return changes
+    if old != new or type(old) != type(new):
+        return [{'path': path, 'op': 'change', 'old': old, 'new': new}]
+    return []
+
+
+def chunked(iterable, n):
+    """Yield successive lists of up to n items from any iterable, without materializing it."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, n))
+        if not batch:
+            return
+        yield batch
+
+
+def write_archive(path: str, records) -> int:
+    """Appends records from any iterable to the `osdu.archive.RecordArchive` at path. Returns the number written."""
+    from .archive import RecordArchive
+
+    with RecordArchive(path) as archive:
+        return archive.append(records)
+
+
+def read_archive(path: str, kind: str = None):
+    """Yield the records of the `osdu.archive.RecordArchive` at path, optionally only those of one kind."""
+    from .archive import RecordArchive
+
+    with RecordArchive(path) as archive:
+        yield from archive.scan(kind)
+
+
+def ordered_map(func, iterable, max_workers: int = 4, max_pending: int = None, executor_class=ThreadPoolExecutor):
+    """Like ThreadPoolExecutor.map, but only consumes `iterable` as results are taken, so that at most
+    `max_pending` calls (default: 2 * max_workers) are queued or running at any time. Yields results in
+    input order and re-raises the first exception encountered. Pass `executor_class=ProcessPoolExecutor` to run
+    `func` in other processes, in which case `func` and the items must be picklable.
+    """
+    max_pending = max_pending or 2 * max_workers
+    pending = deque()
+    with executor_class(max_workers=max_workers) as executor:
+        try:
+            for item in iterable:
+                pending.append(executor.submit(func, item))
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # Don't start queued calls whose results will never be taken.
+            for future in pending:
+                future.cancel()
+
+
+class RateLimiter:
+    """Thread-safe limiter that allows at most `rate` calls to acquire() per second, with bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self._interval = 1.0 / rate
+        self._burst = burst
+        self._lock = threading.Lock()
+        self._next = monotonic()
+
+    def acquire(self):
+        """Blocks until the next call is allowed."""
+        with self._lock:
+            now = monotonic()
+            # Allow up to `burst` calls to catch up after an idle period.
+            self._next = max(self._next, now - (self._burst - 1) * self._interval)
+            wait = self._next - now
+            self._next += self._interval
+        if wait > 0:
+            sleep(wait)
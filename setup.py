@@ -25,5 +25,11 @@ setuptools.setup(
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
     ],
-    python_requires='>=3.6'
+    python_requires='>=3.6',
+    extras_require={
+        # Validating records against their schemas. jsonschema 4.18+ requires Python 3.8.
+        'schema': ['jsonschema>=4.18'],
+        # The http2 transport hooks into httpcore's connection pool, so both are pinned to the tested versions.
+        'http2': ['httpx[http2]==0.28.*', 'httpcore==1.0.*'],
+    },
 )
\ No newline at end of file
@@ -1,14 +1,48 @@
 import base64
 import hashlib
 import hmac
-from unittest import TestCase, mock
-from time import time
+import json
+import os
+import pickle
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase, mock, skipUnless
+from time import sleep, time
 
+import requests
+try:
+    import httpcore
+    import httpx
+except ImportError:
+    httpx = None
+try:
+    import jsonschema
+except ImportError:
+    jsonschema = None
 from osdu.client import (
     AwsOsduClient,
     AwsServicePrincipalOsduClient,
     SimpleOsduClient
 )
+from osdu.archive import RecordArchive
+from osdu.cache import SearchCache
+from osdu.checkpoint import Checkpoint
+from osdu.circuit_breaker import CircuitBreakerPolicy, CircuitOpenError
+from osdu.hash_index import ContentHashIndex, content_hash
+from osdu.hedging import HedgingPolicy
+from osdu.local_index import LocalRecordIndex
+from osdu.migration import Migration, rewrite_acl, rewrite_partition
+from osdu.models import Record, RecordsResult, SearchResult
+from osdu.partitions import PartitionFanout, PartitionResult
+from osdu.pipeline import search_and_hydrate
+from osdu.services.legal import LegalCheckError, LegalService
+from osdu.services.schema import SchemaService, SchemaValidationError
+from osdu.services.search import MAX_QUERY_LIMIT, SearchService
+from osdu.services.storage import StorageService
+from osdu.sync import IncrementalSync, WatermarkStore
+from osdu.transport import Http2Session
+from osdu.utils import diff_records, read_archive, write_archive
 
 
 class TestAwsServicePrincipalOsduClient(TestCase):
@@ -94,3 +128,1423 @@ class TestSimpleOsduClient(TestCase):
 
         self.assertEqual(partition, client.data_partition_id)
         self.assertEqual(token, client.access_token)
+
+
+class TestStartup(TestCase):
+
+    def test_import_client_does_not_import_aws_sdk(self):
+        from benchmarks.import_time import DEFERRED_MODULES, measure_import
+
+        timings = measure_import('osdu.client')
+
+        imported = [name for name in timings if name.split('.')[0] in DEFERRED_MODULES]
+        self.assertIn('osdu.client', timings)
+        self.assertEqual([], imported)
+
+    def test_services_are_created_on_first_access(self):
+        client = SimpleOsduClient('opendes', 'mytoken', api_url='https://your.api.url.com')
+
+        self.assertIsNone(client._storage)
+        storage = client.storage
+
+        self.assertIs(storage, client.storage)
+        self.assertIsNone(client._search)
+
+
+class TestModels(TestCase):
+
+    record = {
+        'id': 'opendes:doc:123',
+        'kind': 'opendes:osdu:doc:1.0.0',
+        'version': 1234,
+        'acl': {'viewers': ['viewers@opendes'], 'owners': ['owners@opendes']},
+        'legal': {'legaltags': ['opendes-public'], 'otherRelevantDataCountries': ['US']},
+        'createTime': '2021-01-01T00:00:00.000Z',
+        'data': {'Name': 'doc', 'Values': [1, 2.5, None]},
+    }
+
+    def test_record_round_trips_to_dict(self):
+        record = Record.from_dict(self.record)
+
+        self.assertEqual('opendes:doc:123', record.id)
+        self.assertEqual(1234, record.version)
+        self.assertEqual(self.record, record.to_dict())
+
+    def test_record_data_is_parsed_on_first_access(self):
+        record = Record.from_dict(self.record)
+
+        self.assertIsNone(record._data)
+        self.assertEqual('doc', record.data['Name'])
+        self.assertIsNone(record._raw_data)
+
+    def test_record_without_data_round_trips(self):
+        hit = {'id': 'opendes:doc:123', 'kind': None}
+
+        self.assertEqual(hit, Record.from_dict(hit).to_dict())
+
+    def test_new_record_omits_unset_members(self):
+        record = Record(kind='opendes:osdu:doc:1.0.0', data={'Name': 'doc'})
+
+        self.assertEqual({'kind': 'opendes:osdu:doc:1.0.0', 'data': {'Name': 'doc'}}, record.to_dict())
+
+    def test_records_compare_by_content_and_are_unhashable(self):
+        record = Record.from_dict(self.record)
+
+        self.assertEqual(Record.from_dict(dict(self.record)), record)
+        with self.assertRaises(TypeError):
+            hash(record)
+
+    def test_response_types_round_trip(self):
+        search_response = {'results': [self.record], 'aggregations': None, 'totalCount': 1}
+        records_response = {'records': [self.record], 'invalidRecords': [], 'retryRecords': []}
+
+        self.assertEqual(search_response, SearchResult.from_dict(search_response).to_dict())
+        self.assertEqual(records_response, RecordsResult.from_dict(records_response).to_dict())
+
+
+class TestSearchQueryPlanner(TestCase):
+
+    def setUp(self):
+        self.client = SimpleOsduClient('opendes', 'mytoken', api_url='https://your.api.url.com')
+
+    @mock.patch.object(SearchService, 'query_with_paging')
+    @mock.patch.object(SearchService, 'query')
+    def test_aggregation_only_query_fetches_no_pages(self, mock_query, mock_paging):
+        mock_query.return_value = {'results': [], 'totalCount': 5, 'aggregations': [{'key': 'a', 'count': 5}]}
+        query = {'kind': '*:*:*:*', 'aggregateBy': 'kind', 'limit': 0}
+
+        plan = self.client.search.plan(query)
+        pages = list(self.client.search.execute(plan))
+
+        self.assertEqual('count', plan.strategy)
+        self.assertEqual([{'key': 'a', 'count': 5}], plan.aggregations)
+        self.assertEqual([], pages)
+        mock_query.assert_called_once_with({'kind': '*:*:*:*', 'aggregateBy': 'kind', 'limit': 0},
+                                           data_partition_id=None)
+        mock_paging.assert_not_called()
+
+    @mock.patch.object(SearchService, 'query_with_paging')
+    @mock.patch.object(SearchService, 'query')
+    def test_small_result_set_uses_single_query(self, mock_query, mock_paging):
+        mock_query.side_effect = [
+            {'results': [], 'totalCount': 3},
+            {'results': [{'id': 1}, {'id': 2}, {'id': 3}], 'totalCount': 3},
+        ]
+        query = {'kind': '*:*:*:*', 'returnedFields': ['id'], 'aggregateBy': 'kind'}
+
+        pages = list(self.client.search.query_planned(query))
+
+        self.assertEqual([([{'id': 1}, {'id': 2}, {'id': 3}], 3)], pages)
+        mock_query.assert_called_with({'kind': '*:*:*:*', 'returnedFields': ['id'], 'limit': 3}, typed=False,
+                                      data_partition_id=None)
+        mock_paging.assert_not_called()
+
+    @mock.patch.object(SearchService, 'query_with_paging')
+    @mock.patch.object(SearchService, 'query')
+    def test_large_result_set_uses_cursor_with_max_page_size(self, mock_query, mock_paging):
+        mock_query.return_value = {'results': [], 'totalCount': 2500}
+        mock_paging.return_value = iter([([{}] * MAX_QUERY_LIMIT, 2500), ([{}] * MAX_QUERY_LIMIT, 2500)])
+
+        pages = list(self.client.search.query_planned({'kind': '*:*:*:*'}, max_results=1500))
+
+        self.assertEqual([MAX_QUERY_LIMIT, 500], [len(page) for page, _ in pages])
+        mock_paging.assert_called_once_with({'kind': '*:*:*:*', 'limit': MAX_QUERY_LIMIT}, typed=False,
+                                            data_partition_id=None)
+
+    @mock.patch.object(SearchService, 'query_with_paging')
+    @mock.patch.object(SearchService, 'query')
+    def test_limit_and_data_partition_are_honored(self, mock_query, mock_paging):
+        mock_query.side_effect = [
+            {'results': [], 'totalCount': 2500},
+            {'results': [{'id': 1}, {'id': 2}], 'totalCount': 2500},
+        ]
+
+        pages = list(self.client.search.query_planned({'kind': '*:*:*:*', 'limit': 2}, data_partition_id='other'))
+
+        self.assertEqual([([{'id': 1}, {'id': 2}], 2500)], pages)
+        mock_query.assert_any_call({'kind': '*:*:*:*', 'limit': 0}, data_partition_id='other')
+        mock_query.assert_called_with({'kind': '*:*:*:*', 'limit': 2}, typed=False, data_partition_id='other')
+        mock_paging.assert_not_called()
+
+
+class TestSearchCache(TestCase):
+
+    def setUp(self):
+        self.client = SimpleOsduClient('opendes', 'mytoken', api_url='https://your.api.url.com')
+        self.cache = SearchCache(ttl=60, spill_threshold=64)
+        self.client.search.cache = self.cache
+
+    @staticmethod
+    def _response(body: dict):
+        response = mock.Mock()
+        response.content = json.dumps(body).encode('utf-8')
+        response.json.return_value = body
+        return response
+
+    def test_fingerprint_ignores_key_order_and_whitespace(self):
+        first = SearchCache.fingerprint({'kind': '*:*:*:*', 'query': ' id:1 '}, 'opendes')
+        second = SearchCache.fingerprint({'query': 'id:1', 'kind': '*:*:*:*'}, 'opendes')
+        other_partition = SearchCache.fingerprint({'query': 'id:1', 'kind': '*:*:*:*'}, 'osdu')
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other_partition)
+
+    @mock.patch('requests.Session.request')
+    def test_identical_queries_hit_the_cache(self, mock_post):
+        mock_post.return_value = self._response({'results': [{'id': 1}], 'totalCount': 1})
+
+        first = self.client.search.query({'kind': '*:*:*:*'})
+        second = self.client.search.query({'kind': '*:*:*:*'})
+
+        self.assertEqual(first, second)
+        self.assertEqual(1, mock_post.call_count)
+        self.assertEqual(1, self.cache.stats['hits'])
+        self.assertEqual(1, self.cache.stats['misses'])
+
+    @mock.patch('requests.Session.request')
+    def test_completed_paged_result_sets_are_cached_and_spilled(self, mock_post):
+        mock_post.side_effect = [
+            self._response({'results': [{'id': n} for n in range(10)], 'totalCount': 12, 'cursor': 'abc'}),
+            self._response({'results': [{'id': 10}, {'id': 11}], 'totalCount': 12, 'cursor': None}),
+        ]
+
+        first = list(self.client.search.query_with_paging({'kind': '*:*:*:*', 'limit': 10}))
+        second = list(self.client.search.query_with_paging({'kind': '*:*:*:*', 'limit': 10}))
+
+        self.assertEqual(first, second)
+        self.assertEqual(2, mock_post.call_count)
+        self.assertEqual(1, self.cache.stats['spills'])
+
+    @mock.patch('requests.Session.request')
+    def test_partially_iterated_result_sets_are_not_cached(self, mock_post):
+        mock_post.return_value = self._response({'results': [{'id': 1}], 'totalCount': 2, 'cursor': 'abc'})
+
+        for _ in self.client.search.query_with_paging({'kind': '*:*:*:*'}):
+            break
+
+        self.assertEqual(0, self.cache.stats['entries'])
+
+    def test_spilled_result_sets_count_towards_the_disk_limit(self):
+        cache = SearchCache(spill_threshold=10, max_disk_bytes=200)
+        pages = [{'results': [{'id': n} for n in range(10)], 'totalCount': 10}]
+
+        cache.put_pages('a', pages)
+        cache.put_pages('b', pages)
+        spill_dir = cache._spill_dir
+        writer = cache.page_writer('c')
+        writer.append(pages[0])
+        writer.discard()
+
+        stats = cache.stats
+        self.assertEqual(1, stats['entries'])
+        self.assertLessEqual(stats['disk_bytes'], 200)
+        self.assertEqual(2, stats['spills'])
+        self.assertEqual(1, stats['evictions'])
+        self.assertIsNone(cache.get_pages('a'))
+        self.assertEqual(pages, list(cache.get_pages('b')))
+        self.assertEqual(1, len(os.listdir(spill_dir)))
+
+        cache.close()
+        self.assertFalse(os.path.exists(spill_dir))
+
+
+class TestIncrementalSync(TestCase):
+
+    def setUp(self):
+        self.client = SimpleOsduClient('opendes', 'mytoken', api_url='https://your.api.url.com')
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.store = WatermarkStore(os.path.join(self.state_dir.name, 'state.json'))
+        self.sync = IncrementalSync(self.client, self.store)
+
+    def tearDown(self):
+        self.state_dir.cleanup()
+
+    @mock.patch.object(StorageService, 'get_records')
+    @mock.patch.object(SearchService, 'query_with_paging')
+    def test_sync_fetches_changes_and_advances_watermark(self, mock_paging, mock_get_records):
+        query = {'kind': 'osdu:wks:master-data--Well:1.0.0', 'query': 'data.Field:"A"'}
+        mock_paging.return_value = iter([([{'id': 'a', 'version': 5}, {'id': 'b', 'version': 7}], 2)])
+        mock_get_records.return_value = {'records': [{'id': 'a'}, {'id': 'b'}]}
+
+        records = list(self.sync.changes(query))
+
+        self.assertEqual([{'id': 'a'}, {'id': 'b'}], records)
+        self.assertEqual(7, self.sync.watermark(query))
+        mock_get_records.assert_called_once_with(['a', 'b'], [], data_partition_id=None)
+
+        # The next run only searches above the watermark, which is persisted between instances.
+        mock_paging.return_value = iter([])
+        sync = IncrementalSync(self.client, WatermarkStore(self.store._path))
+        self.assertEqual([], list(sync.changes(query)))
+        sent_query = mock_paging.call_args[0][0]
+        self.assertEqual('(data.Field:"A") AND version:>7', sent_query['query'])
+        self.assertEqual(['id', 'version'], sent_query['returnedFields'])
+
+    @mock.patch.object(SearchService, 'query_with_paging')
+    def test_watermark_is_not_advanced_for_incomplete_runs(self, mock_paging):
+        query = {'kind': 'osdu:wks:master-data--Well:1.0.0'}
+        mock_paging.return_value = iter([([{'id': 'a', 'version': 5}], 1)])
+
+        for _ in self.sync.changes(query, hydrate=False):
+            break
+
+        self.assertIsNone(self.sync.watermark(query))
+
+    @mock.patch.object(StorageService, 'get_records')
+    @mock.patch.object(SearchService, 'query_with_paging')
+    def test_watermark_stops_below_records_that_could_not_be_fetched(self, mock_paging, mock_get_records):
+        query = {'kind': 'osdu:wks:master-data--Well:1.0.0'}
+        hits = [{'id': 'a', 'version': 5}, {'id': 'b', 'version': 7}, {'id': 'c', 'version': 9}]
+        mock_paging.return_value = iter([(hits, 3)])
+        mock_get_records.return_value = {'records': [{'id': 'a'}, {'id': 'c'}], 'invalidRecords': ['b']}
+
+        self.assertEqual([{'id': 'a'}, {'id': 'c'}], list(self.sync.changes(query)))
+        self.assertEqual({'b': 7}, self.sync.failed_ids)
+        self.assertEqual(5, self.sync.watermark(query))
+
+    @mock.patch.object(SearchService, 'query_with_paging')
+    def test_overlap_searches_below_the_watermark(self, mock_paging):
+        query = {'kind': 'osdu:wks:master-data--Well:1.0.0'}
+        self.store.set(self.sync.key(query), 1000)
+        mock_paging.return_value = iter([([{'id': 'late', 'version': 990}], 1)])
+        sync = IncrementalSync(self.client, self.store, overlap=50)
+
+        self.assertEqual(['late'], [hit['id'] for hit in sync.changes(query, hydrate=False)])
+        self.assertEqual('version:>950', mock_paging.call_args[0][0]['query'])
+        self.assertEqual(1000, sync.watermark(query))
+
+
+class TestStorageBatching(TestCase):
+
+    def setUp(self):
+        self.client = SimpleOsduClient('opendes', 'mytoken', api_url='https://your.api.url.com')
+        self.client.storage.enable_batching(window=0.05, max_batch_size=100)
+
+    @mock.patch.object(StorageService, 'get_records')
+    def test_concurrent_get_record_calls_are_batched_and_deduplicated(self, mock_get_records):
+        mock_get_records.side_effect = lambda ids: {'records': [{'id': i} for i in ids]}
+        ids = ['a', 'b', 'a', 'c']
+
+        with ThreadPoolExecutor(max_workers=len(ids)) as executor:
+            records = list(executor.map(self.client.storage.get_record, ids))
+
+        self.assertEqual([{'id': 'a'}, {'id': 'b'}, {'id': 'a'}, {'id': 'c'}], records)
+        self.assertIsNot(records[0], records[2])
+        mock_get_records.assert_called_once()
+        self.assertCountEqual(['a', 'b', 'c'], mock_get_records.call_args[0][0])
+
+    @mock.patch.object(StorageService, '_get_record')
+    @mock.patch.object(StorageService, 'get_records')
+    def test_missing_records_raise_the_unbatched_error(self, mock_get_records, mock_get_record):
+        mock_get_records.return_value = {'records': [], 'invalidRecords': ['missing']}
+        mock_get_record.side_effect = requests.HTTPError('404 Client Error')
+
+        with self.assertRaises(requests.HTTPError):
+            self.client.storage.get_record('missing')
+        mock_get_record.assert_called_once_with('missing')
+
+    @mock.patch.object(StorageService, 'get_records')
+    def test_full_batches_are_sent_without_waiting(self, mock_get_records):
+        mock_get_records.side_effect = lambda ids: {'records': [{'id': i} for i in ids]}
+        self.client.storage.enable_batching(window=60, max_batch_size=1)
+
+        self.assertEqual({'id': 'a'}, self.client.storage.get_record('a'))
+
+
+class TestPartitionFanout(TestCase):
+
+    def setUp(self):
+        self.client = SimpleOsduClient('opendes', 'mytoken', api_url='https://your.api.url.com')
+        self.fanout = PartitionFanout(self.client, ['opendes', 'osdu'])
+
+    @staticmethod
+    def _response(body: dict):
+        response = mock.Mock()
+        response.json.return_value = body
+        return response
+
+    @mock.patch('requests.Session.request')
+    def test_partition_is_sent_per_request(self, mock_request):
+        mock_request.side_effect = lambda method, url, headers, json: self._response(
+            {'results': [{'partition': headers['data-partition-id']}], 'totalCount': 1})
+
+        results = dict(self.fanout.query({'kind': '*:*:*:*'}))
+
+        self.assertEqual({'opendes', 'osdu'}, set(results))
+        self.assertEqual('osdu', results['osdu'].response['results'][0]['partition'])
+        self.assertEqual('opendes', self.client.data_partition_id)
+
+    @mock.patch.object(SearchService, 'query_with_paging')
+    def test_paged_results_are_merged_and_tagged(self, mock_paging):
+        mock_paging.side_effect = lambda query, typed, data_partition_id: iter(
+            [([data_partition_id + '1'], 2), ([data_partition_id + '2'], 2)])
+
+        pages = list(self.fanout.query_with_paging({'kind': '*:*:*:*'}))
+
+        self.assertCountEqual([('opendes', ['opendes1'], 2), ('opendes', ['opendes2'], 2),
+                               ('osdu', ['osdu1'], 2), ('osdu', ['osdu2'], 2)], pages)
+
+    @mock.patch.object(SearchService, 'query_with_paging')
+    def test_paging_errors_are_raised(self, mock_paging):
+        mock_paging.side_effect = requests.HTTPError('500 Server Error')
+
+        with self.assertRaises(requests.HTTPError):
+            list(self.fanout.query_with_paging({'kind': '*:*:*:*'}))
+
+    @mock.patch.object(StorageService, 'get_records')
+    def test_get_records_groups_ids_by_partition(self, mock_get_records):
+        mock_get_records.side_effect = lambda ids, attributes, typed, data_partition_id: {'records': ids}
+
+        results = dict(self.fanout.get_records(['opendes:doc:1', 'osdu:doc:2', 'opendes:doc:3']))
+
+        self.assertEqual({'opendes': PartitionResult({'records': ['opendes:doc:1', 'opendes:doc:3']}, None),
+                          'osdu': PartitionResult({'records': ['osdu:doc:2']}, None)}, results)
+
+    @mock.patch.object(SearchService, 'query')
+    def test_failed_partition_does_not_lose_the_others(self, mock_query):
+        error = requests.HTTPError('500 Server Error')
+
+        def query(query, typed, data_partition_id):
+            if data_partition_id == 'osdu':
+                raise error
+            return {'results': [], 'totalCount': 0}
+        mock_query.side_effect = query
+
+        results = dict(self.fanout.query({'kind': '*:*:*:*'}))
+
+        self.assertEqual({'opendes': PartitionResult({'results': [], 'totalCount': 0}, None),
+                          'osdu': PartitionResult(None, error)}, results)
+
+
+class TestBulkDelete(TestCase):
+
+    def setUp(self):
+        self.client = SimpleOsduClient('opendes', 'mytoken', api_url='https://your.api.url.com')
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.checkpoint_path = os.path.join(self.state_dir.name, 'checkpoint.db')
+
+    def tearDown(self):
+        self.state_dir.cleanup()
+
+    @mock.patch.object(StorageService, 'delete_record')
+    def test_delete_records_reports_each_outcome(self, mock_delete):
+        mock_delete.side_effect = lambda record_id: self._fail_on(record_id, 'b')
+
+        report = self.client.storage.delete_records(['a', 'b', 'c'], max_workers=2)
+
+        self.assertCountEqual(['a', 'c'], report.succeeded)
+        self.assertEqual(['b'], list(report.failed))
+
+    @mock.patch.object(StorageService, 'purge_record')
+    def test_purge_records_resumes_from_checkpoint(self, mock_purge):
+        mock_purge.side_effect = lambda record_id: self._fail_on(record_id, 'b')
+        self.client.storage.purge_records(['a', 'b', 'c'], checkpoint=self.checkpoint_path)
+
+        mock_purge.reset_mock()
+        mock_purge.side_effect = None
+        mock_purge.return_value = True
+        report = self.client.storage.purge_records(['a', 'b', 'c'], checkpoint=self.checkpoint_path)
+
+        mock_purge.assert_called_once_with('b')
+        self.assertEqual(2, report.skipped)
+        with Checkpoint(self.checkpoint_path) as checkpoint:
+            self.assertEqual({'succeeded': 3, 'failed': 0}, checkpoint.counts())
+
+    @mock.patch.object(StorageService, 'delete_record')
+    @mock.patch.object(SearchService, 'query_with_paging')
+    def test_dry_run_counts_query_results_without_deleting(self, mock_paging, mock_delete):
+        mock_paging.return_value = iter([([{'id': 'a'}, {'id': 'b'}], 2)])
+
+        report = self.client.storage.delete_records(query={'kind': '*:*:*:*'}, dry_run=True)
+
+        self.assertEqual(2, report.pending)
+        mock_delete.assert_not_called()
+
+    @staticmethod
+    def _fail_on(record_id, failing_id):
+        if record_id == failing_id:
+            raise requests.HTTPError('404 Client Error')
+        return True
+
+
+class TestRecordHistory(TestCase):
+
+    def setUp(self):
+        self.client = SimpleOsduClient('opendes', 'mytoken', api_url='https://your.api.url.com')
+
+    def test_diff_records(self):
+        old = {'version': 1, 'data': {'Name': 'A', 'Aliases': ['x'], 'Removed': 1}}
+        new = {'version': 2, 'data': {'Name': 'B', 'Aliases': ['x', 'y'], 'Added': True}}
+
+        changes = diff_records(old, new)
+
+        self.assertEqual([
+            {'path': 'version', 'op': 'change', 'old': 1, 'new': 2},
+            {'path': 'data.Name', 'op': 'change', 'old': 'A', 'new': 'B'},
+            {'path': 'data.Aliases[1]', 'op': 'add', 'old': None, 'new': 'y'},
+            {'path': 'data.Removed', 'op': 'remove', 'old': 1, 'new': None},
+            {'path': 'data.Added', 'op': 'add', 'old': None, 'new': True},
+        ], changes)
+
+    @mock.patch.object(StorageService, 'get_record_version')
+    @mock.patch.object(StorageService, 'get_all_record_versions')
+    def test_history_fetches_selected_versions_and_diffs(self, mock_versions, mock_version):
+        mock_versions.side_effect = lambda record_id: {'recordId': record_id, 'versions': [3, 1, 2]}
+        mock_version.side_effect = lambda record_id, version: {'id': record_id, 'version': version}
+
+        history = self.client.storage.get_records_history(['a', 'b'], versions=2, diff=True)
+
+        self.assertEqual([2, 3], [entry['version'] for entry in history['a']])
+        self.assertIsNone(history['a'][0]['changes'])
+        self.assertEqual([{'path': 'version', 'op': 'change', 'old': 2, 'new': 3}], history['a'][1]['changes'])
+
+        # Versions are immutable, so fetching them again is served from the cache.
+        self.client.storage.get_records_history(['a', 'b'], versions=2)
+        self.assertEqual(4, mock_version.call_count)
+
+    @mock.patch.object(StorageService, 'get_record_version')
+    @mock.patch.object(StorageService, 'get_all_record_versions')
+    def test_history_of_repeated_ids_is_fetched_once(self, mock_versions, mock_version):
+        mock_versions.side_effect = lambda record_id: {'recordId': record_id, 'versions': [1, 2]}
+        mock_version.side_effect = lambda record_id, version: {'id': record_id, 'version': version}
+
+        history = self.client.storage.get_records_history(['a', 'b', 'a'], diff=True)
+
+        self.assertEqual(['a', 'b'], list(history))
+        self.assertEqual([1, 2], [entry['version'] for entry in history['a']])
+        self.assertIsNone(history['a'][0]['changes'])
+        self.assertEqual(2, mock_versions.call_count)
+        self.assertEqual(4, mock_version.call_count)
+
+
+class TestUpsertRecords(TestCase):
+
+    def setUp(self):
+        self.client = SimpleOsduClient('opendes', 'mytoken', api_url='https://your.api.url.com')
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.index = ContentHashIndex(os.path.join(self.state_dir.name, 'hashes.db'))
+
+    def tearDown(self):
+        self.index.close()
+        self.state_dir.cleanup()
+
+    def test_content_hash_ignores_key_order_and_platform_fields(self):
+        record = {'id': 'a', 'version': 1, 'legal': {'legaltags': ['t'], 'status': 'compliant'}, 'data': {'A': 1, 'B': 2}}
+        same = {'data': {'B': 2, 'A': 1}, 'legal': {'legaltags': ['t']}, 'id': 'a', 'version': 2}
+
+        self.assertEqual(content_hash(record), content_hash(same))
+        self.assertNotEqual(content_hash(record), content_hash(dict(same, data={'A': 1})))
+
+    @mock.patch.object(StorageService, 'store_records')
+    @mock.patch.object(StorageService, 'get_records')
+    def test_only_changed_records_are_stored(self, mock_get_records, mock_store):
+        unchanged = {'id': 'a', 'kind': 'k', 'data': {'Name': 'A'}}
+        changed = {'id': 'b', 'kind': 'k', 'data': {'Name': 'B2'}}
+        new = {'kind': 'k', 'data': {'Name': 'C'}}
+        mock_get_records.return_value = {'records': [dict(unchanged, version=1), {'id': 'b', 'kind': 'k', 'data': {'Name': 'B'}}]}
+        mock_store.return_value = {'recordCount': 2, 'recordIds': ['b', 'c']}
+
+        result = self.client.storage.upsert_records([unchanged, changed, new], self.index)
+
+        mock_store.assert_called_once_with([changed, new])
+        self.assertEqual(['a'], result['skippedRecordIds'])
+        self.assertEqual(['b', 'c'], result['recordIds'])
+        self.assertEqual(content_hash(new), self.index.get_many(['c'])['c'])
+
+        # Nothing is fetched or stored when the same records are upserted again.
+        mock_get_records.reset_mock()
+        mock_store.reset_mock()
+        result = self.client.storage.upsert_records([unchanged, changed, dict(new, id='c')], self.index)
+        mock_get_records.assert_not_called()
+        mock_store.assert_not_called()
+        self.assertEqual(['a', 'b', 'c'], result['skippedRecordIds'])
+
+    @mock.patch.object(StorageService, 'store_records')
+    def test_rejected_records_are_not_hashed(self, mock_store):
+        records = [{'id': 'a', 'kind': 'k', 'data': {}}, {'id': 'b', 'kind': 'k', 'data': {}},
+                   {'kind': 'k', 'data': {'Name': 'C'}}]
+        mock_store.return_value = {'recordCount': 2, 'recordIds': ['a', 'c'],
+                                   'rejectedRecords': [{'index': 1, 'id': 'b', 'reason': 'no legal tags'}]}
+
+        result = self.client.storage.upsert_records(records, self.index, fetch_missing=False)
+
+        self.assertEqual([{'index': 1, 'id': 'b', 'reason': 'no legal tags'}], result['rejectedRecords'])
+        self.assertEqual({'a': content_hash(records[0]), 'c': content_hash(records[2])},
+                         self.index.get_many(['a', 'b', 'c']))
+
+
+class TestExpandReferences(TestCase):
+
+    def setUp(self):
+        self.client = SimpleOsduClient('opendes', 'mytoken', api_url='https://your.api.url.com')
+        self.records = {
+            'opendes:master-data--Wellbore:1': {'id': 'opendes:master-data--Wellbore:1', 'data': {
+                'WellID': 'opendes:master-data--Well:10:',
+                'NameAliases': [{'AliasNameTypeID': 'opendes:reference-data--AliasNameType:UWI:123'}],
+                'Name': 'not:a--reference:value:'}},
+            'opendes:master-data--Wellbore:2': {'id': 'opendes:master-data--Wellbore:2', 'data': {
+                'WellID': 'opendes:master-data--Well:10:'}},
+            'opendes:master-data--Well:10': {'id': 'opendes:master-data--Well:10', 'data': {
+                'GeoPoliticalEntityID': 'opendes:master-data--GeoPoliticalEntity:US:'}},
+            'opendes:reference-data--AliasNameType:UWI': {'id': 'opendes:reference-data--AliasNameType:UWI', 'data': {}},
+            'opendes:master-data--GeoPoliticalEntity:US': {'id': 'opendes:master-data--GeoPoliticalEntity:US', 'data': {}},
+        }
+
+    @mock.patch.object(StorageService, 'get_records')
+    def test_references_are_fetched_once_per_level(self, mock_get_records):
+        mock_get_records.side_effect = lambda ids, attributes, data_partition_id: {
+            'records': [self.records[i] for i in ids if i in self.records]}
+
+        result = self.client.storage.expand_references(
+            ['opendes:master-data--Wellbore:1', self.records['opendes:master-data--Wellbore:2']], depth=1)
+
+        self.assertEqual({'opendes:master-data--Wellbore:1', 'opendes:master-data--Wellbore:2',
+                          'opendes:master-data--Well:10', 'opendes:reference-data--AliasNameType:UWI'}, set(result))
+        self.assertEqual(2, mock_get_records.call_count)
+        self.assertEqual(['opendes:master-data--Well:10', 'opendes:reference-data--AliasNameType:UWI'],
+                         mock_get_records.call_args[0][0])
+
+    @mock.patch.object(StorageService, 'get_records')
+    def test_deeper_levels_are_followed(self, mock_get_records):
+        mock_get_records.side_effect = lambda ids, attributes, data_partition_id: {
+            'records': [self.records[i] for i in ids if i in self.records]}
+
+        result = self.client.storage.expand_references([self.records['opendes:master-data--Wellbore:2']], depth=2)
+
+        self.assertIn('opendes:master-data--GeoPoliticalEntity:US', result)
+
+    @mock.patch.object(StorageService, 'get_record_version')
+    @mock.patch.object(StorageService, 'get_records')
+    def test_versioned_references_are_fetched_at_their_version(self, mock_get_records, mock_get_version):
+        mock_get_records.side_effect = lambda ids, attributes, data_partition_id: {
+            'records': [self.records[i] for i in ids if i in self.records]}
+        mock_get_version.return_value = {'id': 'opendes:reference-data--AliasNameType:UWI', 'version': 123}
+
+        result = self.client.storage.expand_references(['opendes:master-data--Wellbore:1'], strip_version=False)
+
+        mock_get_version.assert_called_once_with('opendes:reference-data--AliasNameType:UWI', '123')
+        self.assertEqual(123, result['opendes:reference-data--AliasNameType:UWI:123']['version'])
+        self.assertIn('opendes:master-data--Well:10', result)
+        for call in mock_get_records.call_args_list:
+            self.assertNotIn('opendes:reference-data--AliasNameType:UWI:123', call[0][0])
+
+
+class TestSearchAndHydrate(TestCase):
+
+    def setUp(self):
+        self.client = SimpleOsduClient('opendes', 'mytoken', api_url='https://your.api.url.com')
+        pages = [([{'id': str(n)} for n in range(page * 10, page * 10 + 10)], 30) for page in range(3)]
+        self.paging = mock.patch.object(SearchService, 'query_with_paging', return_value=iter(pages))
+        self.mock_paging = self.paging.start()
+
+    def tearDown(self):
+        self.paging.stop()
+
+    @staticmethod
+    def _get_records(ids, attributes, data_partition_id):
+        # Make earlier batches slower, so that they complete out of order.
+        sleep(0.01 * (30 - int(ids[0])) / 30)
+        return {'records': [{'id': i, 'data': {}} for i in ids]}
+
+    @mock.patch.object(StorageService, 'get_records')
+    def test_records_are_yielded_in_search_order(self, mock_get_records):
+        mock_get_records.side_effect = self._get_records
+
+        records = list(search_and_hydrate(self.client, {'kind': '*:*:*:*'}, batch_size=4, max_workers=3))
+
+        self.assertEqual([str(n) for n in range(30)], [record['id'] for record in records])
+        self.assertEqual(['id'], self.mock_paging.call_args[0][0]['returnedFields'])
+
+    @mock.patch.object(StorageService, 'get_records')
+    def test_stalled_batch_limits_how_far_ahead_batches_are_fetched(self, mock_get_records):
+        released = threading.Event()
+        started = []
+
+        def get_records(ids, attributes, data_partition_id):
+            started.append(ids[0])
+            if ids[0] == '0':
+                released.wait(5)
+            return {'records': [{'id': i} for i in ids]}
+
+        mock_get_records.side_effect = get_records
+        records = search_and_hydrate(self.client, {'kind': '*:*:*:*'}, batch_size=1, max_workers=3, max_pending=2)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(list, records)
+            sleep(0.3)
+            self.assertEqual(['0', '1'], sorted(started))
+            released.set()
+            self.assertEqual(30, len(future.result()))
+
+    @mock.patch.object(StorageService, 'get_records')
+    def test_unordered_yields_all_records(self, mock_get_records):
+        mock_get_records.side_effect = self._get_records
+
+        records = list(search_and_hydrate(self.client, {'kind': '*:*:*:*'}, batch_size=4, ordered=False))
+
+        self.assertCountEqual([str(n) for n in range(30)], [record['id'] for record in records])
+
+    @mock.patch.object(StorageService, 'get_records')
+    def test_hydration_errors_are_raised(self, mock_get_records):
+        mock_get_records.side_effect = requests.HTTPError('500 Server Error')
+
+        with self.assertRaises(requests.HTTPError):
+            list(search_and_hydrate(self.client, {'kind': '*:*:*:*'}))
+
+
+class TestLocalRecordIndex(TestCase):
+
+    def setUp(self):
+        self.client = SimpleOsduClient('opendes', 'mytoken', api_url='https://your.api.url.com')
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.state_dir.name, 'records.db')
+        self.index = LocalRecordIndex(self.path, indexed_fields=['data.Status'])
+        self.index.upsert([
+            {'id': 'a', 'kind': 'osdu:wks:master-data--Well:1.0.0', 'version': 1, 'data': {'Status': 'Active', 'Basin': 'X'}},
+            {'id': 'b', 'kind': 'osdu:wks:master-data--Well:1.0.0', 'version': 1, 'data': {'Status': 'Closed', 'Basin': 'X'}},
+            {'id': 'c', 'kind': 'osdu:wks:master-data--Wellbore:1.0.0', 'version': 1, 'data': {'Status': 'Active', 'Basin': 'Y'}},
+        ])
+
+    def tearDown(self):
+        self.index.close()
+        self.state_dir.cleanup()
+
+    def test_find_by_kind_and_fields(self):
+        self.assertEqual(['a', 'b'], [r['id'] for r in self.index.find(kind='osdu:wks:master-data--Well:*')])
+        self.assertEqual(['a', 'c'], [r['id'] for r in self.index.find(where={'data.Status': 'Active'})])
+        self.assertEqual(['c'], [r['id'] for r in self.index.find(where={'data.Basin': ['Y', 'Z']})])
+        self.assertEqual('Closed', self.index.get('b')['data']['Status'])
+        self.assertIsNone(self.index.get('missing'))
+
+    def test_aggregate(self):
+        self.assertEqual([{'key': 'X', 'count': 2}, {'key': 'Y', 'count': 1}], self.index.aggregate('data.Basin'))
+        self.assertEqual([{'key': 'Active', 'count': 1}], self.index.aggregate('data.Status', where={'data.Basin': 'Y'}))
+
+    def test_reopening_with_other_indexed_fields_fails(self):
+        with self.assertRaises(ValueError):
+            LocalRecordIndex(self.path, indexed_fields=['data.Basin'])
+
+    @mock.patch.object(SearchService, 'query_with_paging')
+    def test_materialize_search_results(self, mock_paging):
+        mock_paging.return_value = iter([([{'id': 'd', 'kind': 'k', 'data': {'Status': 'Active'}}], 1)])
+
+        written = self.index.materialize(self.client, {'kind': 'k'})
+
+        self.assertEqual(1, written)
+        self.assertEqual(4, len(self.index))
+
+
+class TestMigration(TestCase):
+
+    def setUp(self):
+        self.source = SimpleOsduClient('staging', 'mytoken', api_url='https://staging.api.url.com')
+        self.target = SimpleOsduClient('prod', 'mytoken', api_url='https://prod.api.url.com')
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.records = [{'id': f'staging:master-data--Wellbore:{n}', 'kind': 'k', 'version': n, 'data': {
+            'WellID': f'staging:master-data--Well:{n}:'}} for n in range(5)]
+
+    def tearDown(self):
+        self.state_dir.cleanup()
+
+    def test_rewrite_partition_moves_ids_and_references(self):
+        record = rewrite_partition('staging', 'prod')(dict(self.records[0]))
+
+        self.assertEqual('prod:master-data--Wellbore:0', record['id'])
+        self.assertEqual('prod:master-data--Well:0:', record['data']['WellID'])
+
+    def test_rewrite_partition_moves_references_outside_data(self):
+        record = rewrite_partition('staging', 'prod')({
+            'id': 'staging:work-product-component--WellLog:1', 'data': {},
+            'ancestry': {'parents': ['staging:master-data--Wellbore:0:1600000000000']},
+            'meta': [{'kind': 'Unit', 'unitOfMeasureID': 'staging:reference-data--UnitOfMeasure:m:'}]})
+
+        self.assertEqual(['prod:master-data--Wellbore:0:1600000000000'], record['ancestry']['parents'])
+        self.assertEqual('prod:reference-data--UnitOfMeasure:m:', record['meta'][0]['unitOfMeasureID'])
+
+    @mock.patch('osdu.migration.search_and_hydrate')
+    def test_migration_transforms_writes_and_resumes(self, mock_hydrate):
+        mock_hydrate.side_effect = lambda *args, **kwargs: iter([dict(r) for r in self.records])
+        checkpoint_path = os.path.join(self.state_dir.name, 'migration.db')
+        written = []
+
+        def store_records(records):
+            if any(r['id'].endswith(':4') for r in records):
+                raise requests.HTTPError('400 Client Error')
+            written.extend(records)
+            return {'recordCount': len(records)}
+
+        migration = Migration(self.source, self.target, {'kind': 'k'}, batch_size=2, checkpoint=checkpoint_path,
+                              transforms=[rewrite_partition('staging', 'prod'), rewrite_acl(['v'], ['o'])])
+        with mock.patch.object(self.target.storage, 'store_records', side_effect=store_records):
+            report = migration.run()
+
+        self.assertEqual(5, report.read)
+        self.assertEqual(4, report.written)
+        self.assertEqual(['staging:master-data--Wellbore:4'], list(report.failed))
+        self.assertNotIn('version', written[0])
+        self.assertEqual({'viewers': ['v'], 'owners': ['o']}, written[0]['acl'])
+
+        # Resuming only retries the record that failed.
+        with mock.patch.object(self.target.storage, 'store_records', return_value={}) as mock_store:
+            report = migration.run()
+        self.assertEqual(4, report.skipped)
+        self.assertEqual(1, report.written)
+        mock_store.assert_called_once()
+
+    @mock.patch('osdu.migration.search_and_hydrate')
+    def test_records_rejected_by_the_target_are_failures(self, mock_hydrate):
+        mock_hydrate.side_effect = lambda *args, **kwargs: iter([dict(r) for r in self.records])
+        checkpoint = Checkpoint(os.path.join(self.state_dir.name, 'migration.db'))
+        response = {'recordCount': 4, 'recordIds': [],
+                    'rejectedRecords': [{'index': 2, 'id': 'x', 'kind': 'k',
+                                         'errors': [{'path': 'data.WellID', 'message': 'bad'}]}]}
+
+        with mock.patch.object(self.target.storage, 'store_records', return_value=response):
+            report = Migration(self.source, self.target, {'kind': 'k'}, checkpoint=checkpoint).run()
+
+        self.assertEqual(4, report.written)
+        self.assertEqual({'staging:master-data--Wellbore:2': 'Rejected by schema validation: data.WellID: bad'},
+                         report.failed)
+        self.assertFalse(checkpoint.succeeded('staging:master-data--Wellbore:2'))
+        self.assertTrue(checkpoint.succeeded('staging:master-data--Wellbore:3'))
+        checkpoint.close()
+
+
+class TestHedgingPolicy(TestCase):
+
+    def setUp(self):
+        self.client = SimpleOsduClient('opendes', 'mytoken', api_url='https://your.api.url.com')
+
+    @staticmethod
+    def response(body):
+        response = mock.Mock()
+        response.json.return_value = body
+        return response
+
+    @mock.patch('requests.Session.request')
+    def test_slow_read_is_hedged_and_first_response_wins(self, mock_request):
+        calls = []
+
+        def request(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 1:
+                sleep(0.5)
+                return self.response({'id': 'slow'})
+            return self.response({'id': 'fast'})
+
+        mock_request.side_effect = request
+        self.client.hedging = HedgingPolicy(initial_delay=0.02, budget=1.0)
+
+        record = self.client.storage.get_record('opendes:doc:1')
+
+        self.assertEqual({'id': 'fast'}, record)
+        self.assertEqual({'requests': 1, 'hedges': 1, 'hedge_wins': 1, 'over_budget': 0},
+                         self.client.hedging.stats())
+
+    @mock.patch('requests.Session.request')
+    def test_budget_caps_hedges(self, mock_request):
+        def request(*args, **kwargs):
+            sleep(0.03)
+            return self.response({'results': [], 'totalCount': 0})
+
+        mock_request.side_effect = request
+        self.client.hedging = HedgingPolicy(initial_delay=0.005, budget=0.5)
+
+        for _ in range(4):
+            self.client.search.query({'kind': '*:*:*:*'})
+
+        stats = self.client.hedging.stats()
+        self.assertEqual(4, stats['requests'])
+        self.assertEqual(2, stats['hedges'])
+        self.assertEqual(2, stats['over_budget'])
+
+    @mock.patch('requests.Session.request')
+    def test_writes_are_never_hedged(self, mock_request):
+        mock_request.return_value = self.response({'recordCount': 1})
+        self.client.hedging = mock.Mock()
+
+        self.client.storage.store_records([{'id': 'opendes:doc:1'}])
+
+        self.client.hedging.run.assert_not_called()
+
+    @mock.patch('osdu.hedging.monotonic')
+    def test_delay_uses_percentile_of_observed_latencies(self, mock_monotonic):
+        policy = HedgingPolicy(percentile=80, min_samples=10, initial_delay=0.1)
+        send = mock.Mock()
+        for latency in range(1, 11):
+            mock_monotonic.side_effect = [0, latency / 100]
+            policy.run('storage:get', send)
+
+        self.assertEqual(0.09, policy.delay('storage:get'))
+        self.assertEqual(0.1, policy.delay('search:post'))
+
+
+def _count_results(results):
+    return len(results)
+
+
+class TestPicklableClients(TestCase):
+
+    def test_simple_client_pickles_without_connections_or_services(self):
+        client = SimpleOsduClient('opendes', 'mytoken', api_url='https://your.api.url.com')
+        client.hedging = HedgingPolicy()
+        session = client.session
+        client.search.cache = SearchCache()
+
+        copy = pickle.loads(pickle.dumps(client))
+
+        self.assertEqual('mytoken', copy.access_token)
+        self.assertEqual('opendes', copy.data_partition_id)
+        self.assertIsNot(session, copy.session)
+        self.assertIsNone(copy.search.cache)
+        self.assertIsInstance(copy.hedging, HedgingPolicy)
+
+    def test_client_with_circuit_breaker_listener_pickles(self):
+        client = SimpleOsduClient('opendes', 'mytoken', api_url='https://your.api.url.com')
+        client.circuit_breaker = CircuitBreakerPolicy(open_duration=7)
+        client.circuit_breaker.add_listener(lambda key, old, new: None)
+
+        copy = pickle.loads(pickle.dumps(client))
+
+        self.assertEqual(7, copy.circuit_breaker._open_duration)
+        self.assertEqual([], copy.circuit_breaker._listeners)
+        self.assertEqual(1, len(client.circuit_breaker._listeners))
+
+    def test_forked_child_gets_its_own_session(self):
+        client = SimpleOsduClient('opendes', 'mytoken', api_url='https://your.api.url.com')
+        session = client.session
+        self.assertIs(session, client.session)
+
+        with mock.patch('os.getpid', return_value=os.getpid() + 1):
+            self.assertIsNot(session, client.session)
+
+    @mock.patch('osdu.client.aws_service_principal.ServicePrincipalUtil')
+    def test_service_principal_client_rebuilds_boto_session_on_refresh(self, mock_sp_util):
+        mock_sp_util.return_value.api_url = 'https://your.api.url.com'
+        mock_sp_util.return_value.get_service_principal_token.return_value = ('token', time() + 999)
+        client = AwsServicePrincipalOsduClient('opendes', 'r3mx', profile='myprofile', region='us-east-1')
+
+        copy = pickle.loads(pickle.dumps(client))
+        self.assertEqual('token', copy.access_token)
+        self.assertEqual(client._token_expiration, copy._token_expiration)
+        self.assertIsNone(copy._sp_util)
+
+        copy._update_token()
+        mock_sp_util.assert_called_with('r3mx', profile='myprofile', region='us-east-1')
+
+    @mock.patch.object(SearchService, 'query_with_paging')
+    def test_map_reduce_spreads_pages_across_processes(self, mock_paging):
+        mock_paging.return_value = iter([([{'id': n} for n in range(size)], 6) for size in (1, 2, 3)])
+        client = SimpleOsduClient('opendes', 'mytoken', api_url='https://your.api.url.com')
+
+        total = client.search.map_reduce({'kind': '*:*:*:*'}, _count_results, lambda a, b: a + b, 0, max_workers=2)
+
+        self.assertEqual(6, total)
+
+
+class _InMemoryHttp2Server:
+    """httpcore network backend whose connections are answered by an in-memory h2 server, so that tests drive the
+    real connection pool. The server rejects streams opened out of order, like real servers do.
+    """
+
+    def __init__(self, latency: float = 0):
+        self.latency = latency
+        self.errors = []
+
+    def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        return _InMemoryHttp2Stream(self)
+
+
+class _InMemoryHttp2Stream:
+
+    def __init__(self, server):
+        import h2.config
+        import h2.connection
+
+        self._server = server
+        self._connection = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False))
+        self._connection.initiate_connection()
+        self._outgoing = self._connection.data_to_send()
+        self._condition = threading.Condition()
+
+    def write(self, buffer, timeout=None):
+        import h2.events
+        import h2.exceptions
+
+        with self._condition:
+            try:
+                events = self._connection.receive_data(buffer)
+            except h2.exceptions.ProtocolError as e:
+                self._server.errors.append(e)
+                raise httpcore.WriteError(str(e))
+            for event in events:
+                if isinstance(event, h2.events.RequestReceived):
+                    threading.Timer(self._server.latency, self._respond, (event.stream_id,)).start()
+            self._outgoing += self._connection.data_to_send()
+            self._condition.notify_all()
+
+    def _respond(self, stream_id):
+        with self._condition:
+            self._connection.send_headers(stream_id, [(':status', '200'), ('content-type', 'application/json')])
+            self._connection.send_data(stream_id, json.dumps({'stream': stream_id}).encode(), end_stream=True)
+            self._outgoing += self._connection.data_to_send()
+            self._condition.notify_all()
+
+    def read(self, max_bytes, timeout=None):
+        with self._condition:
+            self._condition.wait_for(lambda: self._outgoing, timeout)
+            data, self._outgoing = self._outgoing[:max_bytes], self._outgoing[max_bytes:]
+            return data
+
+    def start_tls(self, ssl_context, server_hostname=None, timeout=None):
+        return self
+
+    def get_extra_info(self, info):
+        return mock.Mock(selected_alpn_protocol=lambda: 'h2') if info == 'ssl_object' else None
+
+    def close(self):
+        pass
+
+
+@skipUnless(httpx, 'httpx is not installed')
+class TestHttp2Transport(TestCase):
+
+    def setUp(self):
+        self.client = SimpleOsduClient('opendes', 'mytoken', api_url='https://your.api.url.com')
+        self.client.transport = 'http2'
+        self.requests = []
+
+        def handler(request):
+            self.requests.append(request)
+            if request.url.path.endswith('missing'):
+                return httpx.Response(404, json={'message': 'Not found'})
+            return httpx.Response(200, json={'id': 'opendes:doc:1'})
+
+        self.client.session._client = httpx.Client(transport=httpx.MockTransport(handler))
+
+    def tearDown(self):
+        self.client.session.close()
+
+    def test_services_use_http2_session(self):
+        self.assertIsInstance(self.client.session, Http2Session)
+
+        record = self.client.storage.get_record('opendes:doc:1')
+
+        self.assertEqual({'id': 'opendes:doc:1'}, record)
+        self.assertEqual('Bearer mytoken', self.requests[0].headers['Authorization'])
+        self.assertEqual('opendes', self.requests[0].headers['data-partition-id'])
+
+    def test_error_status_raises_requests_http_error(self):
+        with self.assertRaises(requests.HTTPError) as context:
+            self.client.storage.get_record('missing')
+        self.assertEqual(404, context.exception.response.status_code)
+
+    def test_streams_are_opened_one_at_a_time_per_connection(self):
+        from osdu.transport import _StreamOpeningConnection
+
+        class Connection:
+            def __init__(self, connect_time):
+                self.connect_time = connect_time
+                self.sending = 0
+                self.overlapped = False
+
+            def handle_request(self, request):
+                sleep(self.connect_time)
+                self.sending += 1
+                self.overlapped |= self.sending > 1
+                sleep(0.01)
+                self.sending -= 1
+                request.extensions['trace']('http2.send_request_headers.complete', {})
+                sleep(0.1)  # Awaiting the response.
+                return request.url
+
+        connecting, connected = _StreamOpeningConnection(Connection(1)), _StreamOpeningConnection(Connection(0))
+        with ThreadPoolExecutor(max_workers=9) as executor:
+            executor.submit(connecting.handle_request, httpx.Request('GET', 'https://slow/'))
+            sleep(0.05)
+            started = time()
+            futures = [executor.submit(connected.handle_request, httpx.Request('GET', f'https://fast/{n}'))
+                       for n in range(8)]
+            self.assertEqual(8, len([future.result() for future in futures]))
+            self.assertLess(time() - started, 0.5)
+
+        self.assertFalse(connected._connection.overlapped)
+
+    def test_concurrent_requests_share_one_connection_of_the_real_pool(self):
+        from osdu.transport import _StreamOpeningConnection
+
+        session = Http2Session()
+        self.addCleanup(session.close)
+        pool = session._client._transport._pool
+        server = pool._network_backend = _InMemoryHttp2Server(latency=0.05)
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            responses = list(executor.map(lambda n: session.request('get', f'https://osdu.example.com/{n}'),
+                                          range(64)))
+
+        self.assertEqual([], server.errors)
+        self.assertEqual({200}, {response.status_code for response in responses})
+        self.assertEqual(list(range(1, 128, 2)), sorted(response.json()['stream'] for response in responses))
+        self.assertEqual({'HTTP/2'}, {response.http_version for response in responses})
+        self.assertEqual(1, len(pool.connections))
+        self.assertIsInstance(pool.connections[0], _StreamOpeningConnection)
+
+    def test_unknown_transport_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.client.transport = 'http3'
+
+
+class TestCircuitBreaker(TestCase):
+
+    def setUp(self):
+        self.client = SimpleOsduClient('opendes', 'mytoken', api_url='https://your.api.url.com')
+        self.client.circuit_breaker = CircuitBreakerPolicy(min_calls=4, failure_rate=0.5, open_duration=5,
+                                                           probe_calls=2)
+        self.events = []
+        self.client.circuit_breaker.add_listener(lambda *event: self.events.append(event))
+
+    @staticmethod
+    def response(status_code):
+        response = mock.Mock(status_code=status_code)
+        if status_code >= 400:
+            response.raise_for_status.side_effect = requests.HTTPError(f'{status_code} Error', response=response)
+        response.json.return_value = {'id': 'opendes:doc:1'}
+        return response
+
+    @mock.patch('osdu.circuit_breaker.monotonic')
+    @mock.patch('requests.Session.request')
+    def test_circuit_opens_rejects_probes_and_closes(self, mock_request, mock_monotonic):
+        mock_monotonic.return_value = 100
+        mock_request.side_effect = [self.response(200), self.response(503), self.response(200), self.response(503)]
+        for _ in range(4):
+            try:
+                self.client.storage.get_record('opendes:doc:1')
+            except requests.HTTPError:
+                pass
+
+        key = 'storage:GET /records'
+        self.assertEqual('open', self.client.circuit_breaker.state(key))
+        with self.assertRaises(CircuitOpenError):
+            self.client.storage.get_record('opendes:doc:1')
+        self.assertEqual(4, mock_request.call_count)
+        # Other endpoints have their own circuit.
+        self.assertEqual('closed', self.client.circuit_breaker.state('search:POST /query'))
+
+        mock_monotonic.return_value = 106
+        mock_request.side_effect = [self.response(200), self.response(200)]
+        self.client.storage.get_record('opendes:doc:1')
+        self.assertEqual('half_open', self.client.circuit_breaker.state(key))
+        self.client.storage.get_record('opendes:doc:1')
+
+        self.assertEqual('closed', self.client.circuit_breaker.state(key))
+        self.assertEqual([(key, 'closed', 'open'), (key, 'open', 'half_open'), (key, 'half_open', 'closed')],
+                         self.events)
+
+    @mock.patch('requests.Session.request')
+    def test_client_errors_do_not_open_circuit(self, mock_request):
+        mock_request.return_value = self.response(404)
+        for _ in range(10):
+            with self.assertRaises(requests.HTTPError):
+                self.client.storage.get_record('opendes:doc:missing')
+
+        self.assertEqual({'storage:GET /records': 'closed'}, self.client.circuit_breaker.states())
+
+    @mock.patch('osdu.circuit_breaker.monotonic')
+    def test_failed_probe_reopens_circuit(self, mock_monotonic):
+        policy = self.client.circuit_breaker
+        mock_monotonic.return_value = 0
+        for _ in range(4):
+            with self.assertRaises(requests.ConnectionError):
+                policy.call('search:POST /query', mock.Mock(side_effect=requests.ConnectionError()))
+
+        mock_monotonic.return_value = 10
+        with self.assertRaises(requests.Timeout):
+            policy.call('search:POST /query', mock.Mock(side_effect=requests.Timeout()))
+
+        self.assertEqual('open', policy.state('search:POST /query'))
+        with self.assertRaises(CircuitOpenError) as context:
+            policy.call('search:POST /query', mock.Mock())
+        self.assertEqual(5, context.exception.retry_after)
+        self.assertEqual('open', context.exception.state)
+
+    @mock.patch('osdu.circuit_breaker.monotonic')
+    def test_calls_beyond_the_probes_in_flight_are_rejected_as_half_open(self, mock_monotonic):
+        policy = self.client.circuit_breaker
+        mock_monotonic.return_value = 0
+        for _ in range(4):
+            with self.assertRaises(requests.ConnectionError):
+                policy.call('search:POST /query', mock.Mock(side_effect=requests.ConnectionError()))
+        mock_monotonic.return_value = 10
+        rejected = []
+
+        def probe(calls_left):
+            if calls_left:
+                try:
+                    policy.call('search:POST /query', lambda: probe(calls_left - 1))
+                except CircuitOpenError as e:
+                    rejected.append(e)
+
+        policy.call('search:POST /query', lambda: probe(2))
+
+        self.assertEqual(1, len(rejected))
+        self.assertEqual(('half_open', 0), (rejected[0].state, rejected[0].retry_after))
+        self.assertEqual('closed', policy.state('search:POST /query'))
+
+
+class TestLegalService(TestCase):
+
+    def setUp(self):
+        self.client = SimpleOsduClient('opendes', 'mytoken', api_url='https://your.api.url.com')
+        self.properties = {'otherRelevantDataCountries': {'US': 'United States', 'NO': 'Norway'}}
+        self.records = [
+            {'id': 'opendes:doc:1', 'legal': {'legaltags': ['opendes-public'], 'otherRelevantDataCountries': ['US']}},
+            {'id': 'opendes:doc:2', 'legal': {'legaltags': ['opendes-expired'], 'otherRelevantDataCountries': ['US']}},
+            {'id': 'opendes:doc:3', 'legal': {'legaltags': ['opendes-public'], 'otherRelevantDataCountries': ['XX']}},
+        ]
+
+    def validate(self, names):
+        return {name: 'Expired' for name in names if 'expired' in name}
+
+    def test_validate_legal_tags_caches_results(self):
+        with mock.patch.object(LegalService, '_request') as mock_request:
+            mock_request.return_value.json.return_value = {
+                'invalidLegalTags': [{'name': 'opendes-expired', 'reason': 'Expired'}]}
+
+            first = self.client.legal.validate_legal_tags(['opendes-public', 'opendes-expired'])
+            second = self.client.legal.validate_legal_tags(['opendes-expired', 'opendes-public'])
+
+        self.assertEqual({'opendes-expired': 'Expired'}, first)
+        self.assertEqual(first, second)
+        mock_request.assert_called_once_with('post', 'https://your.api.url.com/api/legal/v1/legaltags:validate',
+                                             json={'names': ['opendes-public', 'opendes-expired']})
+
+    def test_check_records_reports_invalid_tags_and_countries(self):
+        with mock.patch.object(LegalService, 'validate_legal_tags', side_effect=self.validate), \
+                mock.patch.object(LegalService, 'get_properties', return_value=self.properties):
+            rejected = self.client.legal.check_records(self.records + [{'id': 'opendes:doc:4'}])
+
+        self.assertEqual([1, 2, 3], [r['index'] for r in rejected])
+        self.assertIn("invalid legal tag 'opendes-expired': Expired", rejected[0]['reason'])
+        self.assertIn("unknown country code 'XX'", rejected[1]['reason'])
+        self.assertIn('no legal tags', rejected[2]['reason'])
+
+    @mock.patch('requests.Session.request')
+    def test_store_records_legal_check(self, mock_request):
+        mock_request.return_value.json.return_value = {'recordCount': 1, 'recordIds': ['opendes:doc:1']}
+        self.client.storage.enable_legal_check('split')
+
+        with mock.patch.object(LegalService, 'validate_legal_tags', side_effect=self.validate), \
+                mock.patch.object(LegalService, 'get_properties', return_value=self.properties):
+            result = self.client.storage.store_records(self.records)
+
+            self.assertEqual(['opendes:doc:2', 'opendes:doc:3'], [r['id'] for r in result['rejectedRecords']])
+            self.assertEqual([self.records[0]], mock_request.call_args[1]['json'])
+
+            self.client.storage.enable_legal_check('reject')
+            with self.assertRaises(LegalCheckError) as context:
+                self.client.storage.store_records(self.records)
+            self.assertEqual(2, len(context.exception.rejected))
+            self.assertEqual(1, mock_request.call_count)
+
+
+@skipUnless(jsonschema, 'jsonschema is not installed')
+class TestSchemaValidation(TestCase):
+
+    def setUp(self):
+        self.client = SimpleOsduClient('opendes', 'mytoken', api_url='https://your.api.url.com')
+        self.schema = {
+            '$schema': 'http://json-schema.org/draft-07/schema#',
+            'type': 'object',
+            'required': ['kind', 'data'],
+            'properties': {'data': {'type': 'object', 'properties': {'Depth': {'type': 'number'}}}},
+        }
+        self.records = [
+            {'id': 'opendes:doc:1', 'kind': 'osdu:wks:doc:1.0.0', 'data': {'Depth': 12.5}},
+            {'id': 'opendes:doc:2', 'kind': 'osdu:wks:doc:1.0.0', 'data': {'Depth': 'deep'}},
+            {'id': 'opendes:other:1', 'kind': 'osdu:wks:other:1.0.0', 'data': {}},
+        ]
+
+    def get_schema(self, method, url):
+        response = mock.Mock()
+        if url.endswith('osdu:wks:doc:1.0.0'):
+            response.json.return_value = self.schema
+            return response
+        response.status_code = 404
+        raise requests.HTTPError('404 Client Error', response=response)
+
+    def test_validate_records_reports_precise_errors(self):
+        with mock.patch.object(SchemaService, '_request', side_effect=self.get_schema) as mock_request:
+            rejected = self.client.schema.validate_records(self.records)
+            self.client.schema.validate_records(self.records)
+
+        self.assertEqual(1, len(rejected))
+        self.assertEqual(1, rejected[0]['index'])
+        self.assertEqual('data.Depth', rejected[0]['errors'][0]['path'])
+        self.assertIn("'deep' is not of type 'number'", rejected[0]['errors'][0]['message'])
+        # One request per kind. The kind without a schema is not validated.
+        self.assertEqual(2, mock_request.call_count)
+
+    def test_references_to_other_kinds_are_resolved(self):
+        self.schema['properties']['acl'] = {'$ref': 'osdu:wks:AbstractAccessControlList:1.0.0'}
+        acl_schema = {'$schema': 'http://json-schema.org/draft-07/schema#', 'type': 'object',
+                      'required': ['viewers', 'owners'], 'properties': {'viewers': {'type': 'array'}}}
+
+        def get_schema(method, url):
+            if url.endswith('osdu:wks:AbstractAccessControlList:1.0.0'):
+                response = mock.Mock()
+                response.json.return_value = acl_schema
+                return response
+            return self.get_schema(method, url)
+
+        records = [dict(self.records[0], acl={'viewers': ['v'], 'owners': ['o']}),
+                   dict(self.records[0], acl={'viewers': 'v'}),
+                   {'id': 'opendes:doc:3', 'data': {}}]
+        with mock.patch.object(SchemaService, '_request', side_effect=get_schema) as mock_request:
+            rejected = self.client.schema.validate_records(records)
+
+        self.assertEqual([1, 2], [r['index'] for r in rejected])
+        self.assertEqual({'acl', 'acl.viewers'}, {e['path'] for e in rejected[0]['errors']})
+        self.assertEqual([{'path': 'kind', 'message': 'record has no kind'}], rejected[1]['errors'])
+        self.assertFalse(any(call[0][1].endswith('/None') for call in mock_request.call_args_list))
+
+    def test_schemas_are_cached_on_disk(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            self.client.schema.cache_dir = cache_dir
+            with mock.patch.object(SchemaService, '_request', side_effect=self.get_schema):
+                self.client.schema.get_schema('osdu:wks:doc:1.0.0')
+
+            other = SchemaService(self.client, cache_dir=cache_dir)
+            with mock.patch.object(SchemaService, '_request') as mock_request:
+                self.assertEqual(self.schema, other.get_schema('osdu:wks:doc:1.0.0'))
+            mock_request.assert_not_called()
+
+    @mock.patch('requests.Session.request')
+    def test_store_records_only_sends_valid_records(self, mock_request):
+        mock_request.return_value.json.return_value = {'recordCount': 2}
+
+        with mock.patch.object(SchemaService, '_request', side_effect=self.get_schema):
+            self.client.storage.enable_schema_validation('split')
+            result = self.client.storage.store_records(self.records)
+            self.assertEqual([self.records[0], self.records[2]], mock_request.call_args[1]['json'])
+            self.assertEqual(['opendes:doc:2'], [r['id'] for r in result['rejectedRecords']])
+
+            self.client.storage.enable_schema_validation('reject')
+            with self.assertRaises(SchemaValidationError):
+                self.client.storage.store_records(self.records)
+            self.assertEqual(1, mock_request.call_count)
+
+
+class TestQueryMany(TestCase):
+
+    def setUp(self):
+        self.client = SimpleOsduClient('opendes', 'mytoken', api_url='https://your.api.url.com')
+
+    def test_results_in_input_order_with_errors_and_dedupe(self):
+        def query(body, data_partition_id=None):
+            if body['kind'] == 'bad':
+                raise requests.HTTPError('400 Client Error')
+            return {'results': [], 'totalCount': len(body['kind'])}
+
+        queries = {'a': {'kind': 'k1'}, 'b': {'kind': 'bad'}, 'c': {'kind': 'kind2'}, 'd': {'kind': 'k1'}}
+        with mock.patch.object(SearchService, 'query', side_effect=query) as mock_query:
+            results = self.client.search.query_many(queries, max_workers=2)
+
+        self.assertEqual(['a', 'b', 'c', 'd'], list(results))
+        self.assertEqual(2, results['a'].response['totalCount'])
+        self.assertIsInstance(results['b'].error, requests.HTTPError)
+        self.assertIsNone(results['b'].response)
+        self.assertEqual(5, results['c'].response['totalCount'])
+        self.assertEqual(results['a'].response, results['d'].response)
+        self.assertIsNot(results['a'].response, results['d'].response)
+        self.assertEqual(3, mock_query.call_count)
+
+    def test_merge_count_queries_differing_by_one_filter_value(self):
+        kind = 'osdu:wks:master-data--Well:1.0.0'
+        basins = ['North', 'South West', 'East']
+        queries = [{'kind': kind, 'query': f'data.Status:Active AND data.Basin:"{basin}"', 'limit': 0}
+                   for basin in basins]
+        queries.append({'kind': kind, 'query': 'data.Status:Active', 'limit': 10})
+        aggregation = {'results': [], 'totalCount': 7,
+                       'aggregations': [{'key': 'North', 'count': 4}, {'key': 'South West', 'count': 3}]}
+
+        with mock.patch.object(SearchService, 'query', return_value=aggregation) as mock_query:
+            results = self.client.search.query_many(queries, merge_fields=['data.Basin'])
+
+        self.assertEqual([4, 3, 0], [result.response['totalCount'] for result in results[:3]])
+        self.assertEqual(2, mock_query.call_count)
+        mock_query.assert_any_call(
+            {'kind': kind, 'limit': 0, 'query': 'data.Status:Active', 'aggregateBy': 'data.Basin'},
+            data_partition_id=None)
+
+    def test_clauses_on_other_fields_are_not_merged(self):
+        queries = [{'kind': 'k', 'query': f'data.Basin:"{basin}"', 'limit': 0} for basin in ('North', 'South')]
+
+        with mock.patch.object(SearchService, 'query', return_value={'results': [], 'totalCount': 9}) as mock_query:
+            results = self.client.search.query_many(queries, merge_fields=['data.BasinID'])
+
+        self.assertEqual([9, 9], [result.response['totalCount'] for result in results])
+        self.assertEqual(2, mock_query.call_count)
+        self.assertFalse(any('aggregateBy' in call[0][0] for call in mock_query.call_args_list))
+
+
+class TestRecordArchive(TestCase):
+
+    def setUp(self):
+        self.client = SimpleOsduClient('opendes', 'mytoken', api_url='https://your.api.url.com')
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.state_dir.name, 'records.archive')
+        self.records = [{'id': f'opendes:master-data--Well:{n}', 'kind': 'well' if n % 3 else 'wellbore',
+                         'version': 1, 'data': {'Name': f'Well {n}'}} for n in range(10)]
+
+    def tearDown(self):
+        self.state_dir.cleanup()
+
+    def test_random_reads_and_scans_across_segments(self):
+        with RecordArchive(self.path, segment_size=200) as archive:
+            self.assertEqual(5, archive.append(self.records[:5]))
+            archive.append(self.records[5:])
+            archive.append([dict(self.records[1], data={'Name': 'Renamed'})])
+
+        with RecordArchive(self.path) as archive:
+            self.assertGreater(len(os.listdir(self.path)), 2)
+            self.assertEqual(10, len(archive))
+            self.assertEqual('Well 7', archive.get('opendes:master-data--Well:7')['data']['Name'])
+            self.assertEqual('Renamed', archive.get('opendes:master-data--Well:1')['data']['Name'])
+            self.assertIsNone(archive.get('missing'))
+            self.assertEqual({'well': 6, 'wellbore': 4}, archive.kinds())
+            self.assertEqual(10, len(list(archive.scan())))
+            wellbores = [r['id'] for r in archive.scan(kind='wellbore')]
+            self.assertEqual([f'opendes:master-data--Well:{n}' for n in (0, 3, 6, 9)], wellbores)
+            self.assertEqual(['Renamed'], [r['data']['Name'] for r in archive.scan(kind='well')
+                                           if r['id'].endswith(':1')])
+
+    def test_appends_after_a_torn_write_are_scanned(self):
+        write_archive(self.path, [{'id': 'x:1', 'kind': 'k', 'data': {}}])
+        segment = os.path.join(self.path, 'segment-000000.zrec')
+        with open(segment, 'ab') as f:
+            # Header of a 1000 byte frame, cut short by a crash before the batch was indexed.
+            f.write(b'\x00\x00\x03\xe8abc')
+
+        write_archive(self.path, [{'id': 'x:2', 'kind': 'k', 'data': {}}])
+
+        self.assertEqual(['x:1', 'x:2'], [r['id'] for r in read_archive(self.path)])
+        self.assertEqual(['x:1', 'x:2'], [r['id'] for r in read_archive(self.path, kind='k')])
+
+    def test_utils_helpers_read_and_write(self):
+        self.assertEqual(10, write_archive(self.path, (Record.from_dict(r) for r in self.records)))
+        self.assertEqual(self.records[1:4], list(read_archive(self.path))[1:4])
+        self.assertEqual(4, len(list(read_archive(self.path, kind='wellbore'))))
+
+    def test_reload_streams_batches_into_store_records(self):
+        write_archive(self.path, self.records)
+        batches = []
+
+        def store_records(records):
+            batches.append(records)
+            return {'recordCount': len(records)}
+
+        with RecordArchive(self.path) as archive, \
+                mock.patch.object(StorageService, 'store_records', side_effect=store_records):
+            self.assertEqual(10, archive.reload(self.client, batch_size=4))
+
+        self.assertEqual([4, 4, 2], [len(batch) for batch in batches])
+        self.assertNotIn('version', batches[0][0])